@@ -0,0 +1,24 @@
+"""Add content hash to downloaded files
+
+Revision ID: 02
+Revises: 01
+Create Date: 2026-10-18 10:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '02'
+down_revision = '01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('downloadedfile', sa.Column('hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('downloadedfile', 'hash')
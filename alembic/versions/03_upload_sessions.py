@@ -0,0 +1,38 @@
+"""Add resumable upload sessions
+
+Revision ID: 03
+Revises: 02
+Create Date: 2026-10-18 11:02:19.530871
+
+"""
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '03'
+down_revision = '02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('uploadsession',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('path', sa.String(length=100), nullable=False),
+    sa.Column('filename', sa.String(length=100), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('chunk_size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sqlalchemy_utils.types.uuid.UUIDType(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_uploadsession_user_id_user'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_uploadsession_updated_at'), 'uploadsession', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_uploadsession_updated_at'), table_name='uploadsession')
+    op.drop_table('uploadsession')
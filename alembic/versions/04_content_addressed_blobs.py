@@ -0,0 +1,36 @@
+"""Add content-addressed blob storage
+
+Revision ID: 04
+Revises: 03
+Create Date: 2026-10-18 12:20:07.644310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '04'
+down_revision = '03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blob',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('downloadedfile', sa.Column('blob_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_downloadedfile_blob_hash'), 'downloadedfile', ['blob_hash'], unique=False)
+    op.create_foreign_key('fk_downloadedfile_blob_hash_blob', 'downloadedfile', 'blob', ['blob_hash'], ['hash'])
+
+
+def downgrade():
+    op.drop_constraint('fk_downloadedfile_blob_hash_blob', 'downloadedfile', type_='foreignkey')
+    op.drop_index(op.f('ix_downloadedfile_blob_hash'), table_name='downloadedfile')
+    op.drop_column('downloadedfile', 'blob_hash')
+    op.drop_table('blob')
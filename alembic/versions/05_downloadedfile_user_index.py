@@ -0,0 +1,26 @@
+"""Add keyset listing index on downloaded files
+
+Revision ID: 05
+Revises: 04
+Create Date: 2026-10-18 13:05:52.271940
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '05'
+down_revision = '04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        'UPDATE downloadedfile SET created_at = now() WHERE created_at IS NULL'
+    )
+    op.create_index('ix_downloadedfile_user_id_created_at_id', 'downloadedfile', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_downloadedfile_user_id_created_at_id', table_name='downloadedfile')
@@ -0,0 +1,40 @@
+"""Add file extension and search indexes
+
+Revision ID: 06
+Revises: 05
+Create Date: 2026-10-18 13:48:30.905116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '06'
+down_revision = '05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('downloadedfile', sa.Column('extension', sa.String(length=16), nullable=True))
+    op.execute(
+        "UPDATE downloadedfile "
+        "SET extension = left(lower(substring(name from '\\.([^./]+)$')), 16)"
+    )
+    op.create_index('ix_downloadedfile_user_id_extension', 'downloadedfile', ['user_id', 'extension'], unique=False)
+    op.create_index('ix_downloadedfile_user_id_path', 'downloadedfile', ['user_id', 'path'], unique=False, postgresql_ops={'path': 'text_pattern_ops'})
+    # Без расширения pg_trgm поиск по имени работает, но полным просмотром.
+    trgm_available = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )).scalar()
+    if trgm_available:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_downloadedfile_name_trgm', 'downloadedfile', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_downloadedfile_name_trgm')
+    op.drop_index('ix_downloadedfile_user_id_path', table_name='downloadedfile')
+    op.drop_index('ix_downloadedfile_user_id_extension', table_name='downloadedfile')
+    op.drop_column('downloadedfile', 'extension')
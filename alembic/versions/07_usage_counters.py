@@ -0,0 +1,61 @@
+"""Add per-folder usage counters
+
+Revision ID: 07
+Revises: 06
+Create Date: 2026-10-18 14:32:10.418552
+
+"""
+from pathlib import Path
+
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '07'
+down_revision = '06'
+branch_labels = None
+depends_on = None
+
+# Снимок на момент ревизии: миграция не должна меняться вместе с кодом
+# приложения.
+STORAGE_ROOT = str(Path(__file__).parent.parent.parent / 'files')
+
+BACKFILL_QUERY = sa.text('''
+    INSERT INTO usagecounter (user_id, folder, used, files)
+    SELECT user_id,
+           '/' || array_to_string(parts[1:depth], '/') AS folder,
+           coalesce(sum(size), 0),
+           count(*)
+    FROM (
+        SELECT user_id, size,
+               string_to_array(trim(both '/' from CASE
+                   WHEN left(path, :root_length + 1) = :storage_root || '/'
+                   THEN substr(path, :root_length + 2)
+                   ELSE path
+               END), '/') AS parts
+        FROM downloadedfile
+    ) AS files,
+    generate_series(0, coalesce(array_length(parts, 1), 1) - 1) AS depth
+    GROUP BY user_id, folder
+''')
+
+
+def upgrade():
+    op.create_table('usagecounter',
+    sa.Column('user_id', sqlalchemy_utils.types.uuid.UUIDType(), nullable=False),
+    sa.Column('folder', sa.String(length=1024), nullable=False),
+    sa.Column('used', sa.BigInteger(), nullable=False),
+    sa.Column('files', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_usagecounter_user_id_user'),
+    sa.PrimaryKeyConstraint('user_id', 'folder')
+    )
+    op.get_bind().execute(BACKFILL_QUERY, {
+        'root_length': len(STORAGE_ROOT),
+        'storage_root': STORAGE_ROOT,
+    })
+
+
+def downgrade():
+    op.drop_table('usagecounter')
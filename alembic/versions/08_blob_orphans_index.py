@@ -0,0 +1,24 @@
+"""Add partial index on unreferenced blobs
+
+Revision ID: 08
+Revises: 07
+Create Date: 2026-10-18 15:10:44.602318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '08'
+down_revision = '07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_blob_orphans', 'blob', ['hash'], unique=False, postgresql_where=sa.text('ref_count <= 0'))
+
+
+def downgrade():
+    op.drop_index('ix_blob_orphans', table_name='blob')
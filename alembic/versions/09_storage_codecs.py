@@ -0,0 +1,28 @@
+"""Add storage codec columns
+
+Revision ID: 09
+Revises: 08
+Create Date: 2026-10-18 16:02:11.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '09'
+down_revision = '08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('blob', sa.Column('codec', sa.String(length=16), nullable=True))
+    op.add_column('blob', sa.Column('stored_size', sa.BigInteger(), nullable=True))
+    op.add_column('downloadedfile', sa.Column('codec', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    op.drop_column('downloadedfile', 'codec')
+    op.drop_column('blob', 'stored_size')
+    op.drop_column('blob', 'codec')
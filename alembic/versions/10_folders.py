@@ -0,0 +1,104 @@
+"""Add folders with materialized paths
+
+Revision ID: 10
+Revises: 09
+Create Date: 2026-10-18 17:21:40.530918
+
+"""
+from pathlib import Path
+
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '10'
+down_revision = '09'
+branch_labels = None
+depends_on = None
+
+# Снимок на момент ревизии: миграция не должна меняться вместе с кодом
+# приложения.
+STORAGE_ROOT = str(Path(__file__).parent.parent.parent / 'files')
+
+# Папки строятся по счётчикам: у них уже есть строка на каждую папку
+# цепочки каждого файла.
+BACKFILL_QUERIES = (
+    sa.text('''
+        INSERT INTO folder (id, user_id, name, path, created_at)
+        SELECT CAST(md5(CAST(user_id AS text) || ':' || folder) AS uuid),
+               user_id, regexp_replace(folder, '^.*/', ''), folder, now()
+        FROM usagecounter
+        ON CONFLICT DO NOTHING
+    '''),
+    sa.text('''
+        UPDATE folder AS child SET parent_id = parent.id
+        FROM folder AS parent
+        WHERE child.path <> '/'
+          AND parent.user_id = child.user_id
+          AND parent.path = coalesce(
+              nullif(regexp_replace(child.path, '/[^/]*$', ''), ''), '/'
+          )
+    '''),
+    sa.text('''
+        UPDATE downloadedfile SET folder_id = folder.id
+        FROM (
+            SELECT id AS file_id, user_id AS owner_id,
+                   '/' || array_to_string(
+                       parts[1:array_length(parts, 1) - 1], '/'
+                   ) AS folder_path
+            FROM (
+                SELECT id, user_id,
+                       string_to_array(trim(both '/' from CASE
+                           WHEN left(path, :root_length + 1)
+                                = :storage_root || '/'
+                           THEN substr(path, :root_length + 2)
+                           ELSE path
+                       END), '/') AS parts
+                FROM downloadedfile
+            ) AS split
+        ) AS files
+        JOIN folder ON folder.user_id = files.owner_id
+                   AND folder.path = files.folder_path
+        WHERE downloadedfile.id = files.file_id
+    '''),
+)
+
+
+def upgrade():
+    op.create_table('folder',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('path', sa.String(length=1024), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('parent_id', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('user_id', sqlalchemy_utils.types.uuid.UUIDType(), nullable=False),
+    sa.ForeignKeyConstraint(['parent_id'], ['folder.id'], name='fk_folder_parent_id_folder', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_folder_user_id_user'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_folder_parent_id'), 'folder', ['parent_id'], unique=False)
+    op.create_index('ix_folder_user_id_path', 'folder', ['user_id', 'path'], unique=True, postgresql_ops={'path': 'text_pattern_ops'})
+    op.alter_column('downloadedfile', 'path', type_=sa.String(length=1024), existing_type=sa.String(length=100))
+    op.alter_column('uploadsession', 'path', type_=sa.String(length=1024), existing_type=sa.String(length=100), existing_nullable=False)
+    op.add_column('downloadedfile', sa.Column('folder_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_index(op.f('ix_downloadedfile_folder_id'), 'downloadedfile', ['folder_id'], unique=False)
+    op.create_foreign_key('fk_downloadedfile_folder_id_folder', 'downloadedfile', 'folder', ['folder_id'], ['id'], ondelete='SET NULL')
+    for query in BACKFILL_QUERIES:
+        op.get_bind().execute(query, {
+            'root_length': len(STORAGE_ROOT),
+            'storage_root': STORAGE_ROOT,
+        })
+
+
+def downgrade():
+    op.drop_constraint('fk_downloadedfile_folder_id_folder', 'downloadedfile', type_='foreignkey')
+    op.drop_index(op.f('ix_downloadedfile_folder_id'), table_name='downloadedfile')
+    op.drop_column('downloadedfile', 'folder_id')
+    op.alter_column('uploadsession', 'path', type_=sa.String(length=100), existing_type=sa.String(length=1024), existing_nullable=False)
+    op.alter_column('downloadedfile', 'path', type_=sa.String(length=100), existing_type=sa.String(length=1024))
+    op.drop_index('ix_folder_user_id_path', table_name='folder')
+    op.drop_index(op.f('ix_folder_parent_id'), table_name='folder')
+    op.drop_table('folder')
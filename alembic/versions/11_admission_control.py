@@ -0,0 +1,46 @@
+"""Add shared admission control state
+
+Revision ID: 11
+Revises: 10
+Create Date: 2026-10-18 21:40:37.512094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '11'
+down_revision = '10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'admissionbucket',
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('tokens', sa.Float(), nullable=False),
+        sa.Column('allowed', sa.Boolean(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+        prefixes=['UNLOGGED'],
+    )
+    op.create_table(
+        'admissionlease',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        prefixes=['UNLOGGED'],
+    )
+    op.create_index(
+        op.f('ix_admissionlease_key'), 'admissionlease', ['key'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_admissionlease_key'), table_name='admissionlease')
+    op.drop_table('admissionlease')
+    op.drop_table('admissionbucket')
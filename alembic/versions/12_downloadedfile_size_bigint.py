@@ -0,0 +1,34 @@
+"""Widen downloadedfile.size to bigint
+
+Revision ID: 12
+Revises: 11
+Create Date: 2026-10-18 22:05:48.230917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12'
+down_revision = '11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        'downloadedfile', 'size',
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        existing_nullable=True,
+    )
+
+
+def downgrade():
+    op.alter_column(
+        'downloadedfile', 'size',
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        existing_nullable=True,
+    )
@@ -1,2 +1,5 @@
+from .diagnostics import router as diagnostics_router  # noqa
 from .downloaded_file import router as downloaded_file_router  # noqa
+from .folder import router as folder_router  # noqa
+from .upload_session import router as upload_session_router  # noqa
 from .user import router as user_router  # noqa
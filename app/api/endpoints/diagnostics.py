@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import UUID4
+
+from app.api.validators import check_profile_exists
+from app.core.config import settings
+from app.core.diagnostics import profile_loop
+from app.core.user import current_superuser
+from app.models import User
+
+router = APIRouter()
+
+
+@router.post(
+    '/profile',
+    response_class=PlainTextResponse,
+    description='Только для суперюзеров. Профилировать цикл событий'
+                ' несколько секунд. Ответ — стеки в формате collapsed,'
+                ' из которых flamegraph.pl строит flame graph.',
+)
+async def profile_event_loop(
+        seconds: float = Query(5, gt=0, le=settings.profiler_max_seconds),
+        user: User = Depends(current_superuser),
+):
+    return await profile_loop(seconds)
+
+
+@router.get(
+    '/profiles/{profile_id}',
+    response_class=PlainTextResponse,
+    description='Только для суперюзеров. Получить профиль запроса,'
+                ' отправленного с заголовком X-Profile: его id приходит'
+                ' в заголовке ответа X-Profile-Id.',
+)
+async def get_request_profile(
+        profile_id: UUID4,
+        user: User = Depends(current_superuser),
+):
+    return check_profile_exists(profile_id)
@@ -1,43 +1,200 @@
 import os
-from typing import Optional
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
 
 from fastapi import (
-    APIRouter, UploadFile, File, Depends, Body, Query,
+    APIRouter, UploadFile, File, Depends, Body, Query, Request, HTTPException
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import UUID4
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import UploadFile as StarletteUploadFile
 
 from app.api.validators import (
-    check_unique_file_name, path_validation,
-    check_exists, check_the_opportunity_to_delete,
-    parameters_were_not_provided, check_exist_file, object_is_not_exist
+    check_unique_file_name, check_quota, path_validation, cursor_validation,
+    folder_path_validation, regex_validation, check_folder_not_empty,
+    check_exists, check_job_exists, check_the_opportunity_to_delete,
+    check_all_files_found, signed_token_validation, check_batch_size,
+    check_unique_file_names, batch_is_invalid, check_folder_exists,
+    parameters_were_not_provided, check_exist_file, object_is_not_exist,
+    folder_validation, check_folder_path_exists, check_folder_destination,
+    check_folder_path_free, check_no_legacy_files, check_my_file_by_path,
+    check_file_is_blob, check_user_authorized, regex_is_invalid
 )
+from app.core.archive import ArchiveMember, Compression, archive_response
+from app.core.batch_upload import (
+    BatchEntry, InvalidBatch, discard_entries, entry_path, is_tar_request,
+    split_member_name, store_tar_stream, store_uploaded_files
+)
+from app.core.bulk_delete import start_cleanup_job
+from app.core.config import settings
 from app.core.db import get_async_session
-from app.core.user import current_user
+from app.core.rebalance import start_rebalance_job
+from app.core.responses import file_response, is_content_cached
+from app.core.signing import sign_file
+from app.core.storage import run_in_storage
+from app.core.user import (
+    current_superuser, current_user, current_user_optional
+)
 from app.core.utils import (
-    stop_folder_name,
-    delete_file_and_empty_folders, ResponseModel, create_path,
-    create_file_at_system_address
+    ResponseModel, create_path, create_file_at_system_address,
+    delete_legacy_files, get_system_address, encode_cursor, iter_ndjson,
+    is_folder_path, get_copy_name, STORAGE_ROOT, COPY_MARKER
 )
-from app.crud.downloaded_file import downloaded_file_crud
+from app.crud.downloaded_file import InvalidRegex, downloaded_file_crud
+from app.crud.usage_counter import usage_counter_crud
 from app.models import User
-from app.schemas.downloaded_file import DownloadedFileDB
+from app.schemas.downloaded_file import (
+    BatchUploadResponse, DownloadedFileDB, SearchRequest, SearchResponse,
+    SignedUrlRequest, SignedUrlResponse, TransferRequest, TransferResponse
+)
+from app.schemas.job import JobDB
 
 router = APIRouter()
 
 
+async def iter_folder_members(
+        path_prefix: str,
+        session: AsyncSession,
+        user_id: UUID4,
+) -> AsyncIterator[ArchiveMember]:
+    async for row in downloaded_file_crud.stream_by_path_prefix(
+            path_prefix, session, user_id):
+        yield ArchiveMember(
+            name=row.path[len(path_prefix):],
+            location=get_system_address(row),
+            size=row.size,
+            modified=row.created_at,
+            codec=row.codec,
+        )
+
+
+async def iter_single_member(
+        file_location,
+        db_file,
+) -> AsyncIterator[ArchiveMember]:
+    if db_file is not None:
+        yield ArchiveMember(
+            db_file.name, file_location, db_file.size, db_file.created_at,
+            db_file.codec,
+        )
+        return
+    stat = await run_in_storage(os.stat, file_location)
+    yield ArchiveMember(
+        os.path.basename(file_location), file_location, stat.st_size, None
+    )
+
+
+async def store_form_files(
+        request: Request,
+        session: AsyncSession,
+) -> List[BatchEntry]:
+    # Имена файлов формы известны заранее, поэтому проверяются до записи.
+    form = await request.form()
+    try:
+        files = [
+            file for file in form.getlist('files')
+            if isinstance(file, StarletteUploadFile)
+        ]
+        check_batch_size(len(files))
+        await check_unique_file_names(
+            [split_member_name(file.filename or '')[1] for file in files],
+            session,
+        )
+        return await store_uploaded_files(files)
+    finally:
+        await form.close()
+
+
+async def store_tar_files(
+        request: Request,
+        session: AsyncSession,
+) -> List[BatchEntry]:
+    # Состав архива становится известен только после его чтения.
+    entries = await store_tar_stream(request.stream())
+    try:
+        check_batch_size(len(entries))
+        await check_unique_file_names(
+            [entry.filename for entry in entries], session
+        )
+    except HTTPException:
+        await discard_entries(entries)
+        raise
+    return entries
+
+
 @router.get(
     '/',
     response_model=ResponseModel,
-    description='Получить информацию о всей файлах, авторизованного пользователя, загруженных на сервер.',
+    description='Получить информацию о всей файлах, авторизованного пользователя, загруженных на сервер.'
+                ' Файлы отдаются страницами: следующую страницу можно получить,'
+                ' передав next_cursor в параметр cursor. С параметром stream=true'
+                ' все файлы отдаются потоком в формате NDJSON.',
 )
 async def get_my_files(
+        limit: int = Query(
+            settings.files_page_size, ge=1, le=settings.files_max_page_size
+        ),
+        cursor: Optional[str] = Query(None),
+        stream: bool = Query(False),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    after = cursor_validation(cursor) if cursor else None
+    if stream:
+        return StreamingResponse(
+            iter_ndjson(
+                downloaded_file_crud.stream_my(user.id, session, after)
+            ),
+            media_type='application/x-ndjson',
+        )
+    files = await downloaded_file_crud.get_my_page(
+        user_id=user.id, limit=limit + 1, session=session, after=after
+    )
+    next_cursor = None
+    if len(files) > limit:
+        files = files[:limit]
+        next_cursor = encode_cursor(files[-1].created_at, files[-1].id)
+    return {'account_id': f'{user.id}', 'files': files,
+            'next_cursor': next_cursor}
+
+
+@router.post(
+    '/search',
+    response_model=SearchResponse,
+    description='Найти файлы авторизованного пользователя по папке, расширению'
+                ' и вхождению текста или регулярного выражения в имя файла.',
+)
+async def search_files(
+        search_in: SearchRequest,
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session),
 ):
-    files = await downloaded_file_crud.get_my(user_id=user.id, session=session)
-    return {'account_id': f'{user.id}', 'files': files}
+    options = search_in.options
+    if search_in.query and options.regex:
+        regex_validation(search_in.query)
+    path_prefix = (
+        folder_path_validation(options.path) if options.path else None
+    )
+    if options.folder_id:
+        folder = await check_folder_exists(options.folder_id, session, user)
+        path_prefix = folder_path_validation(folder.path)
+    try:
+        matches = await downloaded_file_crud.search(
+            user_id=user.id,
+            session=session,
+            query=search_in.query,
+            regex=options.regex,
+            extension=options.extension,
+            path_prefix=path_prefix,
+            order_by=options.order_by,
+            limit=options.limit,
+        )
+    except InvalidRegex as error:
+        regex_is_invalid(error)
+    return {'matches': matches}
 
 
 @router.post(
@@ -46,6 +203,7 @@ async def get_my_files(
     description='Загрузить файл на сервер, доступно только авторизованному пользователю.',
 )
 async def upload_file(
+        request: Request,
         path: str = Body('/', example='/homework/test-folder/notes.txt'),
         file: UploadFile = File(...),
         user: User = Depends(current_user),
@@ -55,44 +213,264 @@ async def upload_file(
     file_location = create_path(path, filename)
 
     await check_unique_file_name(filename, session)
+    await check_quota(
+        user.id, int(request.headers.get('content-length', 0)), session
+    )
 
-    create_file_at_system_address(
-        file_location=file_location, filename=filename, file=file)
-
-    file_size = os.path.getsize(file_location)
+    stored_file = await create_file_at_system_address(file=file)
 
     db_file = await downloaded_file_crud.upload_file(
-        file_name=filename, path=str(file_location), size=file_size, user=user,
-        session=session
+        file_name=filename, path=str(file_location),
+        stored_file=stored_file, user=user, session=session,
+        quota=settings.user_quota,
     )
     return db_file
 
 
+@router.post(
+    '/upload/batch',
+    response_model=BatchUploadResponse,
+    description='Загрузить пакет файлов в папку path одним запросом.'
+                ' Файлы передаются либо полями files в multipart/form-data,'
+                ' либо tar-архивом (в том числе tar.gz) в теле запроса'
+                ' с Content-Type: application/x-tar. Вложенные папки архива'
+                ' сохраняются.',
+)
+async def upload_files_batch(
+        request: Request,
+        path: str = Query('/', example='/homework/test-folder/'),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    await check_quota(
+        user.id, int(request.headers.get('content-length', 0)), session
+    )
+    try:
+        if is_tar_request(request.headers.get('content-type', '')):
+            entries = await store_tar_files(request, session)
+        else:
+            entries = await store_form_files(request, session)
+    except InvalidBatch as error:
+        batch_is_invalid(error)
+    db_files = await downloaded_file_crud.upload_files(
+        [
+            (entry.filename,
+             str(create_path(entry_path(path, entry.folder), entry.filename)),
+             entry.stored_file)
+            for entry in entries
+        ],
+        user=user, session=session, quota=settings.user_quota,
+    )
+    return {'files': db_files}
+
+
 @router.get(
     '/download',
     description='Загрузить файл на локальный компьютер.'
-                ' Используйте либо полный путь файла, либо его id.',
+                ' Используйте либо полный путь файла, либо его id.'
+                ' Поддерживаются заголовки Range, If-Range, If-None-Match'
+                ' и If-Modified-Since. Если в path указана папка или передан'
+                ' folder_id, все её файлы отдаются потоком в архиве формата'
+                ' compression (по умолчанию zip). Папки может скачать'
+                ' только авторизованный владелец.',
 )
 async def download_file(
+        request: Request,
         path: Optional[str] = Query(None),
         file_id: Optional[UUID4] = Query(None),
+        folder_id: Optional[UUID4] = Query(None),
+        compression: Optional[Compression] = Query(None),
+        user: Optional[User] = Depends(current_user_optional),
         session: AsyncSession = Depends(get_async_session)
 ):
+    if folder_id:
+        user = check_user_authorized(user)
+        folder = await check_folder_exists(folder_id, session, user)
+        path_prefix = folder_path_validation(folder.path)
+        await check_folder_not_empty(path_prefix, session, user.id)
+        return archive_response(
+            iter_folder_members(path_prefix, session, user.id),
+            folder.name or 'files',
+            compression or Compression.zip,
+        )
+    if path and is_folder_path(path.lstrip('/')):
+        user = check_user_authorized(user)
+        path_prefix = folder_path_validation(path)
+        await check_folder_not_empty(path_prefix, session, user.id)
+        return archive_response(
+            iter_folder_members(path_prefix, session, user.id),
+            os.path.basename(path_prefix.rstrip('/')) or 'files',
+            compression or Compression.zip,
+        )
     if path:
         path = path.lstrip('/')
         file_location = path_validation(path)
-    elif file_id:
-        file_location = await downloaded_file_crud.get_file_location_by_id(
-            file_id, session
+        db_file = await downloaded_file_crud.get_by_path(
+            str(file_location), session
         )
-        if not file_location:
+    elif file_id:
+        db_file = await downloaded_file_crud.get(file_id, session)
+        if not db_file:
             object_is_not_exist()
     else:
         parameters_were_not_provided()
 
-    check_exist_file(file_location)
-    return FileResponse(file_location,
-                        filename=os.path.basename(file_location))
+    if db_file is not None:
+        file_location = get_system_address(db_file)
+    if not is_content_cached(db_file):
+        check_exist_file(file_location)
+    if compression is not None:
+        return archive_response(
+            iter_single_member(file_location, db_file),
+            os.path.splitext(os.path.basename(file_location))[0],
+            compression,
+        )
+    return await file_response(request, file_location, db_file)
+
+
+@router.post(
+    '/signed',
+    response_model=SignedUrlResponse,
+    description='Получить подписанные ссылки на скачивание своих файлов.'
+                ' Ссылка действует expires_in секунд и не требует авторизации.',
+)
+async def create_signed_urls(
+        request: Request,
+        signed_in: SignedUrlRequest,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    files = await downloaded_file_crud.get_my_by_ids(
+        user.id, signed_in.file_ids, session
+    )
+    check_all_files_found(files, signed_in.file_ids)
+    expires = int(time.time()) + signed_in.expires_in
+    return {'urls': [
+        {
+            'id': db_file.id,
+            'url': request.url_for(
+                'download_signed_file',
+                token=sign_file(db_file, get_system_address(db_file), expires),
+            ),
+            'expires_at': datetime.fromtimestamp(expires),
+        }
+        for db_file in files
+    ]}
+
+
+@router.get(
+    '/signed/{token}',
+    description='Скачать файл по подписанной ссылке.'
+                ' Поддерживаются те же заголовки, что и в /download.',
+)
+async def download_signed_file(
+        request: Request,
+        token: str,
+):
+    signed_file = signed_token_validation(token)
+    if not is_content_cached(signed_file):
+        check_exist_file(signed_file.location)
+    response = await file_response(
+        request, signed_file.location, signed_file
+    )
+    response.headers['cache-control'] = (
+        f'public, max-age={max(signed_file.expires - int(time.time()), 0)}'
+    )
+    return response
+
+
+async def transfer_folder(
+        transfer: TransferRequest,
+        user: User,
+        session: AsyncSession,
+        copy: bool,
+) -> TransferResponse:
+    folder = await check_folder_path_exists(
+        user.id, folder_validation(transfer.source), session
+    )
+    path = folder_validation(transfer.destination)
+    check_folder_destination(folder, path)
+    await check_folder_path_free(user.id, path, session)
+    await check_no_legacy_files(folder, session)
+    if copy:
+        files = await downloaded_file_crud.copy_folder(
+            folder, path, uuid.uuid4().hex[:8], session,
+            quota=settings.user_quota,
+        )
+        return TransferResponse(path=path, files=files)
+    counter = await usage_counter_crud.get_counter(
+        user.id, folder.path, session
+    )
+    await downloaded_file_crud.move_folder(folder, path, session)
+    return TransferResponse(path=path, files=counter.files if counter else 0)
+
+
+async def transfer_file(
+        transfer: TransferRequest,
+        user: User,
+        session: AsyncSession,
+        copy: bool,
+) -> TransferResponse:
+    db_file = await check_my_file_by_path(transfer.source, user, session)
+    check_file_is_blob(db_file)
+    destination = transfer.destination.lstrip('/')
+    if is_folder_path(destination):
+        folder = folder_validation(destination)
+        name = (
+            get_copy_name(db_file.name, uuid.uuid4().hex[:8]) if copy
+            else db_file.name
+        )
+        location = os.path.join(STORAGE_ROOT + folder.rstrip('/'), name)
+    else:
+        location = str(path_validation(destination))
+        name = os.path.basename(location)
+        if name != db_file.name or copy:
+            await check_unique_file_name(name, session)
+    if copy:
+        db_file = await downloaded_file_crud.copy_file(
+            db_file, location, name, session, quota=settings.user_quota,
+        )
+    else:
+        db_file = await downloaded_file_crud.move_file(
+            db_file, location, name, session,
+        )
+    return TransferResponse(path=db_file.path, files=1)
+
+
+@router.post(
+    '/move',
+    response_model=TransferResponse,
+    description='Перенести или переименовать свой файл или папку.'
+                ' Меняются только записи в базе, файлы на диске'
+                ' не перемещаются. Если назначение — папка, файл'
+                ' переносится в неё под прежним именем.',
+)
+async def move_files(
+        transfer: TransferRequest,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    if is_folder_path(transfer.source.lstrip('/')):
+        return await transfer_folder(transfer, user, session, copy=False)
+    return await transfer_file(transfer, user, session, copy=False)
+
+
+@router.post(
+    '/copy',
+    response_model=TransferResponse,
+    description='Скопировать свой файл или папку. Копии ссылаются на те же'
+                ' блобы, содержимое не дублируется. Имена файлов уникальны,'
+                ' поэтому копии без явного имени получают суффикс'
+                f' {COPY_MARKER}<метка>.',
+)
+async def copy_files(
+        transfer: TransferRequest,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    if is_folder_path(transfer.source.lstrip('/')):
+        return await transfer_folder(transfer, user, session, copy=True)
+    return await transfer_file(transfer, user, session, copy=True)
 
 
 @router.delete(
@@ -108,7 +486,7 @@ async def remove_file(
     file_obj = await check_exists(file_id, session)
     await check_the_opportunity_to_delete(file_obj, user)
     file_obj = await downloaded_file_crud.remove(file_obj, session)
-    delete_file_and_empty_folders(file_obj.path, stop_folder_name)
+    await delete_legacy_files([file_obj])
     name = file_obj.name
     return {'status': f'File {name} was delete!'}
 
@@ -116,17 +494,39 @@ async def remove_file(
 @router.delete(
     '/',
     description='Удалить все файлы авторизованного пользователя.'
+                ' Записи удаляются сразу, а файлы с диска — фоновой задачей,'
+                ' статус которой можно получить по job_id.'
 )
 async def remove_all_my_files(
         user: User = Depends(current_user),
         session: AsyncSession = Depends(get_async_session),
 ):
-    my_files = await downloaded_file_crud.get_my(
-        user_id=user.id, session=session
-    )
-    if not my_files:
+    deleted = await downloaded_file_crud.remove_by_user(user.id, session)
+    if not deleted:
         return {'status': 'You do not have any files to delete!'}
-    for file_obj in my_files:
-        file_obj = await downloaded_file_crud.remove(file_obj, session)
-        delete_file_and_empty_folders(file_obj.path, stop_folder_name)
-    return {'status': 'All files were deleted!'}
+    job = start_cleanup_job(deleted, user.id)
+    return {'status': 'All files were deleted!', 'job_id': str(job.id)}
+
+
+@router.get(
+    '/jobs/{job_id}',
+    response_model=JobDB,
+    description='Получить статус фоновой задачи.',
+)
+async def get_job_status(
+        job_id: UUID4,
+        user: User = Depends(current_user),
+):
+    return check_job_exists(job_id, user)
+
+
+@router.post(
+    '/storage/rebalance',
+    description='Только для суперюзеров. Перенести блобы на тома,'
+                ' назначенные им текущим списком storage_volumes.',
+)
+async def rebalance_storage(
+        user: User = Depends(current_superuser),
+):
+    job = start_rebalance_job(user.id)
+    return {'job_id': str(job.id)}
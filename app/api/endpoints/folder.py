@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, Query
+from pydantic import UUID4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.validators import (
+    check_folder_destination, check_folder_exists, check_folder_path_exists,
+    check_folder_path_free, check_no_legacy_files, folder_validation
+)
+from app.core.db import get_async_session
+from app.core.user import current_user
+from app.crud.downloaded_file import downloaded_file_crud
+from app.crud.usage_counter import usage_counter_crud
+from app.models import Folder, User
+from app.schemas.folder import FolderDB, FolderUpdate
+
+router = APIRouter()
+
+
+async def folder_with_usage(folder: Folder, session: AsyncSession) -> dict:
+    counter = await usage_counter_crud.get_counter(
+        folder.user_id, folder.path, session
+    )
+    return {
+        **FolderDB.from_orm(folder).dict(),
+        'used': counter.used if counter else 0,
+        'files': counter.files if counter else 0,
+    }
+
+
+@router.get(
+    '/',
+    response_model=FolderDB,
+    description='Найти свою папку по пути. В ответе объём и число файлов'
+                ' во всей папке вместе с вложенными.',
+)
+async def get_folder_by_path(
+        path: str = Query('/', example='/homework/'),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    folder = await check_folder_path_exists(
+        user.id, folder_validation(path), session
+    )
+    return await folder_with_usage(folder, session)
+
+
+@router.get(
+    '/{folder_id}',
+    response_model=FolderDB,
+    description='Получить свою папку по id.',
+)
+async def get_folder(
+        folder_id: UUID4,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    folder = await check_folder_exists(folder_id, session, user)
+    return await folder_with_usage(folder, session)
+
+
+@router.patch(
+    '/{folder_id}',
+    response_model=FolderDB,
+    description='Переименовать или перенести папку, указав её новый путь.'
+                ' Недостающие родительские папки создаются, файлы на диске'
+                ' не перемещаются.',
+)
+async def move_folder(
+        folder_id: UUID4,
+        folder_in: FolderUpdate,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    folder = await check_folder_exists(folder_id, session, user)
+    path = folder_validation(folder_in.path)
+    check_folder_destination(folder, path)
+    await check_folder_path_free(user.id, path, session)
+    await check_no_legacy_files(folder, session)
+    folder = await downloaded_file_crud.move_folder(folder, path, session)
+    return await folder_with_usage(folder, session)
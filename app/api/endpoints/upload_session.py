@@ -0,0 +1,197 @@
+from http import HTTPStatus
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import UUID4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.validators import (
+    check_all_chunks_received, check_assembled_size, check_chunk_index,
+    check_chunk_length, check_chunk_size, check_quota,
+    check_unique_file_name, check_upload_session_exists,
+)
+from app.core.config import settings
+from app.core.db import get_async_session
+from app.core.storage import discard_temp, write_blob
+from app.core.upload_sessions import (
+    chunks_total, expected_chunk_size, iter_assembled, place_chunk,
+    received_chunks, remove_session_dir, write_chunk,
+)
+from app.core.user import current_user
+from app.core.utils import create_path
+from app.crud.downloaded_file import downloaded_file_crud
+from app.crud.upload_session import upload_session_crud
+from app.models import UploadSession, User
+from app.schemas.downloaded_file import DownloadedFileDB
+from app.schemas.upload_session import (
+    UploadedChunk, UploadSessionCreate, UploadSessionDB,
+)
+
+router = APIRouter()
+
+
+async def session_status(upload_session: UploadSession) -> dict:
+    received = await received_chunks(upload_session.id)
+    received_bytes = sum(
+        expected_chunk_size(index, upload_session.size,
+                            upload_session.chunk_size)
+        for index in received
+    )
+    return {
+        'id': upload_session.id,
+        'path': upload_session.path,
+        'filename': upload_session.filename,
+        'size': upload_session.size,
+        'chunk_size': upload_session.chunk_size,
+        'chunks_total': chunks_total(upload_session.size,
+                                     upload_session.chunk_size),
+        'received': received,
+        'received_bytes': received_bytes,
+        'created_at': upload_session.created_at,
+        'updated_at': upload_session.updated_at,
+    }
+
+
+async def limited_stream(
+        request: Request,
+        limit: int,
+) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail=f'Часть файла длиннее {limit} байт!'
+            )
+        if chunk:
+            yield chunk
+
+
+@router.post(
+    '/',
+    response_model=UploadSessionDB,
+    description='Создать сессию возобновляемой загрузки файла.'
+                ' Файл передаётся частями, которые можно отправлять'
+                ' в любом порядке и параллельно.',
+)
+async def create_upload_session(
+        upload_in: UploadSessionCreate,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    chunk_size = upload_in.chunk_size or settings.upload_default_chunk_size
+    check_chunk_size(chunk_size)
+    await check_unique_file_name(upload_in.filename, session)
+    await check_quota(user.id, upload_in.size, session)
+    upload_session = await upload_session_crud.create(
+        path=upload_in.path, filename=upload_in.filename,
+        size=upload_in.size, chunk_size=chunk_size, user=user,
+        session=session,
+    )
+    return await session_status(upload_session)
+
+
+@router.get(
+    '/{session_id}',
+    response_model=UploadSessionDB,
+    description='Получить список уже принятых частей файла.',
+)
+async def get_upload_session(
+        session_id: UUID4,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    upload_session = await check_upload_session_exists(
+        session_id, user, session
+    )
+    return await session_status(upload_session)
+
+
+@router.put(
+    '/{session_id}/chunks/{index}',
+    response_model=UploadedChunk,
+    description='Загрузить часть файла с заданным номером.'
+                ' Тело запроса — байты этой части.',
+)
+async def upload_chunk(
+        session_id: UUID4,
+        index: int,
+        request: Request,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    upload_session = await check_upload_session_exists(
+        session_id, user, session
+    )
+    check_chunk_index(
+        index, chunks_total(upload_session.size, upload_session.chunk_size)
+    )
+    expected = expected_chunk_size(
+        index, upload_session.size, upload_session.chunk_size
+    )
+    stored_chunk = await write_chunk(
+        limited_stream(request, expected), upload_session.id, index
+    )
+    try:
+        check_chunk_length(stored_chunk.size, expected)
+    except HTTPException:
+        await discard_temp(stored_chunk.location)
+        raise
+    await place_chunk(stored_chunk, upload_session.id, index)
+    await upload_session_crud.touch(upload_session, session)
+    return {'index': index, 'size': stored_chunk.size}
+
+
+@router.post(
+    '/{session_id}/complete',
+    response_model=DownloadedFileDB,
+    description='Собрать файл из принятых частей и сохранить его.',
+)
+async def complete_upload_session(
+        session_id: UUID4,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    upload_session = await check_upload_session_exists(
+        session_id, user, session
+    )
+    total = chunks_total(upload_session.size, upload_session.chunk_size)
+    check_all_chunks_received(await received_chunks(upload_session.id), total)
+    filename = upload_session.filename
+    await check_unique_file_name(filename, session)
+
+    stored_file = await write_blob(
+        iter_assembled(upload_session.id, total), filename
+    )
+    try:
+        check_assembled_size(stored_file.size, upload_session.size)
+    except HTTPException:
+        await discard_temp(stored_file.location)
+        raise
+    await session.delete(upload_session)
+    db_file = await downloaded_file_crud.upload_file(
+        file_name=filename,
+        path=str(create_path(upload_session.path, filename)),
+        stored_file=stored_file, user=user, session=session,
+        quota=settings.user_quota,
+    )
+    await remove_session_dir(session_id)
+    return db_file
+
+
+@router.delete(
+    '/{session_id}',
+    description='Отменить сессию загрузки и удалить принятые части.',
+)
+async def abort_upload_session(
+        session_id: UUID4,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    upload_session = await check_upload_session_exists(
+        session_id, user, session
+    )
+    await upload_session_crud.remove(upload_session, session)
+    await remove_session_dir(session_id)
+    return {'status': f'Upload session {session_id} was deleted!'}
@@ -1,14 +1,23 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import UUID4
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.db import get_async_session
-from app.core.user import auth_backend, fastapi_users, current_superuser
-from app.core.utils import stop_folder_name, delete_file_and_empty_folders
+from app.core.user import (
+    auth_backend, fastapi_users, current_superuser, current_user,
+    publish_user_invalidation, user_cache
+)
+from app.core.bulk_delete import start_cleanup_job
+from app.core.cache import caches
+from app.core.utils import ROOT_FOLDER
 from app.crud.downloaded_file import downloaded_file_crud
+from app.crud.usage_counter import usage_counter_crud
 from app.models import User
-from app.schemas.user import UserCreate, UserRead, UserUpdate
+from app.schemas.user import UserCreate, UserRead, UserStatus, UserUpdate
 
 router = APIRouter()
 
@@ -63,10 +72,73 @@ async def delete_user_by_id(
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
 
-    my_files = await downloaded_file_crud.get_my(user_id, session)
-    if my_files:
-        for file_obj in my_files:
-            delete_file_and_empty_folders(file_obj.path, stop_folder_name)
+    deleted = await downloaded_file_crud.remove_by_user(user_id, session)
+    await publish_user_invalidation(session, user_id)
     await session.delete(user)
     await session.commit()
-    return {'status': f'User {user_id} and all their files were deleted!'}
+    user_cache.invalidate(str(user_id))
+    response = {'status': f'User {user_id} and all their files were deleted!'}
+    if deleted:
+        response['job_id'] = str(start_cleanup_job(deleted, user_id).id)
+    return response
+
+
+@router.get(
+    '/user/status',
+    response_model=UserStatus,
+    tags=['user'],
+    description='Получить информацию об использовании дискового пространства:'
+                ' квоту, занятый объём и число файлов всего и по папкам.',
+)
+async def get_user_status(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+):
+    counters = await usage_counter_crud.get_user_counters(user.id, session)
+    used = sum(
+        counter.used for counter in counters if counter.folder == ROOT_FOLDER
+    )
+    # Папки делят одну квоту: каждая может вырасти на свободный остаток.
+    available = max(settings.user_quota - used, 0)
+    folders = {
+        counter.folder: {
+            'allocated': counter.used + available,
+            'used': counter.used,
+            'files': counter.files,
+        }
+        for counter in counters
+    }
+    return {
+        'account_id': f'{user.id}',
+        'info': folders.get(
+            ROOT_FOLDER,
+            {'allocated': settings.user_quota, 'used': 0, 'files': 0},
+        ),
+        'folders': folders,
+    }
+
+
+@router.post(
+    '/user/status/rebuild',
+    tags=['user'],
+    dependencies=[Depends(current_superuser)],
+    description='Пересчитать счётчики занятого места по таблице файлов.'
+                ' Доступно только суперюзеру.',
+)
+async def rebuild_usage_counters(
+        user_id: Optional[UUID4] = None,
+        session: AsyncSession = Depends(get_async_session),
+):
+    await usage_counter_crud.rebuild(session, user_id)
+    return {'status': 'Usage counters were rebuilt!'}
+
+
+@router.get(
+    '/user/cache/stats',
+    tags=['user'],
+    dependencies=[Depends(current_superuser)],
+    description='Получить статистику попаданий в кэши процесса.'
+                ' Доступно только суперюзеру.',
+)
+async def get_cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
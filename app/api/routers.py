@@ -1,6 +1,9 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import downloaded_file_router, user_router
+from app.api.endpoints import (
+    diagnostics_router, downloaded_file_router, folder_router,
+    upload_session_router, user_router
+)
 
 main_router = APIRouter()
 main_router.include_router(
@@ -8,4 +11,19 @@ main_router.include_router(
     prefix='/files',
     tags=['Files']
 )
+main_router.include_router(
+    folder_router,
+    prefix='/files/folders',
+    tags=['Folders']
+)
+main_router.include_router(
+    upload_session_router,
+    prefix='/files/uploads',
+    tags=['Uploads']
+)
+main_router.include_router(
+    diagnostics_router,
+    prefix='/diagnostics',
+    tags=['Diagnostics']
+)
 main_router.include_router(user_router)
@@ -1,14 +1,24 @@
 import os
+import re
+from collections import Counter
 from http import HTTPStatus
 from pathlib import Path
+from typing import List, Optional
 
 from fastapi import HTTPException
 from pydantic import UUID4
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.utils import BASE_DIR
+from app.core.config import settings
+from app.core.diagnostics import get_profile
+from app.core.jobs import Job, get_job
+from app.core.signing import verify_file_token
+from app.core.utils import BASE_DIR, ROOT_FOLDER, STORAGE_ROOT, decode_cursor
 from app.crud.downloaded_file import downloaded_file_crud
-from app.models import DownloadedFile, User
+from app.crud.folder import folder_crud
+from app.crud.upload_session import upload_session_crud
+from app.crud.usage_counter import usage_counter_crud
+from app.models import DownloadedFile, Folder, UploadSession, User
 
 
 def path_validation(
@@ -28,7 +38,7 @@ def path_validation(
             status_code=HTTPStatus.BAD_REQUEST,
             detail='Вы не указали имя файла!',
         )
-    path = '/' + str(path)
+    path = '/' + str(path).lstrip('/')
     path = Path(path)
     return path
 
@@ -69,6 +79,221 @@ async def check_unique_file_name(
         )
 
 
+async def check_quota(
+        user_id: UUID4,
+        size: int,
+        session: AsyncSession,
+) -> None:
+    used = await usage_counter_crud.get_used(user_id, session)
+    reserved = await upload_session_crud.get_reserved(user_id, session)
+    if used + reserved + size > settings.user_quota:
+        raise HTTPException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            detail='Превышена квота на объём файлов пользователя!'
+        )
+
+
+async def check_unique_file_names(
+        filenames: List[str],
+        session: AsyncSession,
+) -> None:
+    duplicates = {
+        filename for filename, count in Counter(filenames).items()
+        if count > 1
+    }
+    duplicates.update(
+        await downloaded_file_crud.get_existing_names(filenames, session)
+    )
+    if duplicates:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Объекты с такими именами уже существуют: '
+                   + ', '.join(sorted(duplicates)[:10]),
+        )
+
+
+def check_batch_size(count: int) -> None:
+    if not count:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='В пакете нет файлов!'
+        )
+    if count > settings.batch_upload_max_files:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f'В пакете больше {settings.batch_upload_max_files} файлов!'
+        )
+
+
+def batch_is_invalid(error: Exception):
+    raise HTTPException(
+        status_code=HTTPStatus.BAD_REQUEST,
+        detail=str(error),
+    )
+
+
+def cursor_validation(cursor: str):
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Некорректный курсор!'
+        )
+
+
+def regex_is_invalid(error: Exception):
+    raise HTTPException(
+        status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+        detail=f'Некорректное регулярное выражение: {error}'
+    )
+
+
+def regex_validation(query: str) -> None:
+    try:
+        re.compile(query)
+    except re.error as error:
+        regex_is_invalid(error)
+
+
+def folder_path_validation(path: str) -> str:
+    root = str(BASE_DIR / 'files')
+    folder = path.strip('/')
+    if folder == root.strip('/') or folder.startswith(root.lstrip('/') + '/'):
+        folder = folder[len(root.lstrip('/')):].strip('/')
+    if '..' in folder.split('/'):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Некорректный путь к папке!'
+        )
+    return f'{root}/{folder}/' if folder else f'{root}/'
+
+
+def folder_validation(path: str) -> str:
+    """Привести путь к папке к виду '/a/b', в котором он хранится."""
+    folder = folder_path_validation(path)[len(STORAGE_ROOT):].rstrip('/')
+    if len(folder) > 1000 or any(
+            len(name) > 255 for name in folder.split('/')):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Слишком длинный путь к папке!'
+        )
+    return folder or ROOT_FOLDER
+
+
+async def check_folder_exists(
+        folder_id: UUID4,
+        session: AsyncSession,
+        user: User,
+) -> Folder:
+    folder = await folder_crud.get(folder_id, session)
+    if folder is None or folder.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Папка не существует!'
+        )
+    return folder
+
+
+async def check_folder_path_exists(
+        user_id: UUID4,
+        path: str,
+        session: AsyncSession,
+) -> Folder:
+    folder = await folder_crud.get_by_path(user_id, path, session)
+    if folder is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Папка не существует!'
+        )
+    return folder
+
+
+def check_folder_destination(folder: Folder, path: str) -> None:
+    if folder.path == ROOT_FOLDER:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Корневую папку нельзя перенести или скопировать!'
+        )
+    if path == folder.path or path.startswith(folder.path + '/'):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Папку нельзя перенести или скопировать внутрь неё самой!'
+        )
+
+
+async def check_my_file_by_path(
+        path: str,
+        user: User,
+        session: AsyncSession,
+) -> DownloadedFile:
+    location = path_validation(path.lstrip('/'))
+    db_file = await downloaded_file_crud.get_by_path(str(location), session)
+    if db_file is None or db_file.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Объект не существует!'
+        )
+    return db_file
+
+
+def check_file_is_blob(db_file: DownloadedFile) -> None:
+    if db_file.blob_hash is None:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail='Файл сохранён до перехода на блобы:'
+                   ' его расположение на диске зависит от пути.'
+        )
+
+
+async def check_folder_path_free(
+        user_id: UUID4,
+        path: str,
+        session: AsyncSession,
+) -> None:
+    if await folder_crud.get_by_path(user_id, path, session) is not None:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Папка с таким путём уже существует!'
+        )
+
+
+async def check_no_legacy_files(
+        folder: Folder,
+        session: AsyncSession,
+) -> None:
+    if await downloaded_file_crud.has_path_prefix(
+            f'{STORAGE_ROOT}{folder.path}/', session,
+            user_id=folder.user_id, legacy_only=True):
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail='В папке есть файлы, сохранённые до перехода на блобы:'
+                   ' их расположение на диске зависит от пути.'
+        )
+
+
+async def check_folder_not_empty(
+        path_prefix: str,
+        session: AsyncSession,
+        user_id: UUID4,
+) -> None:
+    if not await downloaded_file_crud.has_path_prefix(
+            path_prefix, session, user_id):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Папка не существует или в ней нет файлов!'
+        )
+
+
+def check_user_authorized(user: Optional[User]) -> User:
+    if user is None:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail='Скачать папку может только её владелец!'
+        )
+    return user
+
+
 def parameters_were_not_provided():
     raise HTTPException(
         status_code=HTTPStatus.BAD_REQUEST,
@@ -89,3 +314,101 @@ def object_is_not_exist():
         status_code=HTTPStatus.BAD_REQUEST,
         detail='Файла с таким id не существует'
     )
+
+
+async def check_upload_session_exists(
+        session_id: UUID4,
+        user: User,
+        session: AsyncSession,
+) -> UploadSession:
+    upload_session = await upload_session_crud.get(session_id, session)
+    if upload_session is None or upload_session.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Сессия загрузки не существует!'
+        )
+    return upload_session
+
+
+def check_chunk_size(chunk_size: int) -> None:
+    if chunk_size > settings.upload_max_chunk_size:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Размер части превышает '
+                   f'{settings.upload_max_chunk_size} байт!'
+        )
+
+
+def check_chunk_index(index: int, total: int) -> None:
+    if not 0 <= index < total:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f'Номер части должен быть от 0 до {total - 1}!'
+        )
+
+
+def check_chunk_length(size: int, expected: int) -> None:
+    if size != expected:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f'Ожидалось {expected} байт, получено {size}!'
+        )
+
+
+def check_assembled_size(size: int, expected: int) -> None:
+    if size != expected:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail=f'Размер собранного файла {size} байт'
+                   f' вместо заявленных {expected}!'
+        )
+
+
+def check_all_chunks_received(received, total: int) -> None:
+    missing = sorted(set(range(total)) - set(received))
+    if missing:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail=f'Получены не все части файла, отсутствуют: {missing}'
+        )
+
+
+def check_all_files_found(files, file_ids) -> None:
+    if len(files) != len(set(file_ids)):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Объект не существует!'
+        )
+
+
+def signed_token_validation(token: str):
+    signed_file = verify_file_token(token)
+    if signed_file is None:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail='Ссылка недействительна или её срок истёк!'
+        )
+    return signed_file
+
+
+def check_job_exists(
+        job_id: UUID4,
+        user: User,
+) -> Job:
+    job = get_job(job_id)
+    if job is None or (job.user_id != user.id and not user.is_superuser):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Задача не найдена!'
+        )
+    return job
+
+
+def check_profile_exists(profile_id: UUID4) -> str:
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail='Профиль не найден!'
+        )
+    return profile
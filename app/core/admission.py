@@ -0,0 +1,322 @@
+import asyncio
+import math
+import time
+import uuid
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import BigInteger, func, literal, select, text
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import Counter, registry
+from app.core.user import token_user_id
+
+LIMITED_PREFIX: str = '/files'
+UPLOAD_PREFIX: str = '/files/upload'
+UPLOAD_METHODS = frozenset(('POST', 'PUT'))
+SLOT_RETRY_AFTER: int = 1
+METER_BYTES: int = 1024 * 1024
+
+REJECTIONS = registry.register(Counter(
+    'admission_rejections_total',
+    'Запросы, отклонённые ограничителем с ответом 429.',
+    ('reason',),
+))
+THROTTLED = registry.register(Counter(
+    'admission_upload_throttled_seconds_total',
+    'Время, на которое чтение тел загрузок придержано лимитом'
+    ' upload_bytes_per_second.',
+))
+
+# Ведро может уйти в минус: крупная загрузка пропускается целиком,
+# а следующие ждут, пока долг не погасится.
+TAKE_QUERY = text('''
+    INSERT INTO admissionbucket AS bucket (key, tokens, allowed, updated_at)
+    VALUES (:key, CAST(:burst AS float8) - :cost, true, now())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = CASE WHEN {refilled} >= :need
+                      THEN {refilled} - :cost
+                      ELSE {refilled} END,
+        allowed = {refilled} >= :need,
+        updated_at = now()
+    RETURNING bucket.tokens, bucket.allowed
+'''.format(refilled='''least(
+        CAST(:burst AS float8),
+        bucket.tokens + CAST(:rate AS float8) * CAST(
+            extract(epoch FROM now() - bucket.updated_at) AS float8
+        )
+    )'''))
+ACQUIRE_QUERIES = (
+    text('''
+        DELETE FROM admissionlease
+        WHERE key = :key AND expires_at <= clock_timestamp()
+    '''),
+    text('''
+        INSERT INTO admissionlease (id, key, expires_at)
+        SELECT :id, :key, clock_timestamp() + make_interval(secs => :ttl)
+        WHERE (
+            SELECT count(*) FROM admissionlease WHERE key = :key
+        ) < :limit
+    '''),
+)
+RELEASE_QUERY = text('DELETE FROM admissionlease WHERE id = :id')
+
+
+class MemoryBackend:
+    """Состояние ограничителя в памяти процесса: лимиты действуют
+    на каждый процесс по отдельности."""
+
+    def __init__(self) -> None:
+        # Вытесненное ведро считается полным: это лишь смягчает лимит.
+        self.buckets = LRUCache(
+            'admission', settings.admission_max_keys, register=False
+        )
+        self.slots: Dict[str, int] = {}
+
+    async def take(
+            self,
+            key: str,
+            rate: float,
+            burst: float,
+            cost: float,
+    ) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= min(cost, burst)
+        if allowed:
+            tokens -= cost
+        self.buckets.set(key, (tokens, now))
+        return allowed, tokens
+
+    async def acquire(self, key: str, limit: int) -> Optional[str]:
+        if self.slots.get(key, 0) >= limit:
+            return None
+        self.slots[key] = self.slots.get(key, 0) + 1
+        return key
+
+    async def release(self, key: str, lease: str) -> None:
+        self.slots[key] -= 1
+        if not self.slots[key]:
+            del self.slots[key]
+
+
+class PostgresBackend:
+    """Состояние ограничителя в базе: лимиты общие для всех процессов.
+
+    Каждая проверка стоит одного короткого запроса к основной базе.
+    Места загрузок выдаются в аренду на upload_lease_ttl секунд, чтобы
+    упавший процесс не занял их навсегда.
+    """
+
+    async def take(
+            self,
+            key: str,
+            rate: float,
+            burst: float,
+            cost: float,
+    ) -> Tuple[bool, float]:
+        async with engine.begin() as connection:
+            bucket = await connection.execute(TAKE_QUERY, {
+                'key': key, 'rate': rate, 'burst': burst, 'cost': cost,
+                'need': min(cost, burst),
+            })
+            tokens, allowed = bucket.one()
+        return allowed, tokens
+
+    async def acquire(self, key: str, limit: int) -> Optional[str]:
+        lease = uuid.uuid4()
+        async with engine.begin() as connection:
+            await connection.execute(select(func.pg_advisory_xact_lock(
+                literal(_lock_key(key), BigInteger)
+            )))
+            await connection.execute(ACQUIRE_QUERIES[0], {'key': key})
+            acquired = await connection.execute(ACQUIRE_QUERIES[1], {
+                'id': lease, 'key': key, 'limit': limit,
+                'ttl': settings.upload_lease_ttl,
+            })
+        return str(lease) if acquired.rowcount else None
+
+    async def release(self, key: str, lease: str) -> None:
+        async with engine.begin() as connection:
+            await connection.execute(RELEASE_QUERY, {'id': uuid.UUID(lease)})
+
+
+def _lock_key(key: str) -> int:
+    return int.from_bytes(
+        uuid.uuid5(uuid.NAMESPACE_URL, key).bytes[:8], 'big', signed=True
+    )
+
+
+def _create_backend():
+    if settings.admission_backend == 'postgres':
+        return PostgresBackend()
+    return MemoryBackend()
+
+
+backend = _create_backend()
+
+
+def _client_key(scope: Scope) -> str:
+    """Ключ лимитов: id пользователя, а для анонимных запросов —
+    адрес клиента. За nginx это адрес из X-Forwarded-For: его
+    подставляет в scope uvicorn, запущенный с --proxy-headers."""
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                user_id = token_user_id(token)
+                if user_id is not None:
+                    return f'user:{user_id}'
+            break
+    client = scope.get('client')
+    return f'ip:{client[0] if client else "-"}'
+
+
+def _content_length(scope: Scope) -> Optional[int]:
+    for name, value in scope['headers']:
+        if name == b'content-length':
+            try:
+                return max(int(value), 0)
+            except ValueError:
+                return None
+    return None
+
+
+def too_many_requests(reason: str, retry_after: float) -> JSONResponse:
+    REJECTIONS.inc((reason,))
+    return JSONResponse(
+        {'detail': 'Слишком много запросов, повторите позже!'},
+        status_code=HTTPStatus.TOO_MANY_REQUESTS,
+        headers={'retry-after': str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """Ограничивает запросы к /files по пользователю: число запросов
+    в секунду, объём загрузок в секунду и число одновременных загрузок.
+
+    Проверка идёт до чтения тела, поэтому превысивший лимит клиент
+    сразу получает 429 с Retry-After, не отправляя файл целиком.
+    Принятая загрузка оплачивает каждый прочитанный байт, в том числе
+    без Content-Length, и при исчерпании лимита тело читается медленнее.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope['type'] != 'http'
+                or not scope['path'].startswith(LIMITED_PREFIX)):
+            await self.app(scope, receive, send)
+            return
+        key = _client_key(scope)
+        rejection = await self._check_requests(key)
+        if rejection is None and self._is_upload(scope):
+            rejection = await self._check_bytes(scope, key)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        if not self._is_upload(scope):
+            await self.app(scope, receive, send)
+            return
+        if settings.upload_bytes_per_second is not None:
+            receive = self._metered(
+                receive, f'{key}:bytes', self._prepaid(scope)
+            )
+        limit = settings.max_concurrent_uploads
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        lease = await backend.acquire(f'{key}:uploads', limit)
+        if lease is None:
+            await too_many_requests('uploads', SLOT_RETRY_AFTER)(
+                scope, receive, send
+            )
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await backend.release(f'{key}:uploads', lease)
+
+    @staticmethod
+    def _is_upload(scope: Scope) -> bool:
+        return (
+            scope['method'] in UPLOAD_METHODS
+            and scope['path'].startswith(UPLOAD_PREFIX)
+        )
+
+    @staticmethod
+    def _prepaid(scope: Scope) -> int:
+        """Сколько байт тела оплачивается при допуске запроса."""
+        size = _content_length(scope)
+        return min(
+            METER_BYTES if size is None else size,
+            METER_BYTES, settings.upload_bytes_burst,
+        )
+
+    async def _check_requests(self, key: str) -> Optional[JSONResponse]:
+        rate = settings.requests_per_second
+        if rate is None:
+            return None
+        allowed, tokens = await backend.take(
+            f'{key}:requests', rate, settings.requests_burst, 1
+        )
+        if not allowed:
+            return too_many_requests('requests', (1 - tokens) / rate)
+        return None
+
+    async def _check_bytes(
+            self,
+            scope: Scope,
+            key: str,
+    ) -> Optional[JSONResponse]:
+        rate = settings.upload_bytes_per_second
+        if rate is None:
+            return None
+        prepaid = self._prepaid(scope)
+        allowed, tokens = await backend.take(
+            f'{key}:bytes', rate, settings.upload_bytes_burst, prepaid
+        )
+        if not allowed:
+            return too_many_requests('bytes', (prepaid - tokens) / rate)
+        return None
+
+    @staticmethod
+    async def _pace(key: str, cost: int) -> None:
+        rate = settings.upload_bytes_per_second
+        burst = settings.upload_bytes_burst
+        while True:
+            allowed, tokens = await backend.take(key, rate, burst, cost)
+            if allowed:
+                return
+            delay = (min(cost, burst) - tokens) / rate
+            THROTTLED.inc(amount=delay)
+            await asyncio.sleep(delay)
+
+    def _metered(self, receive: Receive, key: str, prepaid: int) -> Receive:
+        """Списывать прочитанные байты пачками по METER_BYTES, чтобы
+        общий бэкенд не получал запрос на каждый фрагмент тела."""
+        credit = prepaid
+        pending = 0
+
+        async def metered_receive() -> Message:
+            nonlocal credit, pending
+            message = await receive()
+            if message['type'] != 'http.request':
+                return message
+            size = len(message.get('body', b''))
+            paid = min(credit, size)
+            credit -= paid
+            pending += size - paid
+            if pending and (pending >= METER_BYTES
+                            or not message.get('more_body', False)):
+                cost, pending = pending, 0
+                await self._pace(key, cost)
+            return message
+
+        return metered_receive
@@ -0,0 +1,159 @@
+import io
+import tarfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import AsyncIterator, NamedTuple, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.core.responses import content_disposition
+from app.core.storage import iter_decoded, iter_file, run_in_storage
+
+TAR_BLOCK_SIZE: int = tarfile.BLOCKSIZE
+TAR_RECORD_SIZE: int = tarfile.RECORDSIZE
+ZIP_MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class Compression(str, Enum):
+    zip = 'zip'
+    tar = 'tar'
+    tar_gz = 'tar.gz'
+
+
+MEDIA_TYPES = {
+    Compression.zip: 'application/zip',
+    Compression.tar: 'application/x-tar',
+    Compression.tar_gz: 'application/gzip',
+}
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    location: Path
+    size: int
+    modified: Optional[datetime]
+    codec: Optional[str] = None
+
+
+class _Pipe(io.RawIOBase):
+    """Приёмник без поддержки seek, из которого архив забирается по частям."""
+
+    def __init__(self) -> None:
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_info(member: ArchiveMember) -> zipfile.ZipInfo:
+    date_time = (
+        member.modified.timetuple()[:6] if member.modified
+        else time.localtime()[:6]
+    )
+    zinfo = zipfile.ZipInfo(member.name, max(date_time, ZIP_MIN_DATE_TIME))
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.file_size = member.size
+    return zinfo
+
+
+async def iter_zip(
+        members: AsyncIterator[ArchiveMember],
+) -> AsyncIterator[bytes]:
+    pipe = _Pipe()
+    archive = zipfile.ZipFile(pipe, 'w')
+    async for member in members:
+        destination = await run_in_storage(
+            archive.open, _zip_info(member), 'w'
+        )
+        async for chunk in iter_decoded(
+                iter_file(member.location), member.codec):
+            await run_in_storage(destination.write, chunk)
+            data = pipe.drain()
+            if data:
+                yield data
+        await run_in_storage(destination.close)
+        yield pipe.drain()
+    await run_in_storage(archive.close)
+    yield pipe.drain()
+
+
+def _tar_header(member: ArchiveMember) -> bytes:
+    info = tarfile.TarInfo(member.name)
+    info.size = member.size
+    info.mode = 0o644
+    info.mtime = (
+        member.modified.timestamp() if member.modified else time.time()
+    )
+    return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
+async def _iter_tar_blocks(
+        members: AsyncIterator[ArchiveMember],
+) -> AsyncIterator[bytes]:
+    written = 0
+    async for member in members:
+        header = _tar_header(member)
+        written += len(header)
+        yield header
+        async for chunk in iter_decoded(
+                iter_file(member.location), member.codec):
+            written += len(chunk)
+            yield chunk
+        padding = -member.size % TAR_BLOCK_SIZE
+        written += padding
+        yield b'\0' * padding
+    end = 2 * TAR_BLOCK_SIZE
+    end += -(written + end) % TAR_RECORD_SIZE
+    yield b'\0' * end
+
+
+async def iter_tar(
+        members: AsyncIterator[ArchiveMember],
+        gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if gzip else None
+    async for block in _iter_tar_blocks(members):
+        if compressor is not None:
+            block = await run_in_storage(compressor.compress, block)
+        if block:
+            yield block
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def iter_archive(
+        members: AsyncIterator[ArchiveMember],
+        compression: Compression,
+) -> AsyncIterator[bytes]:
+    if compression == Compression.zip:
+        return iter_zip(members)
+    return iter_tar(members, gzip=compression == Compression.tar_gz)
+
+
+def archive_response(
+        members: AsyncIterator[ArchiveMember],
+        name: str,
+        compression: Compression,
+) -> StreamingResponse:
+    return StreamingResponse(
+        iter_archive(members, compression),
+        media_type=MEDIA_TYPES[compression],
+        headers={
+            'content-disposition': content_disposition(
+                f'{name}.{compression.value}'
+            ),
+        },
+    )
@@ -1,2 +1,2 @@
 from app.core.db import Base  # noqa
-from app.models import DownloadedFile, User  # noqa
+from app.models import Blob, DownloadedFile, Folder, UploadSession, UsageCounter, User  # noqa
@@ -0,0 +1,142 @@
+import asyncio
+import io
+import posixpath
+import tarfile
+from typing import AsyncIterator, List, NamedTuple
+
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.core.storage import (
+    StoredFile, discard_temp, run_in_storage, write_blob_sync
+)
+
+MAX_FILENAME_LENGTH: int = 100
+
+TAR_CONTENT_TYPES = (
+    'application/x-tar', 'application/tar', 'application/gzip',
+    'application/x-gzip', 'application/x-compressed-tar',
+)
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+class BatchEntry(NamedTuple):
+    folder: str
+    filename: str
+    stored_file: StoredFile
+
+
+def split_member_name(name: str):
+    """Разбить путь файла внутри пакета на папку и имя файла."""
+    name = name.replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or len(parts[-1]) > MAX_FILENAME_LENGTH:
+        raise InvalidBatch(f'Недопустимое имя файла: {name}')
+    return '/'.join(parts[:-1]), parts[-1]
+
+
+async def discard_entries(entries: List[BatchEntry]) -> None:
+    await asyncio.gather(*(
+        discard_temp(entry.stored_file.location) for entry in entries
+    ))
+
+
+async def store_uploaded_files(files: List[UploadFile]) -> List[BatchEntry]:
+    """Записать файлы multipart-запроса параллельно в пуле хранилища."""
+    names = [split_member_name(file.filename or '') for file in files]
+    results = await asyncio.gather(
+        *(run_in_storage(write_blob_sync, file.file, filename)
+          for file, (_, filename) in zip(files, names)),
+        return_exceptions=True,
+    )
+    entries = [
+        BatchEntry(folder, filename, stored_file)
+        for (folder, filename), stored_file in zip(names, results)
+        if isinstance(stored_file, StoredFile)
+    ]
+    for result in results:
+        if isinstance(result, BaseException):
+            await discard_entries(entries)
+            raise result
+    return entries
+
+
+class _StreamReader(io.RawIOBase):
+    """Синхронное чтение асинхронного потока из потока-исполнителя."""
+
+    def __init__(
+            self,
+            chunks: AsyncIterator[bytes],
+            loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        self._chunks = chunks.__aiter__()
+        self._loop = loop
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = asyncio.run_coroutine_threadsafe(
+                    self._chunks.__anext__(), self._loop
+                ).result()
+            except StopAsyncIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _extract_tar(reader: io.BufferedReader) -> List[BatchEntry]:
+    entries = []
+    try:
+        with tarfile.open(fileobj=reader, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if len(entries) >= settings.batch_upload_max_files:
+                    raise InvalidBatch(
+                        f'В пакете больше {settings.batch_upload_max_files}'
+                        ' файлов'
+                    )
+                folder, filename = split_member_name(member.name)
+                entries.append(BatchEntry(
+                    folder, filename,
+                    write_blob_sync(archive.extractfile(member), filename),
+                ))
+    except BaseException:
+        for entry in entries:
+            entry.stored_file.location.unlink(missing_ok=True)
+        raise
+    return entries
+
+
+async def store_tar_stream(chunks: AsyncIterator[bytes]) -> List[BatchEntry]:
+    """Распаковать tar (в том числе сжатый) прямо из тела запроса.
+
+    Архив читается последовательно, поэтому разбирается в отдельном
+    потоке, а не в пуле хранилища: иначе ожидание сети занимало бы
+    его потоки.
+    """
+    loop = asyncio.get_running_loop()
+    reader = io.BufferedReader(
+        _StreamReader(chunks, loop), buffer_size=settings.storage_chunk_size
+    )
+    try:
+        return await loop.run_in_executor(None, _extract_tar, reader)
+    except tarfile.TarError as error:
+        raise InvalidBatch(f'Некорректный архив: {error}')
+
+
+def is_tar_request(content_type: str) -> bool:
+    return content_type.split(';')[0].strip().lower() in TAR_CONTENT_TYPES
+
+
+def entry_path(base_path: str, folder: str) -> str:
+    return posixpath.join('/', base_path.strip('/'), folder) + '/'
@@ -0,0 +1,41 @@
+from functools import partial
+from pathlib import Path
+from typing import List
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.core.jobs import Job, start_job
+from app.core.storage import remove_files
+from app.core.utils import get_legacy_locations
+from app.crud.blob import blob_crud
+
+
+async def cleanup_deleted_files(
+        job: Job,
+        legacy_locations: List[Path],
+) -> None:
+    """Удалить с диска файлы уже удалённых из базы записей.
+
+    Блобы без ссылок собираются пачками, каждая в своей транзакции,
+    чтобы не держать блокировки на время всего удаления.
+    """
+    async for removed in remove_files(legacy_locations):
+        job.removed += removed
+    while True:
+        async with AsyncSessionLocal() as session:
+            removed = await blob_crud.collect_orphans(
+                session, settings.delete_batch_size
+            )
+        if not removed:
+            break
+        job.removed += len(removed)
+
+
+def start_cleanup_job(deleted_files, user_id) -> Job:
+    return start_job(
+        Job('delete_files', user_id, deleted=len(deleted_files)),
+        partial(
+            cleanup_deleted_files,
+            legacy_locations=get_legacy_locations(deleted_files),
+        ),
+    )
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_PAYLOAD_LIMIT: int = 7000
+
+caches: Dict[str, 'LRUCache'] = {}
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш с вытеснением давно неиспользуемых
+    записей и временем жизни каждой записи.
+
+    Записи можно пометить тегом, чтобы потом сбросить их все разом.
+    Кэши из реестра caches видны в статистике и сбрасываются
+    оповещениями об инвалидации; register=False оставляет кэш вне его.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            maxsize: int,
+            ttl: Optional[float] = None,
+            weigh: Callable[[Any], int] = lambda value: 1,
+            register: bool = True,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._lock = Lock()
+        if register:
+            caches[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Проверить наличие записи, не учитывая обращение в статистике."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (
+                entry[1] is None or entry[1] > time.monotonic()
+            )
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+            self,
+            key: Hashable,
+            value: Any,
+            tag: Hashable = None,
+            ttl: Optional[float] = None,
+    ) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl or ttl)
+        weight = self.weigh(value)
+        if weight > self.maxsize:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+            self._entries[key] = (value, expires_at, tag, weight)
+            self.weight += weight
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.weight > self.maxsize:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def invalidate(self, tag: Hashable) -> None:
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._pop(key)
+
+    def invalidate_many(self, tags: Iterable[Hashable]) -> None:
+        for tag in tags:
+            self.invalidate(tag)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.weight = 0
+
+    def _pop(self, key: Hashable) -> None:
+        _, _, tag, weight = self._entries.pop(key)
+        self.weight -= weight
+        if tag is not None:
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'weight': self.weight,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+        }
+
+
+class CacheCounter(Counter):
+    """Счётчик, значения которого при каждом чтении метрик берутся из
+    статистики кэшей реестра caches."""
+
+    def __init__(self, name: str, documentation: str, stat: str) -> None:
+        super().__init__(name, documentation, ('cache',))
+        self.stat = stat
+
+    def render(self) -> List[str]:
+        self._values = {
+            (name,): getattr(cache, self.stat)
+            for name, cache in caches.items()
+        }
+        return super().render()
+
+
+CACHE_HITS = registry.register(CacheCounter(
+    'cache_hits_total', 'Обращения к кэшу, нашедшие запись.', 'hits',
+))
+CACHE_MISSES = registry.register(CacheCounter(
+    'cache_misses_total', 'Обращения к кэшу, не нашедшие запись.', 'misses',
+))
+CACHE_EVICTIONS = registry.register(CacheCounter(
+    'cache_evictions_total', 'Записи, вытесненные из-за размера кэша.',
+    'evictions',
+))
+
+
+def _invalidation_payloads(cache_name: str, tags: List[str]) -> List[str]:
+    payloads = []
+    batch: List[str] = []
+    for tag in tags:
+        batch.append(tag)
+        if len(json.dumps(batch, ensure_ascii=False)) > NOTIFY_PAYLOAD_LIMIT:
+            batch.pop()
+            payloads.append(json.dumps({'cache': cache_name, 'tags': batch}))
+            batch = [tag]
+    if batch:
+        payloads.append(json.dumps({'cache': cache_name, 'tags': batch}))
+    return payloads
+
+
+async def publish_invalidation(
+        session: AsyncSession,
+        cache_name: str,
+        tags: List[str],
+) -> None:
+    """Оповестить остальные процессы об изменении записей.
+
+    NOTIFY доставляется только после фиксации транзакции, поэтому
+    вызывать нужно до commit.
+    """
+    if not settings.cache_invalidation_channel or not tags:
+        return
+    for payload in _invalidation_payloads(cache_name, tags):
+        await session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {'channel': settings.cache_invalidation_channel,
+             'payload': payload},
+        )
+
+
+def _on_invalidation(connection, pid, channel, payload) -> None:
+    try:
+        message = json.loads(payload)
+        cache = caches.get(message['cache'])
+        if cache is not None:
+            cache.invalidate_many(message['tags'])
+    except (ValueError, KeyError, TypeError):
+        logger.warning('Malformed cache invalidation message: %r', payload)
+
+
+async def run_invalidation_listener() -> None:
+    args, params = engine.dialect.create_connect_args(engine.url)
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(*args, **params)
+            await connection.add_listener(
+                settings.cache_invalidation_channel, _on_invalidation
+            )
+            # Пока соединения не было, могли пропасть оповещения.
+            for cache in caches.values():
+                cache.clear()
+            while not connection.is_closed():
+                await asyncio.sleep(settings.cache_listener_check_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Cache invalidation listener failed')
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(settings.cache_listener_check_interval)
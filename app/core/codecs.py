@@ -0,0 +1,86 @@
+import os
+import zlib
+from typing import Optional
+
+from app.core.config import settings
+
+GZIP: str = 'gzip'
+GZIP_WBITS: int = zlib.MAX_WBITS | 16
+TRIAL_SIZE: int = 64 * 1024
+
+INCOMPRESSIBLE_EXTENSIONS = frozenset((
+    '7z', 'avi', 'bz2', 'docx', 'flac', 'gif', 'gz', 'heic', 'jpeg', 'jpg',
+    'mkv', 'mov', 'mp3', 'mp4', 'ogg', 'pdf', 'png', 'pptx', 'rar', 'tgz',
+    'webm', 'webp', 'xlsx', 'xz', 'zip', 'zst',
+))
+
+
+def choose_codec(filename: Optional[str], head: bytes) -> Optional[str]:
+    """Решить по имени файла и его началу, стоит ли сжимать файл."""
+    if not settings.storage_compression:
+        return None
+    if len(head) < settings.compression_min_size:
+        return None
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if extension in INCOMPRESSIBLE_EXTENSIONS:
+        return None
+    sample = head[:TRIAL_SIZE]
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    return GZIP if ratio <= settings.compression_max_ratio else None
+
+
+class Encoder:
+    def __init__(self, codec: Optional[str]) -> None:
+        self.codec = codec
+        self._compressor = (
+            zlib.compressobj(settings.compression_level, wbits=GZIP_WBITS)
+            if codec == GZIP else None
+        )
+
+    def encode(self, chunk: bytes) -> bytes:
+        if self._compressor is None:
+            return chunk
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        if self._compressor is None:
+            return b''
+        return self._compressor.flush()
+
+
+class Decoder:
+    def __init__(self, codec: Optional[str]) -> None:
+        self._decompressor = (
+            zlib.decompressobj(wbits=GZIP_WBITS) if codec == GZIP else None
+        )
+
+    def decode(self, chunk: bytes) -> bytes:
+        if self._decompressor is None:
+            return chunk
+        return self._decompressor.decompress(chunk)
+
+    def flush(self) -> bytes:
+        if self._decompressor is None:
+            return b''
+        return self._decompressor.flush()
+
+
+def decode(content: bytes, codec: Optional[str]) -> bytes:
+    if codec == GZIP:
+        return zlib.decompress(content, wbits=GZIP_WBITS)
+    return content
+
+
+def accepts_encoding(accept_encoding: Optional[str], codec: str) -> bool:
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if coding.strip().lower() != codec:
+            continue
+        name, _, quality = params.strip().partition('=')
+        if name.strip().lower() != 'q':
+            return True
+        try:
+            return float(quality) > 0
+        except ValueError:
+            return False
+    return False
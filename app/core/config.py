@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Literal, Optional
 
 from pydantic import BaseSettings, EmailStr, PostgresDsn
 
@@ -6,9 +6,62 @@ from pydantic import BaseSettings, EmailStr, PostgresDsn
 class Settings(BaseSettings):
     app_title: str = 'Файловый дескриптор'
     database_dsn: PostgresDsn
+    database_replica_dsn: Optional[PostgresDsn] = None
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 30 * 60
+    replica_cache_ttl: float = 1
     secret: str = 'SECRET'
     first_superuser_email: Optional[EmailStr] = 'user@example.com'
     first_superuser_password: Optional[str] = '1234566789987654321'
+    storage_max_workers: int = 8
+    storage_chunk_size: int = 1024 * 1024
+    files_page_size: int = 100
+    files_max_page_size: int = 1000
+    upload_default_chunk_size: int = 8 * 1024 * 1024
+    upload_max_chunk_size: int = 64 * 1024 * 1024
+    upload_session_ttl: int = 24 * 60 * 60
+    upload_session_gc_interval: int = 10 * 60
+    user_quota: int = 10 * 1024 * 1024 * 1024
+    delete_batch_size: int = 1000
+    job_ttl: int = 60 * 60
+    user_cache_size: int = 10000
+    user_cache_ttl: int = 60
+    download_mode: Literal['direct', 'accel'] = 'direct'
+    accel_redirect_location: str = '/protected-files/'
+    signed_url_ttl: int = 60 * 60
+    signed_url_max_ttl: int = 7 * 24 * 60 * 60
+    signed_url_batch_size: int = 1000
+    files_cache_size: int = 100000
+    files_cache_ttl: int = 5 * 60
+    cache_invalidation_channel: Optional[str] = None
+    cache_listener_check_interval: int = 5
+    content_cache_size: int = 256 * 1024 * 1024
+    content_cache_max_file_size: int = 256 * 1024
+    batch_upload_max_files: int = 10000
+    storage_compression: bool = False
+    compression_level: int = 6
+    compression_min_size: int = 1024
+    compression_max_ratio: float = 0.9
+    storage_volumes: Dict[str, float] = {}
+    metrics_enabled: bool = True
+    loop_lag_interval: float = 0.1
+    slow_callback_threshold: float = 0.1
+    profiler_interval: float = 0.005
+    profiler_max_seconds: int = 60
+    profiler_token: Optional[str] = None
+    health_probe_timeout: float = 2
+    health_cache_ttl: float = 2
+    requests_per_second: Optional[float] = None
+    requests_burst: int = 20
+    upload_bytes_per_second: Optional[int] = None
+    upload_bytes_burst: int = 256 * 1024 * 1024
+    max_concurrent_uploads: Optional[int] = 4
+    admission_backend: Literal['memory', 'postgres'] = 'memory'
+    admission_max_keys: int = 100000
+    upload_lease_ttl: int = 60 * 60
 
     class Config:
         env_file = '.env'
@@ -1,7 +1,17 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, declared_attr, sessionmaker
+import inspect
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, declared_attr, sessionmaker
+from sqlalchemy.sql import Select
 
 from app.core.config import settings
+from app.core.metrics import InstrumentedPool, instrument_engine
+
+PRIMARY_KEY: str = 'primary'
 
 
 class PreBase:
@@ -12,9 +22,96 @@ class PreBase:
 
 Base = declarative_base(cls=PreBase)
 
-engine = create_async_engine(settings.database_dsn, future=True)
 
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+def create_engine(dsn: str, name: str) -> AsyncEngine:
+    async_engine = create_async_engine(
+        dsn, future=True,
+        poolclass=InstrumentedPool, pool_logging_name=name,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    instrument_engine(async_engine, name)
+    return async_engine
+
+
+engine = create_engine(settings.database_dsn, 'primary')
+replica_engine: Optional[AsyncEngine] = (
+    create_engine(settings.database_replica_dsn, 'replica')
+    if settings.database_replica_dsn else None
+)
+
+read_only_context: ContextVar[bool] = ContextVar('read_only', default=False)
+
+
+def read_only(method):
+    """Пометить метод CRUD как только читающий: его SELECT уходят
+    в реплику, если она настроена.
+
+    У асинхронного генератора метка ставится на каждый шаг отдельно:
+    между шагами потребитель может выполнять и свои запросы.
+    """
+    if inspect.isasyncgenfunction(method):
+        @wraps(method)
+        async def generator_wrapper(*args, **kwargs):
+            generator = method(*args, **kwargs)
+            try:
+                while True:
+                    token = read_only_context.set(True)
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        read_only_context.reset(token)
+                    yield item
+            finally:
+                await generator.aclose()
+        return generator_wrapper
+
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = read_only_context.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            read_only_context.reset(token)
+    return wrapper
+
+
+def reads_from_replica() -> bool:
+    return replica_engine is not None and read_only_context.get()
+
+
+class RoutingSession(Session):
+    """Сессия, отправляющая чтения из read_only-методов в реплику.
+
+    Как только транзакция обратилась к основной базе, она остаётся на
+    ней до конца: так транзакция видит свои же изменения и блокировки.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (reads_from_replica() and not self._flushing
+                and not self.info.get(PRIMARY_KEY)
+                and isinstance(clause, Select)
+                and clause._for_update_arg is None):
+            return replica_engine.sync_engine
+        self.info[PRIMARY_KEY] = True
+        return engine.sync_engine
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _forget_primary(session: Session, transaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(PRIMARY_KEY, None)
+
+
+AsyncSessionLocal = sessionmaker(
+    class_=AsyncSession, sync_session_class=RoutingSession,
+    expire_on_commit=False,
+)
 
 
 async def get_async_session():
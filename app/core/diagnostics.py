@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from types import FrameType
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import DB_BUCKETS, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER: str = 'x-profile'
+PROFILE_ID_HEADER: bytes = b'x-profile-id'
+
+LOOP_LAG = registry.register(Histogram(
+    'event_loop_lag_seconds',
+    'Опоздание пробуждения задачи-пульса цикла событий.',
+    buckets=DB_BUCKETS,
+))
+
+profiles = LRUCache('profiles', 32, ttl=60 * 60)
+
+# Какой запрос обслуживает задача: сторожевой поток не видит
+# контекстных переменных цикла, но видит его текущую задачу.
+active_requests: 'WeakKeyDictionary[asyncio.Task, Scope]' = (
+    WeakKeyDictionary()
+)
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+    """Стек в формате collapsed: кадры от корня к листу через ';'."""
+    frames = []
+    while frame is not None:
+        frames.append(
+            f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}'
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class SamplingProfiler:
+    """Профилировщик, снимающий стек потока цикла событий по таймеру.
+
+    Сэмплируется весь поток, поэтому в профиль попадают и запросы,
+    выполнявшиеся одновременно с профилируемым.
+    """
+
+    def __init__(
+            self,
+            thread_id: int,
+            interval: float = settings.profiler_interval,
+    ) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='sampling-profiler', daemon=True
+        )
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return ''.join(
+            f'{stack} {count}\n'
+            for stack, count in self.samples.most_common()
+        )
+
+
+async def profile_loop(seconds: float) -> str:
+    profiler = SamplingProfiler(threading.get_ident()).start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = profiler.stop()
+    return stacks
+
+
+def _describe_request(loop: asyncio.AbstractEventLoop) -> str:
+    task = asyncio.current_task(loop)
+    scope = active_requests.get(task) if task is not None else None
+    if scope is None:
+        return '-'
+    return f'{scope["method"]} {scope["path"]}'
+
+
+class LoopMonitor:
+    """Следит за задержками цикла событий.
+
+    Задача-пульс замеряет, насколько позже срока она просыпается, а
+    сторожевой поток, заметив, что пульса давно не было, пишет в лог
+    стек, на котором цикл занят, и запрос, который его занял.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.interval = settings.loop_lag_interval
+        self.threshold = settings.slow_callback_threshold
+        self.last_beat = time.perf_counter()
+        self._reported_beat: Optional[float] = None
+        self._stop = threading.Event()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            beat = self.last_beat
+            stalled = time.perf_counter() - beat - self.interval
+            if stalled < self.threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            logger.warning(
+                'Event loop blocked for %.0f ms while serving %s:\n%s',
+                stalled * 1000, _describe_request(self.loop),
+                ''.join(traceback.format_stack(frame)),
+            )
+
+    async def run(self) -> None:
+        watchdog = threading.Thread(
+            target=self._watch, name='loop-watchdog', daemon=True
+        )
+        watchdog.start()
+        try:
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                self.last_beat = time.perf_counter()
+                LOOP_LAG.observe(
+                    max(0.0, self.last_beat - started - self.interval)
+                )
+        finally:
+            self._stop.set()
+
+
+async def run_loop_monitor() -> None:
+    await LoopMonitor(asyncio.get_running_loop()).run()
+
+
+class DiagnosticsMiddleware:
+    """Запоминает, какой запрос выполняет задача, и профилирует запрос,
+    пришедший с заголовком X-Profile, равным settings.profiler_token.
+
+    Id профиля возвращается в заголовке X-Profile-Id, сам профиль
+    отдаёт GET /diagnostics/profiles/{profile_id}.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        if settings.profiler_token is None:
+            return False
+        expected = settings.profiler_token.encode('latin-1')
+        return any(
+            name == PROFILE_HEADER.encode() and value == expected
+            for name, value in scope['headers']
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        active_requests[task] = scope
+        if not self._wants_profile(scope):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                active_requests.pop(task, None)
+            return
+        profile_id = uuid.uuid4()
+
+        async def send_with_id(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [
+                    *message.get('headers', []),
+                    (PROFILE_ID_HEADER, str(profile_id).encode()),
+                ]}
+            await send(message)
+
+        profiler = SamplingProfiler(threading.get_ident()).start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiles.set(profile_id, profiler.stop())
+            active_requests.pop(task, None)
+
+
+def get_profile(profile_id: uuid.UUID) -> Optional[str]:
+    return profiles.get(profile_id)
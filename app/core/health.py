@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from functools import partial
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.cache import caches
+from app.core.config import settings
+from app.core.db import engine, replica_engine
+from app.core.storage import Volume, run_in_storage, volumes
+
+logger = logging.getLogger(__name__)
+
+PROBE_FILE_SIZE: int = 4096
+
+
+class Probe(NamedTuple):
+    check: Callable[[], Awaitable[dict]]
+    critical: bool
+
+
+probes: Dict[str, Probe] = {}
+
+
+def register_probe(name: str, critical: bool = True):
+    """Зарегистрировать проверку для /ping.
+
+    Проверка возвращает словарь подробностей или бросает исключение.
+    Отказ критичной проверки делает весь сервис неготовым.
+    """
+    def decorator(check: Callable[[], Awaitable[dict]]):
+        probes[name] = Probe(check, critical)
+        return check
+    return decorator
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+async def probe_db(db_engine: AsyncEngine) -> dict:
+    async with db_engine.connect() as connection:
+        await connection.execute(select(1))
+    return {}
+
+
+async def probe_db_pool(db_engine: AsyncEngine) -> dict:
+    pool = db_engine.sync_engine.pool
+    checked_out = pool.checkedout()
+    capacity = settings.db_pool_size + settings.db_max_overflow
+    return {
+        'checked_out': checked_out,
+        'size': pool.size(),
+        'overflow': max(pool.overflow(), 0),
+        'saturation': round(checked_out / max(capacity, 1), 2),
+    }
+
+
+register_probe('db')(partial(probe_db, engine))
+register_probe('db_pool', critical=False)(partial(probe_db_pool, engine))
+if replica_engine is not None:
+    register_probe('db_replica')(partial(probe_db, replica_engine))
+    register_probe('db_replica_pool', critical=False)(
+        partial(probe_db_pool, replica_engine)
+    )
+
+
+def _check_volume(volume: Volume) -> dict:
+    directory = volume.root / 'tmp'
+    directory.mkdir(parents=True, exist_ok=True)
+    location = directory / f'.health-{uuid.uuid4().hex}'
+    data = os.urandom(PROBE_FILE_SIZE)
+    try:
+        started = time.perf_counter()
+        with open(location, 'wb') as probe_file:
+            probe_file.write(data)
+            written = time.perf_counter()
+            os.fsync(probe_file.fileno())
+        synced = time.perf_counter()
+        with open(location, 'rb') as probe_file:
+            if probe_file.read() != data:
+                raise OSError('Прочитаны не те данные, что были записаны')
+        read = time.perf_counter()
+    finally:
+        location.unlink(missing_ok=True)
+    return {
+        'write_ms': _ms(written - started),
+        'fsync_ms': _ms(synced - written),
+        'read_ms': _ms(read - synced),
+    }
+
+
+async def probe_volume(volume: Volume) -> dict:
+    return await run_in_storage(_check_volume, volume)
+
+
+for _number, _volume in enumerate(volumes):
+    register_probe(f'storage-{_number}')(partial(probe_volume, _volume))
+
+
+@register_probe('cache', critical=False)
+async def probe_caches() -> dict:
+    return {
+        name: {
+            key: value for key, value in cache.stats().items()
+            if key in ('size', 'hit_ratio')
+        }
+        for name, cache in caches.items()
+    }
+
+
+async def _run_probe(name: str, probe: Probe) -> dict:
+    started = time.perf_counter()
+    try:
+        details = await asyncio.wait_for(
+            probe.check(), settings.health_probe_timeout
+        )
+        status = 'ok'
+    except asyncio.TimeoutError:
+        details, status = {}, 'timeout'
+    except Exception as error:
+        logger.warning('Health probe %s failed: %r', name, error)
+        details, status = {'error': type(error).__name__}, 'error'
+    return {
+        'status': status,
+        'ms': _ms(time.perf_counter() - started),
+        'critical': probe.critical,
+        **details,
+    }
+
+
+_lock: Optional[asyncio.Lock] = None
+_last_result: Tuple[float, Dict[str, dict]] = (float('-inf'), {})
+
+
+async def check_health() -> Dict[str, dict]:
+    """Выполнить все проверки одновременно.
+
+    Результат живёт health_cache_ttl секунд, а одновременные запросы
+    ждут одного прогона: частые проверки балансировщика не нагружают
+    базу и диски.
+    """
+    global _lock, _last_result
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        checked_at, results = _last_result
+        if time.monotonic() - checked_at < settings.health_cache_ttl:
+            return results
+        names = list(probes)
+        outcomes = await asyncio.gather(
+            *(_run_probe(name, probes[name]) for name in names)
+        )
+        results = dict(zip(names, outcomes))
+        _last_result = (time.monotonic(), results)
+        return results
+
+
+def is_healthy(results: Dict[str, dict]) -> bool:
+    return all(
+        result['status'] == 'ok' for result in results.values()
+        if result['critical']
+    )
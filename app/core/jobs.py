@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    pending = 'pending'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
+class Job:
+    """Фоновая задача процесса, состояние которой можно опрашивать."""
+
+    def __init__(self, name: str, user_id, deleted: int = 0) -> None:
+        self.id = uuid.uuid4()
+        self.name = name
+        self.user_id = user_id
+        self.status = JobStatus.pending
+        self.deleted = deleted
+        self.removed = 0
+        self.moved = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+
+jobs: Dict[uuid.UUID, Job] = {}
+running_tasks = set()
+
+
+def _forget_finished_jobs() -> None:
+    deadline = datetime.now() - timedelta(seconds=settings.job_ttl)
+    for job_id, job in list(jobs.items()):
+        if job.finished_at is not None and job.finished_at < deadline:
+            del jobs[job_id]
+
+
+async def _run(job: Job, func: Callable[[Job], Awaitable[None]]) -> None:
+    job.status = JobStatus.running
+    try:
+        await func(job)
+        job.status = JobStatus.done
+    except Exception as error:
+        logger.exception('Job %s (%s) failed', job.id, job.name)
+        job.status = JobStatus.failed
+        job.error = str(error)
+    finally:
+        job.finished_at = datetime.now()
+
+
+def start_job(job: Job, func: Callable[[Job], Awaitable[None]]) -> Job:
+    _forget_finished_jobs()
+    jobs[job.id] = job
+    task = asyncio.create_task(_run(job, func))
+    running_tasks.add(task)
+    task.add_done_callback(running_tasks.discard)
+    return job
+
+
+def get_job(job_id: uuid.UUID) -> Optional[Job]:
+    return jobs.get(job_id)
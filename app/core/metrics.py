@@ -0,0 +1,319 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE: str = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_ROUTE: str = '<unmatched>'
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0,
+)
+DB_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0, 30.0,
+)
+STATEMENT_KINDS = frozenset(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'))
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    )
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """Метрика с фиксированным набором меток.
+
+    Метрики живут в памяти процесса и меняются только из потока
+    цикла событий, поэтому обходятся без блокировок.
+    """
+
+    kind: str = 'untyped'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {_escape(self.documentation)}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        for labels, value in sorted(self._values.items()):
+            lines.append(
+                f'{self.name}{_format_labels(self.label_names, labels)} '
+                f'{_format_value(value)}'
+            )
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {_escape(self.documentation)}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        names = self.label_names + ('le',)
+        for labels, counts in sorted(self._counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{_format_labels(names, labels + (_format_value(bound),))}'
+                    f' {total}'
+                )
+            suffix = _format_labels(self.label_names, labels)
+            lines.append(
+                f'{self.name}_sum{suffix} {_format_value(self._sums[labels])}'
+            )
+            lines.append(f'{self.name}_count{suffix} {total}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds',
+    'Время обработки запроса до отправки последнего байта ответа.',
+    ('method', 'route', 'status'),
+))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight',
+    'Число запросов, обрабатываемых прямо сейчас.',
+))
+REQUEST_BYTES = registry.register(Counter(
+    'http_request_bytes_total',
+    'Байты тел запросов, полученные от клиентов.',
+    ('route',),
+))
+RESPONSE_BYTES = registry.register(Counter(
+    'http_response_bytes_total',
+    'Байты тел ответов, отправленные клиентам.',
+    ('route',),
+))
+POOL_CHECKOUT_WAIT = registry.register(Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Ожидание свободного соединения в пуле.',
+    ('pool',),
+    DB_BUCKETS,
+))
+STATEMENT_DURATION = registry.register(Histogram(
+    'db_statement_duration_seconds',
+    'Время выполнения SQL-запросов.',
+    ('pool', 'statement'),
+    DB_BUCKETS,
+))
+STATEMENT_ERRORS = registry.register(Counter(
+    'db_statement_errors_total',
+    'SQL-запросы, завершившиеся ошибкой.',
+    ('pool', 'statement'),
+))
+
+
+def _route_template(scope: Scope, cache: Dict) -> str:
+    """Шаблон пути маршрута, а не сам путь: иначе каждый id файла
+    породил бы отдельный ряд метрики."""
+    endpoint = scope.get('endpoint')
+    router = scope.get('router')
+    if endpoint is None or router is None:
+        return UNMATCHED_ROUTE
+    template = cache.get(endpoint)
+    if template is None:
+        template = next(
+            (route.path for route in router.routes
+             if getattr(route, 'endpoint', None) is endpoint),
+            UNMATCHED_ROUTE,
+        )
+        cache[endpoint] = template
+    return template
+
+
+class MetricsMiddleware:
+    """ASGI-middleware, собирающее метрики HTTP-запросов.
+
+    Длительность считается до отправки тела целиком, так что скачивание
+    больших файлов попадает в метрики полностью.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._templates: Dict = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        received = 0
+        sent = 0
+        status = 500
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal sent, status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            route = _route_template(scope, self._templates)
+            REQUEST_DURATION.observe(
+                elapsed, (scope['method'], route, str(status))
+            )
+            if received:
+                REQUEST_BYTES.inc((route,), received)
+            if sent:
+                RESPONSE_BYTES.inc((route,), sent)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий ожидание свободного соединения.
+
+    Метка пула берётся из pool_logging_name движка.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(
+                time.perf_counter() - start, (self.logging_name or 'default',)
+            )
+
+
+def _statement_kind(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    kind = words[0].upper() if words else ''
+    return kind if kind in STATEMENT_KINDS else 'OTHER'
+
+
+def instrument_engine(engine: AsyncEngine, pool: str) -> None:
+    """Замерять время каждого SQL-запроса движка."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        start = conn.info['query_start'].pop()
+        STATEMENT_DURATION.observe(
+            time.perf_counter() - start, (pool, _statement_kind(statement))
+        )
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is None or context.statement is None:
+            return
+        starts: Optional[list] = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+        STATEMENT_ERRORS.inc(
+            (pool, _statement_kind(context.statement))
+        )
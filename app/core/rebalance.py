@@ -0,0 +1,11 @@
+from app.core.jobs import Job, start_job
+from app.core.storage import rebalance_blobs
+
+
+async def move_misplaced_blobs(job: Job) -> None:
+    async for moved in rebalance_blobs():
+        job.moved += moved
+
+
+def start_rebalance_job(user_id) -> Job:
+    return start_job(Job('rebalance_storage', user_id), move_misplaced_blobs)
@@ -0,0 +1,432 @@
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from mimetypes import guess_type
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.core.codecs import accepts_encoding, decode
+from app.core.config import settings
+from app.core.storage import (
+    FILES_DIR, content_cache, iter_decoded, iter_file, read_blob_cached,
+    run_in_storage
+)
+from app.models import DownloadedFile
+
+MAX_RANGES: int = 16
+
+ByteRange = Tuple[int, int]
+
+
+def _suffix_range(length: str, size: int) -> Optional[ByteRange]:
+    """bytes=-N: последние N байт файла."""
+    first = max(size - int(length), 0)
+    if first >= size:
+        return None
+    return first, size
+
+
+def _explicit_range(start: str, end: str, size: int) -> Optional[ByteRange]:
+    """bytes=A-B или bytes=A-, где конец по умолчанию — конец файла.
+
+    ValueError означает некорректный диапазон, None — что он не попадает
+    в файл.
+    """
+    first = max(int(start), 0)
+    last = int(end) if end else size - 1
+    if first > last:
+        if end:
+            raise ValueError(f'Начало диапазона больше конца: {start}-{end}')
+        return None
+    if first >= size:
+        return None
+    return first, min(last, size - 1) + 1
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[ByteRange]]:
+    """Разобрать заголовок Range в список полуинтервалов [start, end).
+
+    None означает, что заголовок некорректен и должен быть проигнорирован,
+    пустой список — что ни один диапазон не попадает в файл.
+    """
+    unit, _, ranges_spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+    ranges = []
+    for spec in ranges_spec.split(','):
+        start, dash, end = spec.strip().partition('-')
+        if not dash:
+            return None
+        try:
+            byte_range = (
+                _explicit_range(start, end, size) if start
+                else _suffix_range(end, size)
+            )
+        except ValueError:
+            return None
+        if byte_range is not None:
+            ranges.append(byte_range)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return _merge_ranges(ranges)
+
+
+def _merge_ranges(ranges: List[ByteRange]) -> List[ByteRange]:
+    merged: List[ByteRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(etag: str, header: str) -> bool:
+    if header.strip() == '*':
+        return True
+    weak = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == weak:
+            return True
+    return False
+
+
+def _not_modified_since(last_modified: float, header: str) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified) <= since.timestamp()
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class RangeFileResponse(Response):
+    """Ответ с файлом, поддерживающий условные запросы и Range.
+
+    С codec файл хранится сжатым и распаковывается на лету (content
+    в этом случае уже распакован): такой ответ всегда отдаётся
+    целиком. content_encoding помечает, что тело уходит клиенту
+    в сжатом виде.
+    """
+
+    def __init__(
+            self,
+            path,
+            request_headers: Headers,
+            size: int,
+            etag: str,
+            last_modified: float,
+            filename: str,
+            media_type: Optional[str] = None,
+            content: Optional[bytes] = None,
+            codec: Optional[str] = None,
+            content_encoding: Optional[str] = None,
+    ) -> None:
+        self.path = path
+        self.content = content
+        self.codec = codec
+        self.size = size
+        self.media_type = (
+            media_type or guess_type(filename)[0] or 'application/octet-stream'
+        )
+        self.background = None
+        self.ranges: List[ByteRange] = [(0, size)]
+        self.boundary: Optional[str] = None
+        headers = {
+            'accept-ranges': 'bytes' if codec is None else 'none',
+            'etag': etag,
+            'last-modified': formatdate(last_modified, usegmt=True),
+        }
+        if codec is not None or content_encoding is not None:
+            headers['vary'] = 'accept-encoding'
+        if content_encoding is not None:
+            headers['content-encoding'] = content_encoding
+        self.status_code = self._evaluate(
+            request_headers, etag, last_modified
+        )
+        if self.status_code == HTTPStatus.NOT_MODIFIED:
+            self.ranges = []
+        elif self.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            self.ranges = []
+            headers['content-range'] = f'bytes */{size}'
+            headers['content-length'] = '0'
+        else:
+            headers['content-disposition'] = content_disposition(filename)
+            headers.update(self._body_headers())
+        self.raw_headers = [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers.items()
+        ]
+
+    def _evaluate(
+            self,
+            request_headers: Headers,
+            etag: str,
+            last_modified: float,
+    ) -> int:
+        if_none_match = request_headers.get('if-none-match')
+        if_modified_since = request_headers.get('if-modified-since')
+        if if_none_match is not None:
+            if _etag_matches(etag, if_none_match):
+                return HTTPStatus.NOT_MODIFIED
+        elif if_modified_since is not None:
+            if _not_modified_since(last_modified, if_modified_since):
+                return HTTPStatus.NOT_MODIFIED
+
+        range_header = request_headers.get('range')
+        if self.codec is not None:
+            return HTTPStatus.OK
+        if range_header is None or not self._if_range_holds(
+                request_headers.get('if-range'), etag, last_modified):
+            return HTTPStatus.OK
+        ranges = parse_range_header(range_header, self.size)
+        if ranges is None:
+            return HTTPStatus.OK
+        if not ranges:
+            return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        self.ranges = ranges
+        if len(ranges) > 1:
+            self.boundary = uuid.uuid4().hex
+        return HTTPStatus.PARTIAL_CONTENT
+
+    @staticmethod
+    def _if_range_holds(
+            if_range: Optional[str],
+            etag: str,
+            last_modified: float,
+    ) -> bool:
+        if if_range is None:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return not etag.startswith('W/') and if_range.strip() == etag
+        return _not_modified_since(last_modified, if_range)
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Type: {self.media_type}\r\n'
+            f'Content-Range: bytes {start}-{end - 1}/{self.size}\r\n\r\n'
+        ).encode('latin-1')
+
+    def _closing(self) -> bytes:
+        return f'--{self.boundary}--\r\n'.encode('latin-1')
+
+    def _body_headers(self) -> dict:
+        if self.boundary is None:
+            start, end = self.ranges[0]
+            headers = {
+                'content-type': self.media_type,
+                'content-length': str(end - start),
+            }
+            if self.status_code == HTTPStatus.PARTIAL_CONTENT:
+                headers['content-range'] = (
+                    f'bytes {start}-{end - 1}/{self.size}'
+                )
+            return headers
+        length = len(self._closing()) + sum(
+            len(self._part_header(start, end)) + end - start + 2
+            for start, end in self.ranges
+        )
+        return {
+            'content-type': f'multipart/byteranges; boundary={self.boundary}',
+            'content-length': str(length),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            'type': 'http.response.start',
+            'status': self.status_code,
+            'headers': self.raw_headers,
+        })
+        if not self.ranges:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        if self.content is not None:
+            await self._send_content(send)
+            return
+        if self.codec is not None:
+            await self._send_decoded(send)
+            return
+        fd = await run_in_storage(os.open, self.path, os.O_RDONLY)
+        try:
+            for start, end in self.ranges:
+                if self.boundary is not None:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': self._part_header(start, end),
+                        'more_body': True,
+                    })
+                await self._send_range(fd, start, end, send)
+                if self.boundary is not None:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b'\r\n',
+                        'more_body': True,
+                    })
+        finally:
+            await run_in_storage(os.close, fd)
+        await send({
+            'type': 'http.response.body',
+            'body': self._closing() if self.boundary is not None else b'',
+        })
+
+    async def _send_content(self, send: Send) -> None:
+        if self.boundary is None:
+            start, end = self.ranges[0]
+            body = self.content[start:end]
+        else:
+            body = b''.join(
+                self._part_header(start, end) + self.content[start:end]
+                + b'\r\n'
+                for start, end in self.ranges
+            ) + self._closing()
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_decoded(self, send: Send) -> None:
+        async for chunk in iter_decoded(iter_file(self.path), self.codec):
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+            })
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def _send_range(fd: int, start: int, end: int, send: Send) -> None:
+        offset = start
+        while offset < end:
+            chunk = await run_in_storage(
+                os.pread, fd, min(settings.storage_chunk_size, end - offset),
+                offset,
+            )
+            if not chunk:
+                break
+            offset += len(chunk)
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+            })
+
+
+def accel_redirect_response(
+        file_location: Path,
+        filename: str,
+) -> Response:
+    """Поручить отдачу файла nginx через внутреннюю location.
+
+    Условные запросы и Range nginx обрабатывает сам.
+    """
+    relative = file_location.relative_to(FILES_DIR).as_posix()
+    return Response(
+        media_type=guess_type(filename)[0] or 'application/octet-stream',
+        headers={
+            'x-accel-redirect': (
+                settings.accel_redirect_location + quote(relative)
+            ),
+            'content-disposition': content_disposition(filename),
+        },
+    )
+
+
+def is_content_cached(db_file) -> bool:
+    return (
+        db_file is not None and db_file.blob_hash is not None
+        and db_file.blob_hash in content_cache
+    )
+
+
+async def file_response(
+        request: Request,
+        file_location,
+        db_file: Optional[DownloadedFile] = None,
+) -> Response:
+    filename = (
+        db_file.name if db_file is not None
+        else os.path.basename(file_location)
+    )
+    file_location = Path(file_location)
+    codec = db_file.codec if db_file is not None else None
+    if (settings.download_mode == 'accel' and codec is None
+            and FILES_DIR in file_location.parents):
+        return accel_redirect_response(file_location, filename)
+    content = None
+    if db_file is not None and db_file.blob_hash is not None:
+        content = await read_blob_cached(db_file.blob_hash, db_file.size)
+    if codec is not None:
+        return await _encoded_file_response(
+            request, file_location, db_file, codec, content
+        )
+    if db_file is not None and db_file.hash is not None:
+        size = db_file.size
+        etag = f'"{db_file.hash}"'
+        last_modified = db_file.created_at.timestamp()
+    else:
+        stat = await run_in_storage(os.stat, file_location)
+        size = stat.st_size
+        etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        last_modified = stat.st_mtime
+    return RangeFileResponse(
+        file_location,
+        request_headers=request.headers,
+        size=size,
+        etag=etag,
+        last_modified=last_modified,
+        filename=filename,
+        content=content,
+    )
+
+
+async def _encoded_file_response(
+        request: Request,
+        file_location: Path,
+        db_file,
+        codec: str,
+        content: Optional[bytes],
+) -> Response:
+    """Отдать сжатый при хранении файл как есть, если клиент принимает
+    этот кодек, иначе распаковать его на лету."""
+    last_modified = db_file.created_at.timestamp()
+    if accepts_encoding(request.headers.get('accept-encoding'), codec):
+        if content is not None:
+            size = len(content)
+        else:
+            size = (await run_in_storage(os.stat, file_location)).st_size
+        return RangeFileResponse(
+            file_location,
+            request_headers=request.headers,
+            size=size,
+            etag=f'"{db_file.hash}-{codec}"',
+            last_modified=last_modified,
+            filename=db_file.name,
+            content=content,
+            content_encoding=codec,
+        )
+    if content is not None:
+        content = await run_in_storage(decode, content, codec)
+    return RangeFileResponse(
+        file_location,
+        request_headers=request.headers,
+        size=db_file.size,
+        etag=f'"{db_file.hash}"',
+        last_modified=last_modified,
+        filename=db_file.name,
+        content=content,
+        codec=codec,
+    )
@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from app.core.config import settings
+from app.core.storage import FILES_DIR, find_blob
+
+SIGNATURE_CONTEXT: bytes = b'download:'
+
+
+class SignedFile(NamedTuple):
+    name: str
+    hash: Optional[str]
+    blob_hash: Optional[str]
+    codec: Optional[str]
+    size: int
+    created_at: datetime
+    location: Path
+    expires: int
+
+
+def _signature(payload: bytes) -> str:
+    digest = hmac.new(
+        settings.secret.encode(), SIGNATURE_CONTEXT + payload, hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def sign_file(db_file, location: Path, expires: int) -> str:
+    """Подписать всё, что нужно для отдачи файла без обращения к базе."""
+    data = {
+        'n': db_file.name,
+        's': db_file.size,
+        't': db_file.created_at.timestamp(),
+        'e': expires,
+    }
+    if db_file.blob_hash is not None:
+        data['h'] = db_file.blob_hash
+        if db_file.codec is not None:
+            data['c'] = db_file.codec
+    else:
+        data['p'] = location.relative_to(FILES_DIR).as_posix()
+    payload = base64.urlsafe_b64encode(
+        json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+    ).decode().rstrip('=')
+    return f'{payload}.{_signature(payload.encode())}'
+
+
+def verify_file_token(token: str) -> Optional[SignedFile]:
+    """Вернуть описание файла из токена или None, если подпись неверна
+    или срок действия истёк."""
+    payload, _, signature = token.partition('.')
+    if not hmac.compare_digest(signature, _signature(payload.encode())):
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(
+            payload + '=' * (-len(payload) % 4)
+        ))
+        if data['e'] < time.time():
+            return None
+        if 'h' in data:
+            location = find_blob(data['h'])
+        else:
+            location = FILES_DIR / data['p']
+            if FILES_DIR.resolve() not in location.resolve().parents:
+                return None
+        return SignedFile(
+            name=data['n'],
+            hash=data.get('h'),
+            blob_hash=data.get('h'),
+            codec=data.get('c'),
+            size=data['s'],
+            created_at=datetime.fromtimestamp(data['t']),
+            location=location,
+            expires=data['e'],
+        )
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,436 @@
+import asyncio
+import errno
+import hashlib
+import itertools
+import math
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import (
+    AsyncIterator, BinaryIO, Iterable, Iterator, List, NamedTuple, Optional
+)
+
+from fastapi import UploadFile
+
+from app.core.cache import LRUCache
+from app.core.codecs import Decoder, Encoder, choose_codec
+from app.core.config import settings
+
+BASE_DIR = Path(__file__).parent.parent.parent
+FILES_DIR = BASE_DIR / 'files'
+BLOBS_DIR = FILES_DIR / '.blobs'
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+class Volume(NamedTuple):
+    root: Path
+    weight: float
+
+
+def _configured_volumes() -> List[Volume]:
+    if not settings.storage_volumes:
+        return [Volume(BLOBS_DIR, 1.0)]
+    return [
+        Volume(Path(root), weight)
+        for root, weight in settings.storage_volumes.items()
+    ]
+
+
+# Точки монтирования, по которым раскладываются блобы. Вес задаёт долю
+# блобов тома, например пропорционально его объёму.
+volumes = _configured_volumes()
+BLOBS_TMP_DIR = volumes[0].root / 'tmp'
+
+# Содержимое небольших блобов по хэшу. Блобы неизменяемы, поэтому запись
+# устаревает только при удалении блоба.
+content_cache = LRUCache(
+    'content', maxsize=settings.content_cache_size, weigh=len
+)
+
+storage_executor = ThreadPoolExecutor(
+    max_workers=settings.storage_max_workers,
+    thread_name_prefix='storage',
+)
+
+
+class StoredFile(NamedTuple):
+    location: Path
+    size: int
+    hash: str
+    codec: Optional[str] = None
+    stored_size: Optional[int] = None
+
+
+async def run_in_storage(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        storage_executor, partial(func, *args, **kwargs)
+    )
+
+
+async def iter_upload_file(
+        file: UploadFile,
+        chunk_size: int = settings.storage_chunk_size,
+) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await run_in_storage(file.file.read, chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def iter_file(
+        file_location: Path,
+        chunk_size: int = settings.storage_chunk_size,
+) -> AsyncIterator[bytes]:
+    buffer = await run_in_storage(open, file_location, 'rb')
+    try:
+        while True:
+            chunk = await run_in_storage(buffer.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await run_in_storage(buffer.close)
+
+
+async def iter_decoded(
+        chunks: AsyncIterator[bytes],
+        codec: Optional[str],
+) -> AsyncIterator[bytes]:
+    if codec is None:
+        async for chunk in chunks:
+            yield chunk
+        return
+    decoder = Decoder(codec)
+    async for chunk in chunks:
+        data = await run_in_storage(decoder.decode, chunk)
+        if data:
+            yield data
+    data = decoder.flush()
+    if data:
+        yield data
+
+
+def _write_chunk(
+        buffer: BinaryIO,
+        digest,
+        chunk: bytes,
+        encoder: Optional[Encoder] = None,
+) -> None:
+    digest.update(chunk)
+    buffer.write(encoder.encode(chunk) if encoder is not None else chunk)
+
+
+def _sync_and_close(
+        buffer: BinaryIO,
+        encoder: Optional[Encoder] = None,
+) -> int:
+    if encoder is not None:
+        buffer.write(encoder.flush())
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    stored_size = buffer.tell()
+    buffer.close()
+    return stored_size
+
+
+def _discard(buffer: BinaryIO, tmp_location: Path) -> None:
+    buffer.close()
+    if tmp_location.exists():
+        tmp_location.unlink()
+
+
+async def write_temp(
+        chunks: AsyncIterator[bytes],
+        tmp_location: Path,
+        filename: Optional[str] = None,
+        compress: bool = False,
+) -> StoredFile:
+    """Записать поток во временный файл, считая хэш исходных байтов.
+
+    С compress=True кодек выбирается по имени и первой части файла.
+    """
+    buffer = await run_in_storage(open, tmp_location, 'wb')
+    digest = hashlib.sha256()
+    encoder = None
+    size = 0
+    try:
+        async for chunk in chunks:
+            if compress and encoder is None:
+                encoder = Encoder(choose_codec(filename, chunk))
+            await run_in_storage(_write_chunk, buffer, digest, chunk, encoder)
+            size += len(chunk)
+        stored_size = await run_in_storage(_sync_and_close, buffer, encoder)
+    except BaseException:
+        await asyncio.shield(run_in_storage(_discard, buffer, tmp_location))
+        raise
+    return StoredFile(
+        tmp_location, size, digest.hexdigest(),
+        codec=encoder.codec if encoder is not None else None,
+        stored_size=stored_size,
+    )
+
+
+def _volume_score(volume: Volume, file_hash: str) -> float:
+    digest = hashlib.blake2b(
+        f'{volume.root}:{file_hash}'.encode(), digest_size=8
+    ).digest()
+    point = (int.from_bytes(digest, 'big') + 1) / (2 ** 64 + 1)
+    return -volume.weight / math.log(point)
+
+
+def volume_for(file_hash: str) -> Volume:
+    """Выбрать том блоба взвешенным рандеву-хэшированием.
+
+    Место блоба вычисляется по одному хэшу, без обращения к базе,
+    а при добавлении тома переезжает только доля блобов нового тома.
+    """
+    if len(volumes) == 1:
+        return volumes[0]
+    return max(volumes, key=lambda volume: _volume_score(volume, file_hash))
+
+
+def _location_on(volume: Volume, file_hash: str) -> Path:
+    return volume.root / file_hash[:2] / file_hash[2:4] / file_hash
+
+
+def blob_location(file_hash: str) -> Path:
+    """Место, куда блоб записывается и куда его переносит ребалансировка."""
+    return _location_on(volume_for(file_hash), file_hash)
+
+
+def find_blob(file_hash: str) -> Path:
+    """Найти блоб для чтения или удаления.
+
+    После смены storage_volumes блоб лежит на прежнем томе, пока его
+    не перенесёт ребалансировка, поэтому при промахе проверяются
+    остальные тома. Если блоба нет нигде, возвращается его место.
+    """
+    location = blob_location(file_hash)
+    if len(volumes) == 1 or location.exists():
+        return location
+    for volume in volumes:
+        candidate = _location_on(volume, file_hash)
+        if candidate.exists():
+            return candidate
+    return location
+
+
+async def write_blob(
+        chunks: AsyncIterator[bytes],
+        filename: Optional[str] = None,
+) -> StoredFile:
+    """Записать поток во временный файл хранилища блобов.
+
+    Итоговое имя блоба известно только после подсчёта хэша, поэтому
+    файл переносится на место вызовом place_blob.
+    """
+    await run_in_storage(BLOBS_TMP_DIR.mkdir, parents=True, exist_ok=True)
+    return await write_temp(
+        chunks, BLOBS_TMP_DIR / f'{uuid.uuid4().hex}.part',
+        filename=filename, compress=True,
+    )
+
+
+def write_blob_sync(
+        source: BinaryIO,
+        filename: Optional[str] = None,
+        chunk_size: int = settings.storage_chunk_size,
+) -> StoredFile:
+    """Скопировать файловый объект во временный файл блоба целиком
+    в текущем потоке."""
+    BLOBS_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_location = BLOBS_TMP_DIR / f'{uuid.uuid4().hex}.part'
+    buffer = open(tmp_location, 'wb')
+    digest = hashlib.sha256()
+    encoder = None
+    size = 0
+    try:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if encoder is None:
+                encoder = Encoder(choose_codec(filename, chunk))
+            _write_chunk(buffer, digest, chunk, encoder)
+            size += len(chunk)
+        stored_size = _sync_and_close(buffer, encoder)
+    except BaseException:
+        _discard(buffer, tmp_location)
+        raise
+    return StoredFile(
+        tmp_location, size, digest.hexdigest(),
+        codec=encoder.codec if encoder is not None else None,
+        stored_size=stored_size,
+    )
+
+
+def _move_file(source: Path, location: Path) -> None:
+    """Атомарно переместить файл, в том числе на другой том."""
+    location.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(source, location)
+        return
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+    tmp_location = location.parent / f'.{uuid.uuid4().hex}.part'
+    try:
+        with open(source, 'rb') as src, open(tmp_location, 'wb') as dst:
+            shutil.copyfileobj(src, dst, settings.storage_chunk_size)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_location, location)
+    except BaseException:
+        _unlink(tmp_location)
+        raise
+    source.unlink()
+
+
+def _place_blob(tmp_location: Path, file_hash: str) -> Path:
+    location = blob_location(file_hash)
+    _move_file(tmp_location, location)
+    return location
+
+
+async def place_blob(tmp_location: Path, file_hash: str) -> Path:
+    return await run_in_storage(_place_blob, tmp_location, file_hash)
+
+
+async def read_blob_cached(file_hash: str, size: int) -> Optional[bytes]:
+    """Вернуть содержимое блоба из памяти, прочитав его при промахе.
+
+    Для блобов крупнее content_cache_max_file_size возвращает None.
+    """
+    if size > settings.content_cache_max_file_size:
+        return None
+    content = content_cache.get(file_hash)
+    if content is None:
+        content = await run_in_storage(
+            lambda: find_blob(file_hash).read_bytes()
+        )
+        content_cache.set(file_hash, content)
+    return content
+
+
+def _unlink(location: Path) -> bool:
+    try:
+        location.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+async def discard_temp(tmp_location: Path) -> None:
+    await run_in_storage(_unlink, tmp_location)
+
+
+def _remove_blobs(hashes: List[str]) -> int:
+    """Удалить блобы со всех томов: не перенесённая ребалансировкой
+    копия иначе осталась бы на диске навсегда."""
+    removed = 0
+    for file_hash in hashes:
+        content_cache.delete(file_hash)
+        removed += any([
+            _unlink(_location_on(volume, file_hash)) for volume in volumes
+        ])
+    return removed
+
+
+async def remove_blobs(hashes: List[str]) -> int:
+    if not hashes:
+        return 0
+    return await run_in_storage(_remove_blobs, hashes)
+
+
+def _remove_files(locations: List[Path]) -> int:
+    return sum(_unlink(location) for location in locations)
+
+
+def _prune_empty_dirs(directories: Iterable[Path]) -> None:
+    """Удалить опустевшие папки снизу вверх, не поднимаясь выше FILES_DIR."""
+    visited = set()
+    for directory in sorted(
+            set(directories), key=lambda item: len(item.parts), reverse=True):
+        while directory not in visited and FILES_DIR in directory.parents:
+            visited.add(directory)
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+            directory = directory.parent
+
+
+async def remove_files(
+        locations: List[Path],
+        batch_size: int = settings.delete_batch_size,
+) -> AsyncIterator[int]:
+    """Удалить файлы пачками в пуле хранилища, сообщая число удалённых.
+
+    Опустевшие папки удаляются одним проходом после всех файлов.
+    """
+    if not locations:
+        return
+    batches = [
+        locations[start:start + batch_size]
+        for start in range(0, len(locations), batch_size)
+    ]
+    for removed in asyncio.as_completed([
+        run_in_storage(_remove_files, batch) for batch in batches
+    ]):
+        yield await removed
+    await run_in_storage(
+        _prune_empty_dirs, (location.parent for location in locations)
+    )
+
+
+def _misplaced_blobs(volume: Volume) -> Iterator[Path]:
+    if not volume.root.is_dir():
+        return
+    for first in os.scandir(volume.root):
+        if not (first.is_dir() and len(first.name) == 2
+                and set(first.name) <= HEX_DIGITS):
+            continue
+        for second in os.scandir(first.path):
+            if not second.is_dir():
+                continue
+            for entry in os.scandir(second.path):
+                if (entry.is_file() and not entry.name.startswith('.')
+                        and volume_for(entry.name) != volume):
+                    yield Path(entry.path)
+
+
+def _move_blobs(locations: List[Path]) -> int:
+    moved = 0
+    for location in locations:
+        destination = blob_location(location.name)
+        try:
+            # Блоб на своём томе уже мог быть записан заново: он новее.
+            if destination.exists():
+                location.unlink()
+                continue
+            _move_file(location, destination)
+        except FileNotFoundError:
+            continue
+        moved += 1
+    return moved
+
+
+async def rebalance_blobs(
+        batch_size: int = settings.delete_batch_size,
+) -> AsyncIterator[int]:
+    """Перенести блобы, лежащие не на своём томе после смены
+    storage_volumes, сообщая число перенесённых."""
+    for volume in volumes:
+        misplaced = _misplaced_blobs(volume)
+        while True:
+            batch = await run_in_storage(
+                lambda: list(itertools.islice(misplaced, batch_size))
+            )
+            if not batch:
+                break
+            yield await run_in_storage(_move_blobs, batch)
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, List, Set
+
+from app.core.config import settings
+from app.core.db import get_async_session
+from app.core.storage import (
+    StoredFile, iter_file, run_in_storage, write_temp
+)
+from app.core.utils import BASE_DIR
+from app.crud.upload_session import upload_session_crud
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_DIR = BASE_DIR / 'files' / '.uploads'
+
+get_async_session_context = contextlib.asynccontextmanager(get_async_session)
+
+
+def chunks_total(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def expected_chunk_size(index: int, size: int, chunk_size: int) -> int:
+    return min(chunk_size, size - index * chunk_size)
+
+
+def session_dir(session_id) -> Path:
+    return UPLOADS_DIR / str(session_id)
+
+
+def chunk_location(session_id, index: int) -> Path:
+    return session_dir(session_id) / f'{index:08d}'
+
+
+async def write_chunk(
+        chunks: AsyncIterator[bytes],
+        session_id,
+        index: int,
+) -> StoredFile:
+    """Записать часть во временный файл каталога сессии.
+
+    Принятой часть становится только после place_chunk: обрезанное тело
+    иначе считалось бы полученной частью и попало бы в собранный файл.
+    """
+    directory = session_dir(session_id)
+    await run_in_storage(directory.mkdir, parents=True, exist_ok=True)
+    return await write_temp(
+        chunks, directory / f'.{index:08d}.{uuid.uuid4().hex}.part'
+    )
+
+
+async def place_chunk(
+        stored_chunk: StoredFile,
+        session_id,
+        index: int,
+) -> None:
+    await run_in_storage(
+        os.replace, stored_chunk.location, chunk_location(session_id, index)
+    )
+
+
+def _received_chunks(session_id) -> List[int]:
+    directory = session_dir(session_id)
+    if not directory.is_dir():
+        return []
+    return sorted(
+        int(name) for name in os.listdir(directory) if name.isdigit()
+    )
+
+
+async def received_chunks(session_id) -> List[int]:
+    return await run_in_storage(_received_chunks, session_id)
+
+
+async def iter_assembled(session_id, total: int) -> AsyncIterator[bytes]:
+    for index in range(total):
+        async for chunk in iter_file(chunk_location(session_id, index)):
+            yield chunk
+
+
+async def remove_session_dir(session_id) -> None:
+    await run_in_storage(
+        shutil.rmtree, session_dir(session_id), ignore_errors=True
+    )
+
+
+def _stale_dirs(active_ids: Set[str], ttl: int) -> List[str]:
+    if not UPLOADS_DIR.is_dir():
+        return []
+    deadline = time.time() - ttl
+    return [
+        name for name in os.listdir(UPLOADS_DIR)
+        if name not in active_ids
+        and os.path.getmtime(UPLOADS_DIR / name) < deadline
+    ]
+
+
+async def collect_abandoned_sessions() -> int:
+    async with get_async_session_context() as session:
+        expired = await upload_session_crud.get_expired(
+            settings.upload_session_ttl, session
+        )
+        for upload_session in expired:
+            await remove_session_dir(upload_session.id)
+            await session.delete(upload_session)
+        await session.commit()
+        active_ids = await upload_session_crud.get_ids(session)
+    stale = await run_in_storage(
+        _stale_dirs, set(active_ids), settings.upload_session_ttl
+    )
+    for name in stale:
+        await remove_session_dir(name)
+    return len(expired) + len(stale)
+
+
+async def run_upload_sessions_gc() -> None:
+    while True:
+        try:
+            removed = await collect_abandoned_sessions()
+            if removed:
+                logger.info('Removed %s abandoned upload sessions', removed)
+        except Exception:
+            logger.exception('Upload sessions garbage collection failed')
+        await asyncio.sleep(settings.upload_session_gc_interval)
@@ -1,15 +1,21 @@
-from typing import Union
+import time
+from typing import Any, Dict, Optional, Union
 import uuid
+
+import jwt
 from fastapi import Depends
 from fastapi_users import (
-    BaseUserManager, FastAPIUsers, UUIDIDMixin, InvalidPasswordException
+    BaseUserManager, FastAPIUsers, UUIDIDMixin, InvalidPasswordException,
+    exceptions
 )
 from fastapi_users.authentication import (
     AuthenticationBackend, BearerTransport, JWTStrategy
 )
+from fastapi_users.jwt import decode_jwt
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import LRUCache, publish_invalidation
 from app.core.config import settings
 from app.core.db import get_async_session
 from app.core.utils import USER_PASSWORD_LEN
@@ -17,15 +23,112 @@ from app.models.user import User
 from app.schemas.user import UserCreate
 
 
+user_cache = LRUCache(
+    'users', maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl
+)
+
+
+def user_snapshot(user: User) -> User:
+    """Копия пользователя, не привязанная ни к одной сессии."""
+    return User(**{
+        column.key: getattr(user, column.key)
+        for column in User.__table__.columns
+    })
+
+
+async def publish_user_invalidation(
+        session: AsyncSession,
+        user_id: uuid.UUID,
+) -> None:
+    """Сбросить снимки пользователя в остальных процессах после
+    фиксации транзакции: вызывать нужно до commit."""
+    await publish_invalidation(session, user_cache.name, [str(user_id)])
+
+
+class UserDatabase(SQLAlchemyUserDatabase):
+    """Пользователь может прийти из кэша процесса, и его снимок мог
+    устареть. Поэтому перед изменением строка перечитывается из базы,
+    а снимки в остальных процессах сбрасываются через NOTIFY."""
+
+    async def _reload(self, user: User) -> User:
+        db_user = await self.get(user.id)
+        if db_user is None:
+            raise exceptions.UserNotExists()
+        return db_user
+
+    async def update(self, user: User, update_dict: Dict[str, Any]) -> User:
+        user = await self._reload(user)
+        await publish_user_invalidation(self.session, user.id)
+        user = await super().update(user, update_dict)
+        user_cache.invalidate(str(user.id))
+        return user
+
+    async def delete(self, user: User) -> None:
+        user = await self._reload(user)
+        await publish_user_invalidation(self.session, user.id)
+        await super().delete(user)
+        user_cache.invalidate(str(user.id))
+
+
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
-    yield SQLAlchemyUserDatabase(session, User)
+    yield UserDatabase(session, User)
 
 
 bearer_transport = BearerTransport(tokenUrl='auth/jwt/login')
 
 
+class CachedJWTStrategy(JWTStrategy):
+    """Проверенные токены запоминаются вместе со снимком пользователя,
+    чтобы не читать его из базы на каждый запрос."""
+
+    async def read_token(
+            self,
+            token: Optional[str],
+            user_manager: BaseUserManager[User, uuid.UUID],
+    ) -> Optional[User]:
+        if token is None:
+            return None
+        user = user_cache.get(token)
+        if user is not None:
+            return user
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience,
+                algorithms=[self.algorithm],
+            )
+            user = await user_manager.get(
+                user_manager.parse_id(data['user_id'])
+            )
+        except (jwt.PyJWTError, KeyError,
+                exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+        # Запись не должна пережить сам токен.
+        ttl = data['exp'] - time.time() if 'exp' in data else None
+        user_cache.set(
+            token, user_snapshot(user), tag=str(user.id), ttl=ttl
+        )
+        return user
+
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=settings.secret, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=settings.secret, lifetime_seconds=3600)
+
+
+def token_user_id(token: str) -> Optional[str]:
+    """Id пользователя из токена без обращения к базе: токен уже
+    проверенного пользователя берётся из кэша, остальные — по подписи."""
+    user = user_cache.get(token)
+    if user is not None:
+        return str(user.id)
+    strategy = get_jwt_strategy()
+    try:
+        data = decode_jwt(
+            token, strategy.decode_key, strategy.token_audience,
+            algorithms=[strategy.algorithm],
+        )
+        return str(data['user_id'])
+    except (jwt.PyJWTError, KeyError):
+        return None
 
 
 auth_backend = AuthenticationBackend(
@@ -62,4 +165,5 @@ fastapi_users = FastAPIUsers[User, uuid.UUID](
 )
 
 current_user = fastapi_users.current_user(active=True)
+current_user_optional = fastapi_users.current_user(active=True, optional=True)
 current_superuser = fastapi_users.current_user(active=True, superuser=True)
@@ -1,61 +1,140 @@
+import base64
+import json
 import os
-import shutil
+import uuid
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import File
+from fastapi import UploadFile
 from pydantic import BaseModel
 
+from app.core.storage import (
+    BASE_DIR, FILES_DIR, StoredFile, find_blob, iter_upload_file,
+    remove_files, write_blob,
+)
 from app.schemas.downloaded_file import DownloadedFileDB
 
 VALUE_FOR_RANDOMIZER: int = 10
 USER_PASSWORD_LEN: int = 3
-stop_folder_name: str = 'files'
+STORAGE_ROOT: str = str(FILES_DIR)
+ROOT_FOLDER: str = '/'
+FILE_NAME_MAX_LENGTH: int = 100
+COPY_MARKER: str = '-copy-'
 
-BASE_DIR = Path(__file__).parent.parent.parent
+
+NDJSON_BATCH_SIZE: int = 64 * 1024
 
 
 class ResponseModel(BaseModel):
     account_id: str
     files: List[DownloadedFileDB]
+    next_cursor: Optional[str] = None
+
+
+def is_folder_path(path: str) -> bool:
+    return path.endswith('/') or '.' not in path.split('/')[-1]
+
+
+def get_folder_chain(path: str) -> List[str]:
+    """Папки пользователя, в которых лежит файл, от корня до ближайшей."""
+    if path.startswith(STORAGE_ROOT + '/'):
+        path = path[len(STORAGE_ROOT) + 1:]
+    folders = path.strip('/').split('/')[:-1]
+    return [ROOT_FOLDER] + [
+        '/' + '/'.join(folders[:depth])
+        for depth in range(1, len(folders) + 1)
+    ]
+
+
+def get_extension(filename: str) -> Optional[str]:
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return extension[:16] or None
+
+
+def get_copy_name(filename: str, token: str) -> str:
+    """Имя копии файла: имена файлов уникальны во всём хранилище."""
+    stem, extension = os.path.splitext(filename)
+    suffix = f'{COPY_MARKER}{token}{extension}'
+    return stem[:max(FILE_NAME_MAX_LENGTH - len(suffix), 0)] + suffix
+
+
+def escape_like(value: str) -> str:
+    return (
+        value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    )
+
 
+def encode_cursor(created_at: datetime, file_id: uuid.UUID) -> str:
+    raw = f'{created_at.isoformat()}|{file_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
 
-def delete_file_and_empty_folders(path, stop_folder_name):
-    if os.path.isfile(path):
-        os.remove(path)
 
-    directory = os.path.dirname(path)
-    while os.path.basename(directory) != stop_folder_name:
-        if not os.listdir(directory):
-            os.rmdir(directory)
-        else:
-            break
-        directory = os.path.dirname(directory)
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    created_at, file_id = base64.urlsafe_b64decode(
+        cursor.encode()
+    ).decode().split('|')
+    return datetime.fromisoformat(created_at), uuid.UUID(file_id)
+
+
+async def iter_ndjson(rows) -> AsyncIterator[bytes]:
+    batch = []
+    batch_size = 0
+    async for row in rows:
+        line = json.dumps({
+            'id': str(row.id),
+            'name': row.name,
+            'created_at': row.created_at.isoformat(),
+            'path': row.path,
+            'size': row.size,
+            'is_downloadable': row.is_downloadable,
+        }, ensure_ascii=False).encode() + b'\n'
+        batch.append(line)
+        batch_size += len(line)
+        if batch_size >= NDJSON_BATCH_SIZE:
+            yield b''.join(batch)
+            batch = []
+            batch_size = 0
+    if batch:
+        yield b''.join(batch)
 
 
 def create_path(path: str, filename: str) -> Path:
+    """Путь файла filename в хранилище.
+
+    path с '/' на конце — всегда папка, даже если в имени последней
+    папки есть точка, как в v1.0/. Без '/' на конце последний элемент
+    с точкой считается именем файла и заменяется на filename.
+    """
     path = path.lstrip('/')
-    file_location = BASE_DIR / 'files' / path
-    if str(file_location).endswith('/'):
-        return file_location / filename
-    elif not str(file_location).endswith('/'):
-        last_element = str(file_location).split('/')[-1]
-        if '.' in last_element:
-            directories = str(file_location).split('/')
-            directories.pop()
-            file_location = '/'.join(directory for directory in directories)
-            return Path(file_location)
-        if last_element != filename:
-            file_location = file_location / filename
-    return file_location
-
-
-def create_file_at_system_address(file_location: Path, filename: str,
-                                  file: File):
-    if os.path.isdir(file_location):
-        file_location = os.path.join(file_location, filename)
-    else:
-        os.makedirs(os.path.dirname(file_location), exist_ok=True)
-
-    with open(file_location, 'wb+') as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    folder, _, last_element = path.rpartition('/')
+    files_dir = BASE_DIR / 'files'
+    if '.' in last_element:
+        return files_dir / folder / filename
+    if last_element == filename:
+        return files_dir / path
+    return files_dir / path / filename
+
+
+async def create_file_at_system_address(file: UploadFile) -> StoredFile:
+    return await write_blob(iter_upload_file(file), file.filename)
+
+
+def get_system_address(db_file) -> Path:
+    if db_file.blob_hash is not None:
+        return find_blob(db_file.blob_hash)
+    return Path(db_file.path)
+
+
+def get_legacy_locations(db_files) -> List[Path]:
+    return [
+        Path(db_file.path) for db_file in db_files
+        if db_file.blob_hash is None
+    ]
+
+
+async def delete_legacy_files(db_files) -> int:
+    removed = 0
+    async for count in remove_files(get_legacy_locations(db_files)):
+        removed += count
+    return removed
@@ -0,0 +1,260 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    String, any_, bindparam, case, select, text, true, update
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.storage import StoredFile, remove_blobs
+from app.crud.base import CRUDBase
+from app.models import Blob
+
+logger = logging.getLogger(__name__)
+
+RELEASE_QUERY = text('''
+    UPDATE blob SET ref_count = blob.ref_count - released.count
+    FROM unnest(CAST(:hashes AS varchar[]), CAST(:counts AS integer[]))
+        AS released (hash, count)
+    WHERE blob.hash = released.hash
+''')
+
+RETAIN_QUERY = text('''
+    UPDATE blob SET ref_count = blob.ref_count + retained.count
+    FROM unnest(CAST(:hashes AS varchar[]), CAST(:counts AS integer[]))
+        AS retained (hash, count)
+    WHERE blob.hash = retained.hash
+''')
+
+
+class CRUDBlob(CRUDBase):
+    insert_batch_size: int = 5000
+
+    async def add_reference(
+            self,
+            stored_file: StoredFile,
+            session: AsyncSession,
+    ) -> Tuple[bool, Optional[str]]:
+        """Увеличить счётчик ссылок блоба, создав его при необходимости."""
+        added = await self.add_references({
+            stored_file.hash: (stored_file, 1)
+        }, session)
+        return added[stored_file.hash]
+
+    async def add_references(
+            self,
+            blobs: Dict[str, Tuple[StoredFile, int]],
+            session: AsyncSession,
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """Добавить ссылки сразу на несколько блобов одним запросом.
+
+        blobs сопоставляет хэшу записанный файл и число новых ссылок.
+        Для каждого хэша возвращает, нужно ли ещё положить содержимое
+        в хранилище, и кодек, с которым блоб хранится.
+        """
+        now = datetime.now()
+        items = sorted(blobs.items())
+        added = {}
+        for start in range(0, len(items), self.insert_batch_size):
+            statement = insert(Blob).values([
+                {'hash': file_hash, 'size': stored_file.size,
+                 'ref_count': count, 'created_at': now,
+                 'codec': stored_file.codec,
+                 'stored_size': stored_file.stored_size}
+                for file_hash, (stored_file, count)
+                in items[start:start + self.insert_batch_size]
+            ])
+            # Блоб без ссылок ещё может лежать на диске в ожидании сборки,
+            # но его файл будет заменён новым, поэтому берётся новый кодек.
+            is_orphan = Blob.ref_count <= 0
+            ref_counts = await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[Blob.hash],
+                    set_={
+                        'ref_count':
+                            Blob.ref_count + statement.excluded.ref_count,
+                        'codec': case(
+                            (is_orphan, statement.excluded.codec),
+                            else_=Blob.codec,
+                        ),
+                        'stored_size': case(
+                            (is_orphan, statement.excluded.stored_size),
+                            else_=Blob.stored_size,
+                        ),
+                    },
+                ).returning(Blob.hash, Blob.ref_count, Blob.codec)
+            )
+            for file_hash, ref_count, codec in ref_counts.all():
+                added[file_hash] = (ref_count == blobs[file_hash][1], codec)
+        return added
+
+    @staticmethod
+    async def _lock(clause, session: AsyncSession) -> None:
+        # Строки блокируются в порядке хэшей, чтобы параллельные изменения
+        # счётчиков не взаимоблокировались.
+        await session.execute(
+            select(Blob.hash).where(
+                clause
+            ).order_by(Blob.hash).with_for_update()
+        )
+
+    async def retain(
+            self,
+            hashes: Iterable[str],
+            session: AsyncSession,
+    ) -> None:
+        """Добавить ссылки на уже сохранённые блобы, например для копий."""
+        counts = Counter(file_hash for file_hash in hashes if file_hash)
+        if not counts:
+            return
+        retained = sorted(counts)
+        await self._lock(Blob.hash == any_(
+            bindparam('retained', retained, type_=ARRAY(String))
+        ), session)
+        await session.execute(RETAIN_QUERY, {
+            'hashes': retained,
+            'counts': [counts[file_hash] for file_hash in retained],
+        })
+
+    async def retain_grouped(self, refs, session: AsyncSession) -> None:
+        """То же для подзапроса со столбцами hash и count, не выгружая
+        хэши в приложение."""
+        await self._lock(Blob.hash.in_(select(refs.c.hash)), session)
+        await session.execute(
+            update(Blob).where(
+                Blob.hash == refs.c.hash
+            ).values(
+                ref_count=Blob.ref_count + refs.c.count
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def release(
+            self,
+            hashes: Iterable[str],
+            session: AsyncSession,
+    ) -> List[str]:
+        """Снять ссылки на блобы одним запросом.
+
+        Файлы не удаляются: после фиксации транзакции их убирает
+        remove_orphans по возвращённым хэшам или collect_orphans.
+        """
+        counts = Counter(file_hash for file_hash in hashes if file_hash)
+        if not counts:
+            return []
+        released = sorted(counts)
+        await self._lock(self._has_hash(released), session)
+        await session.execute(RELEASE_QUERY, {
+            'hashes': released,
+            'counts': [counts[file_hash] for file_hash in released],
+        })
+        return released
+
+    @staticmethod
+    def _has_hash(hashes: List[str]):
+        return Blob.hash == any_(
+            bindparam('hashes', hashes, type_=ARRAY(String))
+        )
+
+    async def remove_orphans(
+            self,
+            hashes: List[str],
+            session: AsyncSession,
+    ) -> List[str]:
+        """Удалить файлы блобов из hashes, оставшихся без ссылок.
+
+        Вызывается после фиксации транзакции, снявшей ссылки: откат
+        не может вернуть ссылку на уже удалённый файл. Ошибка здесь
+        оставляет лишь строку без ссылок, которую подберёт
+        collect_orphans или заново заполнит загрузка того же содержимого.
+        """
+        if not hashes:
+            return []
+        try:
+            removed = await self._remove_orphans(
+                self._has_hash(hashes), session
+            )
+            await session.commit()
+        except (SQLAlchemyError, OSError):
+            logger.exception('Failed to remove %s orphaned blobs', len(hashes))
+            await session.rollback()
+            return []
+        return removed
+
+    async def abandon(
+            self,
+            stored_files: List[StoredFile],
+            session: AsyncSession,
+    ) -> List[str]:
+        """Убрать блобы, положенные на диск транзакцией, которая
+        не зафиксировалась.
+
+        Удалить файл сразу нельзя: параллельная загрузка того же
+        содержимого могла уже положить свой. Поэтому блоб записывается
+        строкой без ссылок и удаляется под её блокировкой, только если
+        ссылок на него так и не появилось.
+        """
+        if not stored_files:
+            return []
+        now = datetime.now()
+        try:
+            await session.rollback()
+            await session.execute(insert(Blob).values([
+                {'hash': stored_file.hash, 'size': stored_file.size,
+                 'ref_count': 0, 'created_at': now,
+                 'codec': stored_file.codec,
+                 'stored_size': stored_file.stored_size}
+                for stored_file in stored_files
+            ]).on_conflict_do_nothing(index_elements=[Blob.hash]))
+            await session.commit()
+        except (SQLAlchemyError, OSError):
+            logger.exception(
+                'Failed to record %s abandoned blobs', len(stored_files)
+            )
+            await session.rollback()
+            return []
+        return await self.remove_orphans(
+            sorted(stored_file.hash for stored_file in stored_files), session
+        )
+
+    async def _remove_orphans(
+            self,
+            clause,
+            session: AsyncSession,
+            limit: Optional[int] = None,
+    ) -> List[str]:
+        """Удалить блобы без ссылок вместе с файлами.
+
+        Файлы удаляются до фиксации транзакции: строка блоба заблокирована,
+        поэтому параллельная загрузка того же содержимого дождётся окончания
+        удаления и положит файл заново. Если фиксация не удастся, строка
+        останется без ссылок и без файла, а первая же загрузка того же
+        содержимого положит файл заново.
+        """
+        orphans = select(Blob.hash).where(
+            clause, Blob.ref_count <= 0
+        ).limit(limit).with_for_update(skip_locked=True)
+        blob_table = Blob.__table__
+        removed = await session.execute(
+            blob_table.delete().where(
+                blob_table.c.hash.in_(orphans.scalar_subquery())
+            ).returning(blob_table.c.hash)
+        )
+        removed = removed.scalars().all()
+        await remove_blobs(removed)
+        return removed
+
+    async def collect_orphans(
+            self,
+            session: AsyncSession,
+            limit: int,
+    ) -> List[str]:
+        removed = await self._remove_orphans(true(), session, limit)
+        await session.commit()
+        return removed
+
+
+blob_crud = CRUDBlob(Blob)
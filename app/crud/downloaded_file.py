@@ -1,15 +1,167 @@
+import asyncio
+import uuid
 from datetime import datetime
-from typing import List, Optional
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
 
 from pydantic import UUID4
-from sqlalchemy import select
+from sqlalchemy import (
+    bindparam, func, insert, literal, select, text, tuple_, update
+)
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import LRUCache, publish_invalidation
+from app.core.config import settings
+from app.core.db import read_only, reads_from_replica
+from app.core.storage import StoredFile, discard_temp, place_blob
+from app.core.utils import (
+    COPY_MARKER, FILE_NAME_MAX_LENGTH, STORAGE_ROOT, escape_like,
+    get_extension, get_folder_chain, get_system_address
+)
 from app.crud.base import CRUDBase
-from app.models import DownloadedFile
+from app.crud.blob import blob_crud
+from app.crud.folder import folder_crud
+from app.crud.usage_counter import usage_counter_crud
+from app.models import DownloadedFile, Folder
+
+INVALID_REGULAR_EXPRESSION: str = '2201B'
+
+# Копии получают имя с меткой операции, как в get_copy_name: имена файлов
+# уникальны во всём хранилище.
+COPY_SUBTREE_QUERY = text('''
+    INSERT INTO downloadedfile (
+        id, name, created_at, path, size, extension, hash, codec,
+        blob_hash, is_downloadable, user_id, folder_id
+    )
+    SELECT gen_random_uuid(), copied.name, :created_at,
+           :new_prefix || substr(
+               regexp_replace(source.path, '[^/]*$', ''), :old_length + 1
+           ) || copied.name,
+           source.size, source.extension, source.hash, source.codec,
+           source.blob_hash, source.is_downloadable, source.user_id,
+           new_folder.id
+    FROM downloadedfile AS source
+    JOIN folder AS old_folder ON old_folder.id = source.folder_id
+    JOIN folder AS new_folder
+        ON new_folder.user_id = source.user_id
+       AND new_folder.path
+           = :new_folder || substr(old_folder.path, :old_folder_length + 1)
+    CROSS JOIN LATERAL (
+        SELECT coalesce(substring(source.name from '.(\\.[^.]*)$'), '')
+            AS extension
+    ) AS parts
+    CROSS JOIN LATERAL (
+        SELECT left(
+                   left(source.name,
+                        length(source.name) - length(parts.extension)),
+                   greatest(:max_length - length(:suffix)
+                            - length(parts.extension), 0)
+               ) || :suffix || parts.extension AS name
+    ) AS copied
+    WHERE source.user_id = :user_id AND source.path LIKE :old_pattern
+''')
+
+
+class InvalidRegex(ValueError):
+    pass
 
 
 class CRUDDownloadedFile(CRUDBase):
+    listing_columns = (
+        DownloadedFile.id,
+        DownloadedFile.name,
+        DownloadedFile.created_at,
+        DownloadedFile.path,
+        DownloadedFile.size,
+        DownloadedFile.is_downloadable,
+    )
+    stream_batch_size: int = 1000
+    cache = LRUCache(
+        'files', maxsize=settings.files_cache_size, ttl=settings.files_cache_ttl
+    )
+
+    @staticmethod
+    def _cache_tags(db_files) -> List[str]:
+        tags = []
+        for db_file in db_files:
+            tags += [str(db_file.id), f'name:{db_file.name}']
+        return tags
+
+    @staticmethod
+    def _cache_ttl() -> Optional[float]:
+        # Реплика отстаёт: прочитанное из неё могло уже устареть, и
+        # в кэше оно должно жить не дольше, чем длится отставание.
+        return settings.replica_cache_ttl if reads_from_replica() else None
+
+    @staticmethod
+    def _snapshot(db_file: DownloadedFile) -> DownloadedFile:
+        return DownloadedFile(**{
+            column.key: getattr(db_file, column.key)
+            for column in DownloadedFile.__table__.columns
+        })
+
+    @read_only
+    async def get(
+            self,
+            obj_id: UUID4,
+            session: AsyncSession,
+    ) -> Optional[DownloadedFile]:
+        """Вернуть файл по id. Из кэша приходит копия, не привязанная
+        к сессии: для изменения её нужно присоединить через merge."""
+        db_file = self.cache.get(('row', obj_id))
+        if db_file is not None:
+            return db_file
+        db_file = await super().get(obj_id, session)
+        if db_file is not None:
+            self.cache.set(
+                ('row', obj_id), self._snapshot(db_file), tag=str(obj_id),
+                ttl=self._cache_ttl(),
+            )
+        return db_file
+
+    def _my_files_query(
+            self,
+            user_id: UUID4,
+            after: Optional[Tuple[datetime, UUID4]] = None,
+    ):
+        query = select(*self.listing_columns).where(
+            DownloadedFile.user_id == user_id
+        )
+        if after is not None:
+            query = query.where(
+                tuple_(DownloadedFile.created_at, DownloadedFile.id) > after
+            )
+        return query.order_by(DownloadedFile.created_at, DownloadedFile.id)
+
+    @read_only
+    async def get_my_page(
+            self,
+            user_id: UUID4,
+            limit: int,
+            session: AsyncSession,
+            after: Optional[Tuple[datetime, UUID4]] = None,
+    ) -> List[Row]:
+        files = await session.execute(
+            self._my_files_query(user_id, after).limit(limit)
+        )
+        return files.all()
+
+    @read_only
+    async def stream_my(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+            after: Optional[Tuple[datetime, UUID4]] = None,
+    ) -> AsyncIterator[Row]:
+        files = await session.stream(
+            self._my_files_query(user_id, after).execution_options(
+                yield_per=self.stream_batch_size
+            )
+        )
+        async for row in files:
+            yield row
 
     async def get_my(
             self,
@@ -23,51 +175,551 @@ class CRUDDownloadedFile(CRUDBase):
         )
         return files.scalars().all()
 
+    @read_only
+    async def get_my_by_ids(
+            self,
+            user_id: UUID4,
+            file_ids: List[UUID4],
+            session: AsyncSession,
+    ) -> List[Row]:
+        files = await session.execute(
+            select(
+                DownloadedFile.id,
+                DownloadedFile.name,
+                DownloadedFile.path,
+                DownloadedFile.size,
+                DownloadedFile.created_at,
+                DownloadedFile.blob_hash,
+                DownloadedFile.codec,
+            ).where(
+                DownloadedFile.user_id == user_id,
+                DownloadedFile.id.in_(file_ids),
+            )
+        )
+        return files.all()
+
+    @staticmethod
+    def _path_prefix_clause(path_prefix: str):
+        # Префикс подставляется литералом, иначе при общем плане
+        # подготовленного запроса Postgres не сможет использовать индекс.
+        return DownloadedFile.path.like(
+            bindparam(
+                'path_prefix', escape_like(path_prefix) + '%',
+                literal_execute=True,
+            ),
+            escape='\\',
+        )
+
+    @staticmethod
+    def _folder_clauses(path_prefix: str, user_id: UUID4) -> list:
+        # Пути на диске не уникальны между пользователями: выборка
+        # по префиксу без владельца захватила бы чужие файлы.
+        return [
+            CRUDDownloadedFile._path_prefix_clause(path_prefix),
+            DownloadedFile.user_id == user_id,
+        ]
+
+    async def has_path_prefix(
+            self,
+            path_prefix: str,
+            session: AsyncSession,
+            user_id: UUID4,
+            legacy_only: bool = False,
+    ) -> bool:
+        statement = select(DownloadedFile.id).where(
+            *self._folder_clauses(path_prefix, user_id)
+        )
+        if legacy_only:
+            statement = statement.where(DownloadedFile.blob_hash.is_(None))
+        file_id = await session.execute(statement.limit(1))
+        return file_id.first() is not None
+
+    async def stream_by_path_prefix(
+            self,
+            path_prefix: str,
+            session: AsyncSession,
+            user_id: UUID4,
+    ) -> AsyncIterator[Row]:
+        files = await session.stream(
+            select(
+                DownloadedFile.path,
+                DownloadedFile.blob_hash,
+                DownloadedFile.codec,
+                DownloadedFile.size,
+                DownloadedFile.created_at,
+            ).where(
+                *self._folder_clauses(path_prefix, user_id)
+            ).order_by(DownloadedFile.path).execution_options(
+                yield_per=self.stream_batch_size
+            )
+        )
+        async for row in files:
+            yield row
+
+    @read_only
+    async def search(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+            query: Optional[str] = None,
+            regex: bool = False,
+            extension: Optional[str] = None,
+            path_prefix: Optional[str] = None,
+            order_by: str = 'created_at',
+            limit: int = 100,
+    ) -> List[Row]:
+        """Найти файлы пользователя.
+
+        Регулярное выражение проверяет база: в Postgres это оператор ~,
+        в SQLite — REGEXP, который SQLAlchemy связывает с re.search.
+        Синтаксис Postgres уже, чем у re, поэтому отвергнутое им
+        выражение превращается в InvalidRegex.
+        """
+        statement = select(*self.listing_columns).where(
+            DownloadedFile.user_id == user_id
+        )
+        if extension:
+            statement = statement.where(
+                DownloadedFile.extension == extension.lstrip('.').lower()
+            )
+        if path_prefix:
+            statement = statement.where(self._path_prefix_clause(path_prefix))
+        if query and regex:
+            statement = statement.where(DownloadedFile.name.regexp_match(query))
+        elif query:
+            statement = statement.where(DownloadedFile.name.ilike(
+                '%' + escape_like(query) + '%', escape='\\'
+            ))
+        column = getattr(DownloadedFile, order_by.lstrip('-'))
+        statement = statement.order_by(
+            column.desc() if order_by.startswith('-') else column,
+            DownloadedFile.id,
+        ).limit(limit)
+        try:
+            files = await session.execute(statement)
+        except DBAPIError as error:
+            code = getattr(error.orig, 'pgcode', None)
+            if code != INVALID_REGULAR_EXPRESSION:
+                raise
+            raise InvalidRegex(str(error.orig.__cause__ or error.orig))
+        return files.all()
+
     async def upload_file(
             self,
             file_name,
             path,
-            size,
+            stored_file: StoredFile,
             user,
             session: AsyncSession,
+            quota: Optional[int] = None,
     ):
         obj_in_data = dict()
         obj_in_data['name'] = file_name
         obj_in_data['created_at'] = datetime.now()
         obj_in_data['path'] = path
-        obj_in_data['size'] = size
+        obj_in_data['extension'] = get_extension(file_name)
+        obj_in_data['size'] = stored_file.size
+        obj_in_data['hash'] = stored_file.hash
+        obj_in_data['blob_hash'] = stored_file.hash
         obj_in_data['is_downloadable'] = True
         obj_in_data['user_id'] = user.id
         db_file = self.model(**obj_in_data)
+        folder = get_folder_chain(path)[-1]
+        placed = []
 
-        session.add(db_file)
-        await session.commit()
+        try:
+            await folder_crud.lock([user.id], session)
+            folder_ids = await folder_crud.ensure_folders(
+                user.id, [folder], session
+            )
+            db_file.folder_id = folder_ids[folder]
+            is_new_blob, db_file.codec = await blob_crud.add_reference(
+                stored_file, session
+            )
+            session.add(db_file)
+            await session.flush()
+            await usage_counter_crud.add_files([db_file], session, quota)
+            # Блоб кладётся на место, пока строка блоба заблокирована
+            # транзакцией: так он не пересечётся с удалением того же блоба.
+            if is_new_blob:
+                await place_blob(stored_file.location, stored_file.hash)
+                placed.append(stored_file)
+            tags = self._cache_tags([db_file])
+            await publish_invalidation(session, 'files', tags)
+            await session.commit()
+        except Exception:
+            await blob_crud.abandon(placed, session)
+            raise
+        finally:
+            await discard_temp(stored_file.location)
+        self.cache.invalidate_many(tags)
         await session.refresh(db_file)
         return db_file
 
+    async def get_existing_names(
+            self,
+            filenames: List[str],
+            session: AsyncSession,
+    ) -> List[str]:
+        names = await session.execute(
+            select(DownloadedFile.name).where(
+                DownloadedFile.name.in_(filenames)
+            )
+        )
+        return names.scalars().all()
+
+    async def upload_files(
+            self,
+            entries: List[Tuple[str, str, StoredFile]],
+            user,
+            session: AsyncSession,
+            quota: Optional[int] = None,
+    ) -> List[DownloadedFile]:
+        """Сохранить пакет файлов одной транзакцией.
+
+        entries — тройки (имя файла, путь, записанный временный файл).
+        """
+        now = datetime.now()
+        db_files = [
+            self.model(
+                id=uuid.uuid4(),
+                name=file_name,
+                created_at=now,
+                path=path,
+                extension=get_extension(file_name),
+                size=stored_file.size,
+                hash=stored_file.hash,
+                blob_hash=stored_file.hash,
+                is_downloadable=True,
+                user_id=user.id,
+            )
+            for file_name, path, stored_file in entries
+        ]
+        blobs = {}
+        for _, _, stored_file in entries:
+            first, count = blobs.get(stored_file.hash, (stored_file, 0))
+            blobs[stored_file.hash] = (first, count + 1)
+        placed = []
+        try:
+            await folder_crud.lock([user.id], session)
+            folder_ids = await folder_crud.ensure_folders(
+                user.id,
+                {get_folder_chain(db_file.path)[-1] for db_file in db_files},
+                session,
+            )
+            added = await blob_crud.add_references(blobs, session)
+            for db_file in db_files:
+                db_file.codec = added[db_file.blob_hash][1]
+                db_file.folder_id = folder_ids[
+                    get_folder_chain(db_file.path)[-1]
+                ]
+            await session.execute(
+                insert(DownloadedFile),
+                [
+                    {column.key: getattr(db_file, column.key)
+                     for column in DownloadedFile.__table__.columns}
+                    for db_file in db_files
+                ],
+            )
+            await usage_counter_crud.add_files(db_files, session, quota)
+            for file_hash, (is_new, _) in added.items():
+                if is_new:
+                    await place_blob(blobs[file_hash][0].location, file_hash)
+                    placed.append(blobs[file_hash][0])
+            tags = self._cache_tags(db_files)
+            await publish_invalidation(session, 'files', tags)
+            await session.commit()
+        except Exception:
+            await blob_crud.abandon(placed, session)
+            raise
+        finally:
+            await asyncio.gather(*(
+                discard_temp(stored_file.location)
+                for _, _, stored_file in entries
+            ))
+        self.cache.invalidate_many(tags)
+        return db_files
+
+    async def remove(
+            self,
+            db_obj: DownloadedFile,
+            session: AsyncSession,
+    ) -> DownloadedFile:
+        return (await self.remove_multi([db_obj], session))[0]
+
+    async def remove_multi(
+            self,
+            db_objs: List[DownloadedFile],
+            session: AsyncSession,
+    ) -> List[DownloadedFile]:
+        await folder_crud.lock(
+            {db_obj.user_id for db_obj in db_objs}, session
+        )
+        db_objs = [await session.merge(db_obj) for db_obj in db_objs]
+        for db_obj in db_objs:
+            # Путь мог измениться переносом папки после чтения записи.
+            await session.refresh(db_obj)
+            await session.delete(db_obj)
+        await session.flush()
+        await usage_counter_crud.remove_files(db_objs, session)
+        released = await blob_crud.release(
+            [db_obj.blob_hash for db_obj in db_objs], session
+        )
+        tags = self._cache_tags(db_objs)
+        await publish_invalidation(session, 'files', tags)
+        await session.commit()
+        self.cache.invalidate_many(tags)
+        await blob_crud.remove_orphans(released, session)
+        return db_objs
+
+    async def remove_by_user(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> List[Row]:
+        """Удалить все записи файлов пользователя одним запросом.
+
+        Файлы блобов и старые файлы остаются на диске: их удаляет
+        фоновая задача по возвращённым строкам.
+        """
+        file_table = DownloadedFile.__table__
+        await folder_crud.lock([user_id], session, exclusive=True)
+        deleted = await session.execute(
+            file_table.delete().where(
+                file_table.c.user_id == user_id
+            ).returning(
+                file_table.c.id, file_table.c.name,
+                file_table.c.path, file_table.c.blob_hash,
+            )
+        )
+        deleted = deleted.all()
+        await usage_counter_crud.reset(user_id, session)
+        await folder_crud.remove_by_user(user_id, session)
+        await blob_crud.release(
+            [row.blob_hash for row in deleted], session
+        )
+        tags = self._cache_tags(deleted)
+        await publish_invalidation(session, 'files', tags)
+        await session.commit()
+        self.cache.invalidate_many(tags)
+        return deleted
+
     async def get_file_id_by_name(
             self,
             filename: str,
             session: AsyncSession,
-    ) -> Optional[DownloadedFile]:
+    ) -> Optional[UUID4]:
+        file_id = self.cache.get(('name', filename))
+        if file_id is not None:
+            return file_id
         url = await session.execute(
             select(DownloadedFile.id).where(
                 DownloadedFile.name == filename
             )
         )
-        return url.scalars().first()
+        file_id = url.scalars().first()
+        if file_id is not None:
+            self.cache.set(('name', filename), file_id, tag=f'name:{filename}')
+        return file_id
 
     async def get_file_location_by_id(
             self,
             file_id: UUID4,
             session: AsyncSession,
+    ) -> Optional[Path]:
+        """Место файла на диске по id.
+
+        Путь и хеш блоба берутся из закэшированной в get строки, а том
+        блоба ищется при каждом вызове: ребалансировка переносит блобы,
+        не меняя записей в базе.
+        """
+        db_file = await self.get(file_id, session)
+        if db_file is None:
+            return None
+        return get_system_address(db_file)
+
+    @read_only
+    async def get_by_path(
+            self,
+            path: str,
+            session: AsyncSession,
     ) -> Optional[DownloadedFile]:
-        path = await session.execute(
-            select(DownloadedFile.path).where(
-                DownloadedFile.id == file_id
+        """Вернуть файл по пути. Как и в get, из кэша приходит копия,
+        не привязанная к сессии."""
+        db_file = self.cache.get(('path', path))
+        if db_file is not None:
+            return db_file
+        db_file = await session.execute(
+            select(DownloadedFile).where(
+                DownloadedFile.path == path
+            )
+        )
+        db_file = db_file.scalars().first()
+        if db_file is not None:
+            self.cache.set(
+                ('path', path), self._snapshot(db_file),
+                tag=str(db_file.id), ttl=self._cache_ttl(),
             )
+        return db_file
+
+    async def move_folder(
+            self,
+            folder: Folder,
+            path: str,
+            session: AsyncSession,
+    ) -> Folder:
+        """Перенести или переименовать папку со всем содержимым.
+
+        Меняются только записи в базе: блобы лежат по хэшу и от пути
+        не зависят.
+        """
+        await folder_crud.lock([folder.user_id], session, exclusive=True)
+        await session.refresh(folder)
+        old_path = folder.path
+        parent = get_folder_chain(path)[-1]
+        folder_ids = await folder_crud.ensure_folders(
+            folder.user_id, [parent], session
+        )
+        await folder_crud.move_subtree(
+            folder, path, folder_ids[parent], session
+        )
+        old_prefix = f'{STORAGE_ROOT}{old_path}/'
+        moved = await session.execute(
+            update(DownloadedFile).where(
+                *self._folder_clauses(old_prefix, folder.user_id)
+            ).values(
+                path=literal(f'{STORAGE_ROOT}{path}/') + func.substr(
+                    DownloadedFile.path, len(old_prefix) + 1
+                ),
+            ).returning(
+                DownloadedFile.id, DownloadedFile.name
+            ).execution_options(synchronize_session=False)
+        )
+        await usage_counter_crud.move_folder(
+            folder.user_id, old_path, path, session
+        )
+        tags = self._cache_tags(moved.all())
+        await publish_invalidation(session, 'files', tags)
+        await session.commit()
+        self.cache.invalidate_many(tags)
+        await session.refresh(folder)
+        return folder
+
+    async def _place_in_folder(
+            self,
+            db_file: DownloadedFile,
+            path: str,
+            name: str,
+            session: AsyncSession,
+    ) -> None:
+        folder = get_folder_chain(path)[-1]
+        folder_ids = await folder_crud.ensure_folders(
+            db_file.user_id, [folder], session
+        )
+        db_file.path = path
+        db_file.name = name
+        db_file.extension = get_extension(name)
+        db_file.folder_id = folder_ids[folder]
+
+    async def move_file(
+            self,
+            db_file: DownloadedFile,
+            path: str,
+            name: str,
+            session: AsyncSession,
+    ) -> DownloadedFile:
+        """Перенести или переименовать файл, не трогая его блоб."""
+        await folder_crud.lock([db_file.user_id], session)
+        db_file = await session.merge(db_file)
+        await session.refresh(db_file)
+        tags = self._cache_tags([db_file])
+        await usage_counter_crud.remove_files([db_file], session)
+        await self._place_in_folder(db_file, path, name, session)
+        await session.flush()
+        await usage_counter_crud.add_files([db_file], session)
+        tags += self._cache_tags([db_file])
+        await publish_invalidation(session, 'files', tags)
+        await session.commit()
+        self.cache.invalidate_many(tags)
+        await session.refresh(db_file)
+        return db_file
+
+    async def copy_file(
+            self,
+            db_file: DownloadedFile,
+            path: str,
+            name: str,
+            session: AsyncSession,
+            quota: Optional[int] = None,
+    ) -> DownloadedFile:
+        """Создать копию файла, добавив ссылку на тот же блоб."""
+        await folder_crud.lock([db_file.user_id], session, exclusive=True)
+        db_file = await session.merge(db_file)
+        await session.refresh(db_file)
+        copy = self.model(**{
+            column.key: getattr(db_file, column.key)
+            for column in DownloadedFile.__table__.columns
+        })
+        copy.id = uuid.uuid4()
+        copy.created_at = datetime.now()
+        await self._place_in_folder(copy, path, name, session)
+        await blob_crud.retain([copy.blob_hash], session)
+        session.add(copy)
+        await session.flush()
+        await usage_counter_crud.add_files([copy], session, quota)
+        await session.commit()
+        await session.refresh(copy)
+        return copy
+
+    async def copy_folder(
+            self,
+            folder: Folder,
+            path: str,
+            token: str,
+            session: AsyncSession,
+            quota: Optional[int] = None,
+    ) -> int:
+        """Скопировать папку со всем содержимым несколькими запросами
+        к базе, не читая файлы.
+
+        Копии ссылаются на те же блобы и получают имена с меткой token.
+        Возвращает число скопированных файлов.
+        """
+        await folder_crud.lock([folder.user_id], session, exclusive=True)
+        await session.refresh(folder)
+        parent = get_folder_chain(path)[-1]
+        folder_ids = await folder_crud.ensure_folders(
+            folder.user_id, [parent], session
+        )
+        await folder_crud.copy_subtree(
+            folder, path, folder_ids[parent], session
         )
-        return path.scalars().first()
+        old_prefix = f'{STORAGE_ROOT}{folder.path}/'
+        new_prefix = f'{STORAGE_ROOT}{path}/'
+        copied = await session.execute(COPY_SUBTREE_QUERY, {
+            'user_id': folder.user_id,
+            'created_at': datetime.now(),
+            'new_prefix': new_prefix,
+            'old_pattern': escape_like(old_prefix) + '%',
+            'old_length': len(old_prefix),
+            'new_folder': path,
+            'old_folder_length': len(folder.path),
+            'suffix': COPY_MARKER + token,
+            'max_length': FILE_NAME_MAX_LENGTH,
+        })
+        refs = select(
+            DownloadedFile.blob_hash.label('hash'),
+            func.count().label('count'),
+        ).where(
+            *self._folder_clauses(new_prefix, folder.user_id),
+            DownloadedFile.blob_hash.is_not(None),
+        ).group_by(DownloadedFile.blob_hash).subquery()
+        await blob_crud.retain_grouped(refs, session)
+        await usage_counter_crud.copy_folder(
+            folder.user_id, folder.path, path, session, quota
+        )
+        await session.commit()
+        return copied.rowcount
 
 
 downloaded_file_crud = CRUDDownloadedFile(DownloadedFile)
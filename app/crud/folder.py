@@ -0,0 +1,209 @@
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import UUID4
+from sqlalchemy import (
+    BigInteger, String, any_, bindparam, case, delete, func, literal, or_, select, text,
+    true, update
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.utils import ROOT_FOLDER, escape_like, get_folder_chain
+from app.crud.base import CRUDBase
+from app.models import Folder
+
+COPY_SUBTREE_QUERIES = (
+    text('''
+        INSERT INTO folder (id, user_id, name, path, created_at, parent_id)
+        SELECT gen_random_uuid(), user_id,
+               CASE WHEN id = :folder_id THEN :name ELSE name END,
+               :path || substr(path, :old_length + 1), :created_at,
+               CASE WHEN id = :folder_id THEN CAST(:parent_id AS uuid) END
+        FROM folder
+        WHERE user_id = :user_id
+          AND (path = :old_path OR path LIKE :old_pattern)
+    '''),
+    text('''
+        UPDATE folder AS child SET parent_id = parent.id
+        FROM folder AS parent
+        WHERE child.user_id = :user_id AND child.path LIKE :pattern
+          AND parent.user_id = child.user_id
+          AND parent.path = regexp_replace(child.path, '/[^/]*$', '')
+    '''),
+)
+
+
+def get_folder_ancestors(folder: str) -> List[str]:
+    """Цепочка папок от корня до folder включительно."""
+    if folder == ROOT_FOLDER:
+        return [ROOT_FOLDER]
+    return get_folder_chain(folder) + [folder]
+
+
+def get_folder_name(folder: str) -> str:
+    return folder.rsplit('/', 1)[-1]
+
+
+def subtree_clause(column, folder: str):
+    """Условие на саму папку и всё, что лежит внутри неё."""
+    if folder == ROOT_FOLDER:
+        return true()
+    return or_(column == folder, column.like(
+        bindparam(None, escape_like(folder) + '/%', literal_execute=True),
+        escape='\\',
+    ))
+
+
+def _lock_key(user_id: UUID4) -> int:
+    return int.from_bytes(user_id.bytes[:8], 'big', signed=True)
+
+
+class CRUDFolder(CRUDBase):
+
+    async def lock(
+            self,
+            user_ids: Iterable[UUID4],
+            session: AsyncSession,
+            exclusive: bool = False,
+    ) -> None:
+        """Заблокировать дерево папок пользователей до конца транзакции.
+
+        Загрузка и удаление файлов берут разделяемую блокировку,
+        перенос папки — исключительную: так файл не окажется по старому
+        пути в уже перенесённой папке.
+        """
+        lock = (
+            func.pg_advisory_xact_lock if exclusive
+            else func.pg_advisory_xact_lock_shared
+        )
+        for user_id in sorted(set(user_ids)):
+            await session.execute(
+                select(lock(literal(_lock_key(user_id), BigInteger)))
+            )
+
+    async def get_by_path(
+            self,
+            user_id: UUID4,
+            path: str,
+            session: AsyncSession,
+    ) -> Optional[Folder]:
+        folder = await session.execute(
+            select(Folder).where(
+                Folder.user_id == user_id,
+                Folder.path == path,
+            )
+        )
+        return folder.scalars().first()
+
+    async def ensure_folders(
+            self,
+            user_id: UUID4,
+            folders: Iterable[str],
+            session: AsyncSession,
+    ) -> Dict[str, UUID4]:
+        """Создать недостающие папки вместе с родителями.
+
+        Возвращает идентификаторы всех папок цепочек. Когда все папки
+        уже есть, обходится одним запросом.
+        """
+        paths = set()
+        for folder in folders:
+            paths.update(get_folder_ancestors(folder))
+        existing = await session.execute(
+            select(Folder.path, Folder.id).where(
+                Folder.user_id == user_id,
+                Folder.path == any_(
+                    bindparam('paths', sorted(paths), type_=ARRAY(String))
+                ),
+            )
+        )
+        folder_ids = dict(existing.all())
+        missing = sorted(
+            paths - folder_ids.keys(),
+            key=lambda path: (len(get_folder_ancestors(path)), path),
+        )
+        now = datetime.now()
+        for _, level in groupby(
+                missing, key=lambda path: len(get_folder_ancestors(path))):
+            statement = insert(Folder).values([
+                {'user_id': user_id, 'path': path,
+                 'name': get_folder_name(path), 'created_at': now,
+                 'parent_id': (
+                     None if path == ROOT_FOLDER
+                     else folder_ids[get_folder_chain(path)[-1]]
+                 )}
+                for path in level
+            ])
+            created = await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[Folder.user_id, Folder.path],
+                    set_={'name': statement.excluded.name},
+                ).returning(Folder.path, Folder.id)
+            )
+            folder_ids.update(created.all())
+        return folder_ids
+
+    async def move_subtree(
+            self,
+            folder: Folder,
+            path: str,
+            parent_id: UUID4,
+            session: AsyncSession,
+    ) -> None:
+        """Переписать пути папки и всех вложенных папок."""
+        old_path = folder.path
+        await session.execute(
+            update(Folder).where(
+                Folder.user_id == folder.user_id,
+                subtree_clause(Folder.path, old_path),
+            ).values(
+                path=literal(path) + func.substr(
+                    Folder.path, len(old_path) + 1
+                ),
+                name=case(
+                    (Folder.id == folder.id, get_folder_name(path)),
+                    else_=Folder.name,
+                ),
+                parent_id=case(
+                    (Folder.id == folder.id, parent_id),
+                    else_=Folder.parent_id,
+                ),
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def copy_subtree(
+            self,
+            folder: Folder,
+            path: str,
+            parent_id: UUID4,
+            session: AsyncSession,
+    ) -> None:
+        """Создать копию папки и всех вложенных папок по новому пути."""
+        params = {
+            'user_id': folder.user_id,
+            'folder_id': folder.id,
+            'parent_id': parent_id,
+            'name': get_folder_name(path),
+            'path': path,
+            'pattern': escape_like(path) + '/%',
+            'old_path': folder.path,
+            'old_pattern': escape_like(folder.path) + '/%',
+            'old_length': len(folder.path),
+            'created_at': datetime.now(),
+        }
+        for query in COPY_SUBTREE_QUERIES:
+            await session.execute(query, params)
+
+    async def remove_by_user(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> None:
+        await session.execute(
+            delete(Folder).where(Folder.user_id == user_id)
+        )
+
+
+folder_crud = CRUDFolder(Folder)
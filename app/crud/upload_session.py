@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from typing import List
+
+from pydantic import UUID4
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models import UploadSession
+
+
+class CRUDUploadSession(CRUDBase):
+
+    async def create(
+            self,
+            path: str,
+            filename: str,
+            size: int,
+            chunk_size: int,
+            user,
+            session: AsyncSession,
+    ) -> UploadSession:
+        now = datetime.now()
+        upload_session = self.model(
+            path=path,
+            filename=filename,
+            size=size,
+            chunk_size=chunk_size,
+            created_at=now,
+            updated_at=now,
+            user_id=user.id,
+        )
+        session.add(upload_session)
+        await session.commit()
+        await session.refresh(upload_session)
+        return upload_session
+
+    async def touch(
+            self,
+            upload_session: UploadSession,
+            session: AsyncSession,
+    ) -> None:
+        await session.execute(
+            update(UploadSession).where(
+                UploadSession.id == upload_session.id
+            ).values(updated_at=datetime.now())
+        )
+        await session.commit()
+
+    async def get_expired(
+            self,
+            ttl: int,
+            session: AsyncSession,
+    ) -> List[UploadSession]:
+        expired = await session.execute(
+            select(UploadSession).where(
+                UploadSession.updated_at < datetime.now() - timedelta(seconds=ttl)
+            )
+        )
+        return expired.scalars().all()
+
+    async def get_reserved(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> int:
+        reserved = await session.execute(
+            select(func.coalesce(func.sum(UploadSession.size), 0)).where(
+                UploadSession.user_id == user_id
+            )
+        )
+        return reserved.scalar()
+
+    async def get_ids(
+            self,
+            session: AsyncSession,
+    ) -> List[str]:
+        ids = await session.execute(select(UploadSession.id))
+        return [str(session_id) for session_id in ids.scalars().all()]
+
+
+upload_session_crud = CRUDUploadSession(UploadSession)
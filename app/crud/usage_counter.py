@@ -0,0 +1,256 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import UUID4
+from sqlalchemy import delete, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.utils import (
+    ROOT_FOLDER, STORAGE_ROOT, escape_like, get_folder_chain
+)
+from app.crud.base import CRUDBase
+from app.crud.folder import subtree_clause
+from app.models import UsageCounter
+
+UsageDelta = Dict[Tuple[UUID4, str], List[int]]
+
+REBUILD_QUERY = text('''
+    INSERT INTO usagecounter (user_id, folder, used, files)
+    SELECT user_id,
+           '/' || array_to_string(parts[1:depth], '/') AS folder,
+           coalesce(sum(size), 0),
+           count(*)
+    FROM (
+        SELECT user_id, size,
+               string_to_array(trim(both '/' from CASE
+                   WHEN left(path, :root_length + 1) = :storage_root || '/'
+                   THEN substr(path, :root_length + 2)
+                   ELSE path
+               END), '/') AS parts
+        FROM downloadedfile
+        WHERE (CAST(:user_id AS uuid) IS NULL OR user_id = :user_id)
+    ) AS files,
+    generate_series(0, coalesce(array_length(parts, 1), 1) - 1) AS depth
+    GROUP BY user_id, folder
+''')
+
+COPY_SUBTREE_QUERY = text('''
+    INSERT INTO usagecounter (user_id, folder, used, files)
+    SELECT user_id, :new_folder || substr(folder, :old_length + 1),
+           used, files
+    FROM usagecounter
+    WHERE user_id = :user_id AND files > 0
+      AND (folder = :old_folder OR folder LIKE :old_pattern)
+    ON CONFLICT (user_id, folder) DO UPDATE
+    SET used = usagecounter.used + excluded.used,
+        files = usagecounter.files + excluded.files
+''')
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def usage_delta(files: Iterable, sign: int = 1) -> UsageDelta:
+    delta: UsageDelta = defaultdict(lambda: [0, 0])
+    for file in files:
+        for folder in get_folder_chain(file.path):
+            delta[(file.user_id, folder)][0] += sign * (file.size or 0)
+            delta[(file.user_id, folder)][1] += sign
+    return delta
+
+
+class CRUDUsageCounter(CRUDBase):
+
+    async def apply(
+            self,
+            delta: UsageDelta,
+            session: AsyncSession,
+    ) -> Dict[UUID4, int]:
+        """Применить изменения счётчиков одним запросом.
+
+        Строки обновляются в фиксированном порядке, чтобы параллельные
+        транзакции не взаимоблокировались. Возвращает новый объём
+        корневых папок затронутых пользователей.
+        """
+        if not delta:
+            return {}
+        statement = insert(UsageCounter).values([
+            {'user_id': user_id, 'folder': folder, 'used': used,
+             'files': files}
+            for (user_id, folder), (used, files) in sorted(
+                delta.items(), key=lambda item: (str(item[0][0]), item[0][1])
+            )
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[UsageCounter.user_id, UsageCounter.folder],
+            set_={
+                'used': UsageCounter.used + statement.excluded.used,
+                'files': UsageCounter.files + statement.excluded.files,
+            },
+        ).returning(UsageCounter.user_id, UsageCounter.folder,
+                    UsageCounter.used)
+        counters = await session.execute(statement)
+        return {
+            user_id: used for user_id, folder, used in counters.all()
+            if folder == ROOT_FOLDER
+        }
+
+    async def add_files(
+            self,
+            files: Iterable,
+            session: AsyncSession,
+            quota: Optional[int] = None,
+    ) -> None:
+        used = await self.apply(usage_delta(files), session)
+        if quota is not None and any(value > quota for value in used.values()):
+            raise QuotaExceeded
+
+    async def remove_files(
+            self,
+            files: Iterable,
+            session: AsyncSession,
+    ) -> None:
+        await self.apply(usage_delta(files, sign=-1), session)
+
+    async def move_folder(
+            self,
+            user_id: UUID4,
+            old_folder: str,
+            new_folder: str,
+            session: AsyncSession,
+    ) -> None:
+        """Перенести счётчики поддерева папки и пересчитать предков.
+
+        В новом месте могут остаться только пустые счётчики папок,
+        файлы из которых уже удалены: они заменяются перенесёнными.
+        """
+        total = await session.execute(
+            select(UsageCounter.used, UsageCounter.files).where(
+                UsageCounter.user_id == user_id,
+                UsageCounter.folder == old_folder,
+            )
+        )
+        total = total.first()
+        await session.execute(
+            delete(UsageCounter).where(
+                UsageCounter.user_id == user_id,
+                subtree_clause(UsageCounter.folder, new_folder),
+            ).execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            update(UsageCounter).where(
+                UsageCounter.user_id == user_id,
+                subtree_clause(UsageCounter.folder, old_folder),
+            ).values(
+                folder=literal(new_folder) + func.substr(
+                    UsageCounter.folder, len(old_folder) + 1
+                ),
+            ).execution_options(synchronize_session=False)
+        )
+        if total is None:
+            return
+        old_chain = set(get_folder_chain(old_folder))
+        new_chain = set(get_folder_chain(new_folder))
+        delta: UsageDelta = {}
+        for folder in old_chain - new_chain:
+            delta[(user_id, folder)] = [-total.used, -total.files]
+        for folder in new_chain - old_chain:
+            delta[(user_id, folder)] = [total.used, total.files]
+        await self.apply(delta, session)
+
+    async def copy_folder(
+            self,
+            user_id: UUID4,
+            old_folder: str,
+            new_folder: str,
+            session: AsyncSession,
+            quota: Optional[int] = None,
+    ) -> None:
+        """Завести счётчики для копии поддерева папки."""
+        total = await self.get_counter(user_id, old_folder, session)
+        if total is None or not total.files:
+            return
+        await session.execute(COPY_SUBTREE_QUERY, {
+            'user_id': user_id,
+            'new_folder': new_folder,
+            'old_folder': old_folder,
+            'old_pattern': escape_like(old_folder) + '/%',
+            'old_length': len(old_folder),
+        })
+        delta: UsageDelta = {
+            (user_id, folder): [total.used, total.files]
+            for folder in get_folder_chain(new_folder)
+        }
+        used = await self.apply(delta, session)
+        if quota is not None and any(value > quota for value in used.values()):
+            raise QuotaExceeded
+
+    async def reset(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> None:
+        await session.execute(
+            delete(UsageCounter).where(UsageCounter.user_id == user_id)
+        )
+
+    async def get_used(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> int:
+        used = await session.execute(
+            select(UsageCounter.used).where(
+                UsageCounter.user_id == user_id,
+                UsageCounter.folder == ROOT_FOLDER,
+            )
+        )
+        return used.scalar() or 0
+
+    async def get_counter(
+            self,
+            user_id: UUID4,
+            folder: str,
+            session: AsyncSession,
+    ) -> Optional[UsageCounter]:
+        counter = await session.execute(
+            select(UsageCounter).where(
+                UsageCounter.user_id == user_id,
+                UsageCounter.folder == folder,
+            )
+        )
+        return counter.scalars().first()
+
+    async def get_user_counters(
+            self,
+            user_id: UUID4,
+            session: AsyncSession,
+    ) -> List[UsageCounter]:
+        counters = await session.execute(
+            select(UsageCounter).where(
+                UsageCounter.user_id == user_id,
+                UsageCounter.files > 0,
+            ).order_by(UsageCounter.folder)
+        )
+        return counters.scalars().all()
+
+    async def rebuild(
+            self,
+            session: AsyncSession,
+            user_id: Optional[UUID4] = None,
+    ) -> None:
+        statement = delete(UsageCounter)
+        if user_id is not None:
+            statement = statement.where(UsageCounter.user_id == user_id)
+        await session.execute(statement)
+        await session.execute(REBUILD_QUERY, {
+            'root_length': len(STORAGE_ROOT),
+            'storage_root': STORAGE_ROOT,
+            'user_id': user_id,
+        })
+        await session.commit()
+
+
+usage_counter_crud = CRUDUsageCounter(UsageCounter)
@@ -1,38 +1,85 @@
+import asyncio
 from http import HTTPStatus
 
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy.sql import func
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 
 from app.api.routers import main_router
+from app.core.admission import AdmissionMiddleware
 from app.core.config import settings
-from app.core.db import get_async_session
+from app.core.cache import run_invalidation_listener
+from app.core.diagnostics import DiagnosticsMiddleware, run_loop_monitor
+from app.core.health import check_health, is_healthy
 from app.core.init_db import create_first_superuser
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.core.upload_sessions import run_upload_sessions_gc
+from app.crud.usage_counter import QuotaExceeded
 
 app = FastAPI(title=settings.app_title)
 
 app.include_router(main_router)
 
+app.add_middleware(DiagnosticsMiddleware)
+app.add_middleware(AdmissionMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+
+background_tasks = set()
+
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        content={'detail': 'Превышена квота на объём файлов пользователя!'},
+    )
+
 
 @app.on_event('startup')
 async def startup():
     await create_first_superuser()
+    background_tasks.add(asyncio.create_task(run_upload_sessions_gc()))
+    background_tasks.add(asyncio.create_task(run_loop_monitor()))
+    if settings.cache_invalidation_channel:
+        background_tasks.add(
+            asyncio.create_task(run_invalidation_listener())
+        )
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
 
 
 @app.get(
     '/ping',
     tags=['ping'],
-    description='Проверить подключение к базе данных.',
+    description='Время доступа к связанным сервисам в миллисекундах:'
+                ' базе данных, пулу соединений, томам хранилища и кэшам.'
+                ' Если недоступен критичный сервис, ответ — 503.',
 )
-async def ping_db(session: AsyncSession = Depends(get_async_session)):
-    try:
-        result = await session.execute(select(func.now()))
-        current_time = result.scalar_one_or_none()
-        if current_time:
-            return {'status': 'ok', 'timestamp': current_time}
-        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-                            detail='Database error')
-    except Exception as e:
-        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-                            detail=str(e))
+async def ping():
+    results = await check_health()
+    content = {
+        'status': 'ok' if is_healthy(results) else 'fail',
+        **{name: result['ms'] for name, result in results.items()},
+        'probes': results,
+    }
+    return JSONResponse(
+        content,
+        status_code=(
+            HTTPStatus.OK if content['status'] == 'ok'
+            else HTTPStatus.SERVICE_UNAVAILABLE
+        ),
+    )
+
+if settings.metrics_enabled:
+    @app.get(
+        '/metrics',
+        tags=['ping'],
+        description='Метрики процесса в текстовом формате Prometheus.',
+    )
+    async def metrics():
+        return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -1,2 +1,7 @@
+from .admission import AdmissionBucket, AdmissionLease  # noqa
+from .blob import Blob  # noqa
 from .downloaded_file import DownloadedFile  # noqa
+from .folder import Folder  # noqa
+from .upload_session import UploadSession  # noqa
+from .usage_counter import UsageCounter  # noqa
 from .user import User  # noqa
@@ -0,0 +1,25 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.core.db import Base
+
+
+class AdmissionBucket(Base):
+    """Общее для всех процессов ведро токенов ограничителя запросов."""
+    key = Column(String(128), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Состояние ограничителя можно потерять при сбое: оно восстановится
+    # само, а журналировать его незачем.
+    __table_args__ = {'prefixes': ['UNLOGGED']}
+
+
+class AdmissionLease(Base):
+    """Занятое место одновременной загрузки."""
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    key = Column(String(128), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = {'prefixes': ['UNLOGGED']}
@@ -0,0 +1,16 @@
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String
+
+from app.core.db import Base
+
+
+class Blob(Base):
+    hash = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime)
+    codec = Column(String(16))
+    stored_size = Column(BigInteger)
+
+    __table_args__ = (
+        Index('ix_blob_orphans', 'hash', postgresql_where=ref_count <= 0),
+    )
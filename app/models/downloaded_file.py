@@ -1,6 +1,8 @@
 import uuid
 
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Boolean
+from sqlalchemy import (
+    BigInteger, Column, ForeignKey, Index, String, DateTime, Boolean
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils import UUIDType
@@ -13,8 +15,24 @@ class DownloadedFile(Base):
                 unique=True)
     name = Column(String(100), unique=True, nullable=False)
     created_at = Column(DateTime)
-    path = Column(String(100))
-    size = Column(Integer)
+    path = Column(String(1024))
+    size = Column(BigInteger)
+    extension = Column(String(16))
+    hash = Column(String(64))
+    codec = Column(String(16))
+    blob_hash = Column(
+        String(64),
+        ForeignKey('blob.hash', name='fk_downloadedfile_blob_hash_blob'),
+        index=True,
+    )
+    folder_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(
+            'folder.id', name='fk_downloadedfile_folder_id_folder',
+            ondelete='SET NULL',
+        ),
+        index=True,
+    )
     is_downloadable = Column(Boolean, default=True, nullable=False)
     user_id = Column(
         UUIDType,
@@ -22,3 +40,20 @@ class DownloadedFile(Base):
         nullable=False,
     )
     user = relationship('User', back_populates='downloaded_files')
+
+    __table_args__ = (
+        Index(
+            'ix_downloadedfile_user_id_created_at_id',
+            'user_id', 'created_at', 'id',
+        ),
+        Index('ix_downloadedfile_user_id_extension', 'user_id', 'extension'),
+        Index(
+            'ix_downloadedfile_user_id_path', 'user_id', 'path',
+            postgresql_ops={'path': 'text_pattern_ops'},
+        ),
+        Index(
+            'ix_downloadedfile_name_trgm', 'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+        ),
+    )
@@ -0,0 +1,36 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from sqlalchemy_utils import UUIDType
+
+from app.core.db import Base
+
+
+class Folder(Base):
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(255), nullable=False)
+    path = Column(String(1024), nullable=False)
+    created_at = Column(DateTime)
+    parent_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey(
+            'folder.id', name='fk_folder_parent_id_folder',
+            ondelete='CASCADE',
+        ),
+        index=True,
+    )
+    user_id = Column(
+        UUIDType,
+        ForeignKey('user.id', name='fk_folder_user_id_user'),
+        nullable=False,
+    )
+    user = relationship('User', back_populates='folders')
+
+    __table_args__ = (
+        Index(
+            'ix_folder_user_id_path', 'user_id', 'path', unique=True,
+            postgresql_ops={'path': 'text_pattern_ops'},
+        ),
+    )
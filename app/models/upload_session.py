@@ -0,0 +1,24 @@
+import uuid
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from sqlalchemy_utils import UUIDType
+
+from app.core.db import Base
+
+
+class UploadSession(Base):
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    path = Column(String(1024), nullable=False)
+    filename = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False, index=True)
+    user_id = Column(
+        UUIDType,
+        ForeignKey('user.id', name='fk_uploadsession_user_id_user'),
+        nullable=False,
+    )
+    user = relationship('User', back_populates='upload_sessions')
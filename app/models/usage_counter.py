@@ -0,0 +1,17 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String
+from sqlalchemy.orm import relationship
+from sqlalchemy_utils import UUIDType
+
+from app.core.db import Base
+
+
+class UsageCounter(Base):
+    user_id = Column(
+        UUIDType,
+        ForeignKey('user.id', name='fk_usagecounter_user_id_user'),
+        primary_key=True,
+    )
+    folder = Column(String(1024), primary_key=True)
+    used = Column(BigInteger, default=0, nullable=False)
+    files = Column(Integer, default=0, nullable=False)
+    user = relationship('User', back_populates='usage_counters')
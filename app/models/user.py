@@ -10,3 +10,18 @@ class User(SQLAlchemyBaseUserTableUUID, Base):
         back_populates='user',
         cascade='all, delete-orphan'
     )
+    upload_sessions = relationship(
+        'UploadSession',
+        back_populates='user',
+        cascade='all, delete-orphan'
+    )
+    folders = relationship(
+        'Folder',
+        back_populates='user',
+        cascade='all, delete-orphan'
+    )
+    usage_counters = relationship(
+        'UsageCounter',
+        back_populates='user',
+        cascade='all, delete-orphan'
+    )
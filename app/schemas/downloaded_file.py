@@ -1,6 +1,9 @@
 from datetime import datetime
+from typing import List, Optional
 
-from pydantic import BaseModel, UUID4
+from pydantic import BaseModel, Field, UUID4
+
+from app.core.config import settings
 
 
 class DownloadedFileBase(BaseModel):
@@ -17,3 +20,59 @@ class DownloadedFileDB(DownloadedFileBase):
 
     class Config:
         orm_mode = True
+
+
+class BatchUploadResponse(BaseModel):
+    files: List[DownloadedFileDB]
+
+
+class SearchOptions(BaseModel):
+    path: Optional[str] = Field(None, example='/homework/')
+    folder_id: Optional[UUID4] = None
+    extension: Optional[str] = Field(None, max_length=16, example='txt')
+    order_by: str = Field(
+        'created_at', regex=r'^-?(name|created_at|path|size)$',
+        example='-size',
+    )
+    limit: int = Field(
+        settings.files_page_size, ge=1, le=settings.files_max_page_size
+    )
+    regex: bool = False
+
+
+class SearchRequest(BaseModel):
+    options: SearchOptions = SearchOptions()
+    query: Optional[str] = Field(None, max_length=256, example='notes')
+
+
+class SearchResponse(BaseModel):
+    matches: List[DownloadedFileDB]
+
+
+class SignedUrlRequest(BaseModel):
+    file_ids: List[UUID4] = Field(
+        ..., min_items=1, max_items=settings.signed_url_batch_size
+    )
+    expires_in: int = Field(
+        settings.signed_url_ttl, ge=1, le=settings.signed_url_max_ttl
+    )
+
+
+class SignedUrl(BaseModel):
+    id: UUID4
+    url: str
+    expires_at: datetime
+
+
+class SignedUrlResponse(BaseModel):
+    urls: List[SignedUrl]
+
+
+class TransferRequest(BaseModel):
+    source: str = Field(..., example='/homework/notes.txt')
+    destination: str = Field(..., example='/archive/')
+
+
+class TransferResponse(BaseModel):
+    path: str
+    files: int
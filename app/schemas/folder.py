@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field, UUID4
+
+
+class FolderUpdate(BaseModel):
+    path: str = Field(..., max_length=1000, example='/archive/homework')
+
+
+class FolderDB(BaseModel):
+    id: UUID4
+    name: str
+    path: str
+    parent_id: Optional[UUID4]
+    created_at: Optional[datetime]
+    used: int = 0
+    files: int = 0
+
+    class Config:
+        orm_mode = True
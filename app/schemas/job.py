@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, UUID4
+
+from app.core.jobs import JobStatus
+
+
+class JobDB(BaseModel):
+    id: UUID4
+    name: str
+    status: JobStatus
+    deleted: int
+    removed: int
+    moved: int
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, UUID4
+
+
+class UploadSessionCreate(BaseModel):
+    path: str = Field('/', example='/homework/test-folder/')
+    filename: str = Field(..., max_length=100, example='notes.txt')
+    size: int = Field(..., ge=0)
+    chunk_size: Optional[int] = Field(None, gt=0)
+
+
+class UploadSessionDB(BaseModel):
+    id: UUID4
+    path: str
+    filename: str
+    size: int
+    chunk_size: int
+    chunks_total: int
+    received: List[int]
+    received_bytes: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class UploadedChunk(BaseModel):
+    index: int
+    size: int
@@ -1,6 +1,8 @@
 import uuid
+from typing import Dict
 
 from fastapi_users import schemas
+from pydantic import BaseModel
 
 
 class UserRead(schemas.BaseUser[uuid.UUID]):
@@ -13,3 +15,15 @@ class UserCreate(schemas.BaseUserCreate):
 
 class UserUpdate(schemas.BaseUserUpdate):
     pass
+
+
+class FolderUsage(BaseModel):
+    allocated: int
+    used: int
+    files: int
+
+
+class UserStatus(BaseModel):
+    account_id: str
+    info: FolderUsage
+    folders: Dict[str, FolderUsage]
@@ -0,0 +1,109 @@
+import json
+import math
+import uuid
+from http.client import HTTPConnection, HTTPSConnection
+from typing import Dict, List, Sequence
+from urllib.parse import urlencode, urlsplit
+
+CHUNK_SIZE: int = 1024 * 1024
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(latencies: Sequence[float]) -> Dict[str, float]:
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+    }
+
+
+def print_table(rows: List[Dict]) -> None:
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = {
+        column: max(len(column), *(len(_cell(row[column])) for row in rows))
+        for column in columns
+    }
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(
+            _cell(row[column]).ljust(widths[column]) for column in columns
+        ))
+
+
+def _cell(value) -> str:
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+
+def connect(base_url: str) -> HTTPConnection:
+    parts = urlsplit(base_url)
+    connection_class = (
+        HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+    )
+    return connection_class(parts.netloc, timeout=600)
+
+
+def login(base_url: str, email: str, password: str) -> Dict[str, str]:
+    connection = connect(base_url)
+    connection.request(
+        'POST', '/auth/jwt/login',
+        body=urlencode({'username': email, 'password': password}),
+        headers={'Content-Type': 'application/x-www-form-urlencoded'},
+    )
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f'Login failed: {payload}')
+    return {'Authorization': f'Bearer {payload["access_token"]}'}
+
+
+def upload_generated_file(
+        base_url: str,
+        headers: Dict[str, str],
+        path: str,
+        filename: str,
+        size: int,
+) -> int:
+    """Stream a multipart upload of `size` bytes without buffering it."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="path"\r\n\r\n{path}\r\n'
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    connection = connect(base_url)
+    connection.putrequest('POST', '/files/upload')
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.putheader(
+        'Content-Type', f'multipart/form-data; boundary={boundary}'
+    )
+    connection.putheader('Content-Length', str(len(head) + size + len(tail)))
+    connection.endheaders()
+    connection.send(head)
+    chunk = b'\0' * CHUNK_SIZE
+    remaining = size
+    while remaining > 0:
+        connection.send(chunk[:min(remaining, CHUNK_SIZE)])
+        remaining -= CHUNK_SIZE
+    connection.send(tail)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
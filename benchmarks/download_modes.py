@@ -0,0 +1,135 @@
+"""Compare download throughput and app worker CPU between delivery modes.
+
+Start the stack once with DOWNLOAD_MODE=direct and once with
+DOWNLOAD_MODE=accel (or run both side by side) and point a target at each
+nginx front end, e.g.:
+
+    python -m benchmarks.download_modes \
+        --target direct=http://localhost:8080 --target accel=http://localhost \
+        --worker-pid direct=4211 --worker-pid accel=4388 \
+        --email user@example.com --password 1234566789987654321
+
+Worker CPU is read from /proc, so pass the uvicorn worker pids only when the
+benchmark runs on the same host as the workers.
+"""
+import argparse
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from benchmarks.common import (
+    CHUNK_SIZE, connect, login, print_table, summarize, upload_generated_file
+)
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f'/proc/{pid}/stat') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def download(
+        base_url: str,
+        headers: Dict[str, str],
+        path: str,
+        repeats: int,
+        latencies: List[float],
+        received: List[int],
+) -> None:
+    connection = connect(base_url)
+    url = '/files/download?' + urlencode({'path': path})
+    for _ in range(repeats):
+        started = time.perf_counter()
+        connection.request('GET', url, headers=headers)
+        response = connection.getresponse()
+        size = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+        if response.status != 200:
+            raise RuntimeError(f'Download failed with {response.status}')
+        latencies.append(time.perf_counter() - started)
+        received.append(size)
+    connection.close()
+
+
+def run_target(
+        label: str,
+        base_url: str,
+        args,
+        worker_pid: Optional[int],
+) -> Dict:
+    headers = login(base_url, args.email, args.password)
+    filename = f'download-{uuid.uuid4().hex}.bin'
+    upload_generated_file(
+        base_url, headers, '/benchmarks/', filename,
+        args.file_size_mb * 1024 * 1024,
+    )
+    path = f'/benchmarks/{filename}'
+    latencies: List[float] = []
+    received: List[int] = []
+    threads = [
+        threading.Thread(
+            target=download,
+            args=(base_url, headers, path, args.repeats, latencies, received),
+        )
+        for _ in range(args.concurrency)
+    ]
+    cpu_before = cpu_seconds(worker_pid) if worker_pid else None
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total_mb = sum(received) / 1024 / 1024
+    row = {
+        'mode': label,
+        'mb_per_s': total_mb / elapsed,
+        **summarize(latencies),
+        'worker_cpu_s': '-',
+        'cpu_s_per_gb': '-',
+    }
+    if cpu_before is not None:
+        cpu = cpu_seconds(worker_pid) - cpu_before
+        row['worker_cpu_s'] = cpu
+        row['cpu_s_per_gb'] = cpu / (total_mb / 1024) if total_mb else 0.0
+    return row
+
+
+def parse_pairs(pairs: List[str]) -> Dict[str, str]:
+    return dict(pair.split('=', 1) for pair in pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', action='append', required=True,
+                        help='label=base_url, can be repeated')
+    parser.add_argument('--worker-pid', action='append', default=[],
+                        help='label=pid of the uvicorn worker')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--file-size-mb', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=4)
+    args = parser.parse_args()
+
+    worker_pids = parse_pairs(args.worker_pid)
+    rows = [
+        run_target(
+            label, base_url, args,
+            int(worker_pids[label]) if label in worker_pids else None,
+        )
+        for label, base_url in parse_pairs(args.target).items()
+    ]
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
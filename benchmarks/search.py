@@ -0,0 +1,139 @@
+"""Seed synthetic files into the configured database and time
+downloaded_file_crud.search queries.
+
+    python -m benchmarks.search --rows 1000000
+
+The seeded user and files are removed afterwards unless --keep is given.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, text
+
+from app.core.db import AsyncSessionLocal
+from app.core.utils import BASE_DIR
+from app.crud.downloaded_file import downloaded_file_crud
+from app.models import DownloadedFile, User
+from benchmarks.common import print_table, summarize
+
+EXTENSIONS = ('txt', 'png', 'jpg', 'pdf', 'json', 'log', 'csv', 'md')
+WORDS = ('report', 'notes', 'photo', 'backup', 'invoice', 'draft', 'final')
+COPY_BATCH_SIZE = 50_000
+
+FILE_COLUMNS = [
+    'id', 'name', 'created_at', 'path', 'size', 'is_downloadable', 'user_id',
+    'extension',
+]
+
+
+def generate_files(user_id: uuid.UUID, rows: int, prefix: str):
+    root = BASE_DIR / 'files'
+    started = datetime.now() - timedelta(days=365)
+    for number in range(rows):
+        extension = EXTENSIONS[number % len(EXTENSIONS)]
+        name = (
+            f'{random.choice(WORDS)}-{prefix}-{number}.{extension}'
+        )
+        path = f'{root}/dir{number % 1000}/sub{number % 7}/{name}'
+        yield (
+            uuid.uuid4(), name, started + timedelta(seconds=number), path,
+            random.randint(1, 10_000_000), True, user_id, extension,
+        )
+
+
+async def seed(rows: int) -> uuid.UUID:
+    user_id = uuid.uuid4()
+    prefix = user_id.hex[:8]
+    async with AsyncSessionLocal() as session:
+        session.add(User(
+            id=user_id, email=f'bench-{prefix}@example.com',
+            hashed_password='-', is_active=True, is_superuser=False,
+            is_verified=False,
+        ))
+        await session.commit()
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        batch = []
+        for record in generate_files(user_id, rows, prefix):
+            batch.append(record)
+            if len(batch) == COPY_BATCH_SIZE:
+                await driver_connection.copy_records_to_table(
+                    'downloadedfile', records=batch, columns=FILE_COLUMNS
+                )
+                batch = []
+        if batch:
+            await driver_connection.copy_records_to_table(
+                'downloadedfile', records=batch, columns=FILE_COLUMNS
+            )
+        await session.commit()
+        await session.execute(text('ANALYZE downloadedfile'))
+        await session.commit()
+    return user_id
+
+
+async def cleanup(user_id: uuid.UUID) -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(DownloadedFile).where(DownloadedFile.user_id == user_id)
+        )
+        await session.execute(delete(User).where(User.id == user_id))
+        await session.commit()
+
+
+def scenarios():
+    root = BASE_DIR / 'files'
+    return {
+        'extension': {'extension': 'pdf'},
+        'path_prefix': {'path_prefix': f'{root}/dir42/'},
+        'path_prefix+ext': {
+            'path_prefix': f'{root}/dir42/sub3/', 'extension': 'jpg',
+        },
+        'text': {'query': 'invoice-'},
+        'text_rare': {'query': '-12345.'},
+        'regex': {'query': r'^(final|draft)-.*-99\d\.csv$', 'regex': True},
+        'order_by_size': {'extension': 'log', 'order_by': '-size'},
+    }
+
+
+async def run(args) -> None:
+    started = time.perf_counter()
+    user_id = await seed(args.rows)
+    print(f'Seeded {args.rows} rows in {time.perf_counter() - started:.1f}s')
+    rows = []
+    try:
+        async with AsyncSessionLocal() as session:
+            for name, params in scenarios().items():
+                latencies = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    matches = await downloaded_file_crud.search(
+                        user_id=user_id, session=session, limit=args.limit,
+                        **params,
+                    )
+                    latencies.append(time.perf_counter() - started)
+                rows.append({
+                    'query': name, 'matches': len(matches),
+                    **summarize(latencies),
+                })
+    finally:
+        if not args.keep:
+            await cleanup(user_id)
+    print_table(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--keep', action='store_true')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
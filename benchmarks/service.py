@@ -0,0 +1,470 @@
+"""Drive the ASGI app in-process and measure the main file endpoints.
+
+Synthetic users and files are seeded through the API itself, then every
+scenario runs with a fixed concurrency:
+
+    python -m benchmarks.service --users 10 --files-per-user 200 \
+        --requests 2000 --concurrency 32 --baseline benchmarks/baseline.json
+
+The app talks to the database from DATABASE_DSN, so point it at a throwaway
+Postgres: the schema relies on Postgres-only features (advisory locks,
+trigram indexes, text_pattern_ops), so SQLite cannot stand in for it.
+Seeded users and files are removed afterwards unless --keep is given.
+
+The process exits with status 1 when any scenario gets an error response:
+a scenario answering 4xx/5xx is fast for the wrong reason. With --baseline
+the results are also compared with a stored run, and throughput drops or
+p95 latency growth beyond --tolerance fail the run as well.
+--update-baseline stores the current run instead; a baseline is only
+written from a run without errors. The committed benchmarks/baseline.json
+is the command above on a single developer machine: regenerate it with
+--update-baseline before comparing runs on other hardware.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.main import app
+from app.models import Folder, UsageCounter, User
+from benchmarks.common import CHUNK_SIZE, percentile, print_table, summarize
+
+PASSWORD = 'bench-password'
+LAG_INTERVAL = 0.01
+RSS_INTERVAL = 0.05
+
+Request = Callable[[int], Awaitable[Tuple[int, int]]]
+
+
+class Response:
+
+    def __init__(self) -> None:
+        self.status = 0
+        self.size = 0
+        self.chunks: List[bytes] = []
+
+    def json(self):
+        return json.loads(b''.join(self.chunks))
+
+
+class ASGIClient:
+    """Minimal in-process HTTP client: requests go straight to the ASGI
+    callable, so no sockets or threads distort the timings."""
+
+    def __init__(self, asgi_app) -> None:
+        self.app = asgi_app
+
+    async def request(
+            self,
+            method: str,
+            path: str,
+            headers: Optional[Dict[str, str]] = None,
+            body: bytes = b'',
+            query: Optional[Dict[str, str]] = None,
+            keep_body: bool = True,
+    ) -> Response:
+        headers = dict(headers or {})
+        headers.setdefault('host', 'bench')
+        headers['content-length'] = str(len(body))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': urlencode(query or {}).encode(),
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers.items()
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('bench', 80),
+        }
+        response = Response()
+        finished = asyncio.Event()
+        offset = 0
+
+        async def receive():
+            nonlocal offset
+            if offset < len(body) or offset == 0:
+                chunk = body[offset:offset + CHUNK_SIZE]
+                offset += max(len(chunk), 1)
+                return {
+                    'type': 'http.request',
+                    'body': chunk,
+                    'more_body': offset < len(body),
+                }
+            # Report the disconnect only once the response is complete:
+            # streaming responses stop as soon as the client goes away.
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response.status = message['status']
+            elif message['type'] == 'http.response.body':
+                response.size += len(message.get('body', b''))
+                if keep_body:
+                    response.chunks.append(message.get('body', b''))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return response
+
+
+def multipart(fields: Dict[str, str], filename: str, content: bytes):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+        f'\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+        f'filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        + content + f'\r\n--{boundary}--\r\n'.encode()
+    )
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class FileSizes:
+    """Log-normal file sizes: most files are small, a few are large."""
+
+    def __init__(self, args) -> None:
+        self.random = random.Random(args.seed)
+        self.mu = math.log(args.median_size)
+        self.sigma = args.size_sigma
+        self.max_size = args.max_size
+
+    def next(self) -> int:
+        size = self.random.lognormvariate(self.mu, self.sigma)
+        return max(1, min(int(size), self.max_size))
+
+
+class Sampler:
+    """Sample event loop lag and resident memory while a scenario runs."""
+
+    def __init__(self) -> None:
+        self.lags: List[float] = []
+        self.peak_rss = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def _watch_lag(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(
+                max(0.0, time.perf_counter() - started - LAG_INTERVAL)
+            )
+
+    async def _watch_rss(self) -> None:
+        while True:
+            self.peak_rss = max(self.peak_rss, current_rss())
+            await asyncio.sleep(RSS_INTERVAL)
+
+    def __enter__(self) -> 'Sampler':
+        self._tasks = [
+            asyncio.create_task(self._watch_lag()),
+            asyncio.create_task(self._watch_rss()),
+        ]
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+
+def current_rss() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is the lifetime peak, in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Bench:
+
+    def __init__(self, args) -> None:
+        self.args = args
+        self.client = ASGIClient(app)
+        self.run_id = uuid.uuid4().hex[:8]
+        self.sizes = FileSizes(args)
+        self.users: List[Tuple[uuid.UUID, Dict[str, str]]] = []
+        self.files: List[Tuple[int, str]] = []
+        self.uploaded: List[Tuple[int, str]] = []
+        # Admission control answers 429 to a user who exceeds
+        # max_concurrent_uploads, so uploads queue per user here.
+        self.upload_slots: List[asyncio.Semaphore] = []
+        self._counter = 0
+
+    def check(self, response: Response, expected: int = 200):
+        if response.status != expected:
+            raise RuntimeError(
+                f'Unexpected status {response.status}: '
+                f'{b"".join(response.chunks)[:500]!r}'
+            )
+        return response.json()
+
+    async def create_user(self, number: int) -> None:
+        email = f'bench-{self.run_id}-{number}@example.com'
+        user = self.check(await self.client.request(
+            'POST', '/auth/register',
+            headers={'content-type': 'application/json'},
+            body=json.dumps({'email': email, 'password': PASSWORD}).encode(),
+        ), 201)
+        token = self.check(await self.client.request(
+            'POST', '/auth/jwt/login',
+            headers={'content-type': 'application/x-www-form-urlencoded'},
+            body=urlencode({'username': email, 'password': PASSWORD}).encode(),
+        ))
+        self.users.append((uuid.UUID(user['id']), {
+            'authorization': f'Bearer {token["access_token"]}',
+        }))
+        self.upload_slots.append(asyncio.Semaphore(
+            settings.max_concurrent_uploads or self.args.concurrency
+        ))
+
+    async def upload(self, user: int) -> Tuple[int, Tuple[int, str]]:
+        self._counter += 1
+        size = self.sizes.next()
+        body, content_type = multipart(
+            {'path': f'/bench/dir{self._counter % 10}/'},
+            f'bench-{self.run_id}-{self._counter}.bin',
+            os.urandom(size),
+        )
+        async with self.upload_slots[user]:
+            response = await self.client.request(
+                'POST', '/files/upload',
+                headers={**self.users[user][1], 'content-type': content_type},
+                body=body,
+            )
+        file_id = (
+            response.json()['id'] if response.status == 200 else None
+        )
+        return response.status, (user, file_id)
+
+    async def seed(self) -> None:
+        for number in range(self.args.users):
+            await self.create_user(number)
+        # Round-robin over users so that the shared semaphore is not
+        # filled with uploads waiting for one user's slots.
+        jobs = [
+            user for _ in range(self.args.files_per_user)
+            for user in range(len(self.users))
+        ]
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def seed_file(user: int) -> None:
+            async with semaphore:
+                status, seeded = await self.upload(user)
+            if status != 200:
+                raise RuntimeError(f'Seeding upload failed: {status}')
+            self.files.append(seeded)
+
+        await asyncio.gather(*(seed_file(user) for user in jobs))
+
+    async def cleanup(self) -> None:
+        for _, headers in self.users:
+            await self.client.request('DELETE', '/files/', headers=headers)
+        user_ids = [user_id for user_id, _ in self.users]
+        async with AsyncSessionLocal() as session:
+            for model in (UsageCounter, Folder):
+                await session.execute(
+                    delete(model).where(model.user_id.in_(user_ids))
+                )
+            await session.execute(delete(User).where(User.id.in_(user_ids)))
+            await session.commit()
+
+    def random_file(self, number: int) -> Tuple[int, str]:
+        return self.files[number % len(self.files)]
+
+    async def list_files(self, number: int) -> Tuple[int, int]:
+        response = await self.client.request(
+            'GET', '/files/',
+            headers=self.users[number % len(self.users)][1],
+            query={'limit': '100'}, keep_body=False,
+        )
+        return response.status, response.size
+
+    async def download(self, number: int) -> Tuple[int, int]:
+        _, file_id = self.random_file(number * 7919)
+        response = await self.client.request(
+            'GET', '/files/download', query={'file_id': file_id},
+            keep_body=False,
+        )
+        return response.status, response.size
+
+    async def upload_new(self, number: int) -> Tuple[int, int]:
+        status, uploaded = await self.upload(number % len(self.users))
+        if status == 200:
+            self.uploaded.append(uploaded)
+        return status, 0
+
+    async def delete(self, number: int) -> Tuple[int, int]:
+        if not self.uploaded:
+            return 404, 0
+        user, file_id = self.uploaded.pop()
+        response = await self.client.request(
+            'DELETE', f'/files/{file_id}', headers=self.users[user][1],
+            keep_body=False,
+        )
+        return response.status, 0
+
+    def scenarios(self) -> Dict[str, Request]:
+        return {
+            'get_my_files': self.list_files,
+            'download_file': self.download,
+            'upload_file': self.upload_new,
+            'remove_file': self.delete,
+        }
+
+    async def run_scenario(self, request: Request) -> Dict:
+        total = self.args.requests
+        latencies: List[float] = []
+        transferred = 0
+        errors = 0
+        issued = 0
+
+        async def worker() -> None:
+            nonlocal transferred, errors, issued
+            while issued < total:
+                number = issued
+                issued += 1
+                started = time.perf_counter()
+                status, size = await request(number)
+                latencies.append(time.perf_counter() - started)
+                transferred += size
+                errors += status >= 400
+
+        with Sampler() as sampler:
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(worker() for _ in range(self.args.concurrency))
+            )
+            elapsed = time.perf_counter() - started
+        stats = summarize(latencies)
+        return {
+            'requests': total,
+            'errors': errors,
+            'rps': total / elapsed,
+            'mb_s': transferred / elapsed / 1024 / 1024,
+            'p50_ms': stats['p50_ms'],
+            'p95_ms': stats['p95_ms'],
+            'p99_ms': stats['p99_ms'],
+            'peak_rss_mb': sampler.peak_rss / 1024 / 1024,
+            'lag_p99_ms': percentile(sampler.lags, 99) * 1000,
+            'lag_max_ms': max(sampler.lags, default=0.0) * 1000,
+        }
+
+    async def run(self) -> Dict[str, Dict]:
+        await app.router.startup()
+        results = {}
+        try:
+            started = time.perf_counter()
+            await self.seed()
+            print(
+                f'Seeded {len(self.users)} users and {len(self.files)} files'
+                f' in {time.perf_counter() - started:.1f}s'
+            )
+            for name, request in self.scenarios().items():
+                results[name] = await self.run_scenario(request)
+        finally:
+            if not self.args.keep:
+                await self.cleanup()
+            await app.router.shutdown()
+        return results
+
+
+def find_errors(results: Dict[str, Dict]) -> List[str]:
+    return [
+        f'{name}: {result["errors"]} of {result["requests"]} requests failed'
+        for name, result in results.items() if result['errors']
+    ]
+
+
+def find_regressions(
+        results: Dict[str, Dict],
+        baseline: Dict[str, Dict],
+        tolerance: float,
+) -> List[str]:
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None:
+            continue
+        if actual['rps'] < expected['rps'] * (1 - tolerance):
+            regressions.append(
+                f'{name}: throughput {actual["rps"]:.1f} rps,'
+                f' baseline {expected["rps"]:.1f} rps'
+            )
+        if actual['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {actual["p95_ms"]:.2f} ms,'
+                f' baseline {expected["p95_ms"]:.2f} ms'
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--files-per-user', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--median-size', type=int, default=64 * 1024)
+    parser.add_argument('--size-sigma', type=float, default=1.5)
+    parser.add_argument('--max-size', type=int, default=16 * 1024 * 1024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    results = asyncio.run(Bench(args).run())
+    print_table([
+        {'endpoint': name, **result} for name, result in results.items()
+    ])
+    failures = find_errors(results)
+    for failure in failures:
+        print(f'ERRORS {failure}')
+    if args.baseline is None or failures:
+        sys.exit(1 if failures else 0)
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + '\n')
+        print(f'Baseline written to {args.baseline}')
+        return
+    regressions = find_regressions(
+        results, json.loads(args.baseline.read_text()), args.tolerance
+    )
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measure /ping and GET /files/ latency while large uploads are running.
+
+Run against a live deployment, e.g.:
+
+    python -m benchmarks.upload_latency --base-url http://localhost \
+        --email user@example.com --password 1234566789987654321
+"""
+import argparse
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from benchmarks.common import (
+    connect, login, print_table, summarize, upload_generated_file
+)
+
+PROBED_ENDPOINTS = ('/ping', '/files/')
+
+
+def probe(
+        base_url: str,
+        headers: Dict[str, str],
+        endpoint: str,
+        interval: float,
+        stop: threading.Event,
+        latencies: List[float],
+) -> None:
+    connection = connect(base_url)
+    while not stop.is_set():
+        started = time.perf_counter()
+        connection.request('GET', endpoint, headers=headers)
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+        stop.wait(interval)
+    connection.close()
+
+
+def run_phase(args, headers, with_uploads: bool) -> Dict[str, List[float]]:
+    stop = threading.Event()
+    latencies = {endpoint: [] for endpoint in PROBED_ENDPOINTS}
+    threads = [
+        threading.Thread(
+            target=probe,
+            args=(args.base_url, headers, endpoint, args.interval, stop,
+                  latencies[endpoint]),
+        )
+        for endpoint in PROBED_ENDPOINTS
+    ]
+    uploaders = []
+    if with_uploads:
+        size = args.upload_size_mb * 1024 * 1024
+        uploaders = [
+            threading.Thread(
+                target=upload_generated_file,
+                args=(args.base_url, headers, '/benchmarks/',
+                      f'upload-{uuid.uuid4().hex}.bin', size),
+            )
+            for _ in range(args.uploads)
+        ]
+    for thread in threads + uploaders:
+        thread.start()
+    if uploaders:
+        for thread in uploaders:
+            thread.join()
+    else:
+        time.sleep(args.idle_seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--base-url', default='http://localhost')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--uploads', type=int, default=2)
+    parser.add_argument('--upload-size-mb', type=int, default=2048)
+    parser.add_argument('--interval', type=float, default=0.05)
+    parser.add_argument('--idle-seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    headers = login(args.base_url, args.email, args.password)
+    rows = []
+    for phase, with_uploads in (('idle', False), ('uploading', True)):
+        latencies = run_phase(args, headers, with_uploads)
+        for endpoint, values in latencies.items():
+            rows.append({'phase': phase, 'endpoint': endpoint,
+                         **summarize(values)})
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,4 +9,4 @@ done
 echo "PostgreSQL started"
 
 alembic upgrade head
-uvicorn app.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+uvicorn app.main:app --host 0.0.0.0 --port 8000 --proxy-headers --forwarded-allow-ips='*'
\ No newline at end of file
@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+
+from app.core import admission
+from app.core.admission import METER_BYTES, AdmissionMiddleware, MemoryBackend
+from app.core.config import settings
+
+BURST = 10 * METER_BYTES
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    memory_backend = MemoryBackend()
+    monkeypatch.setattr(admission, 'backend', memory_backend)
+    monkeypatch.setattr(settings, 'requests_per_second', None)
+    monkeypatch.setattr(settings, 'upload_bytes_per_second', None)
+    monkeypatch.setattr(settings, 'upload_bytes_burst', BURST)
+    monkeypatch.setattr(settings, 'max_concurrent_uploads', None)
+    return memory_backend
+
+
+def make_scope(path='/files/upload', method='POST', content_length=None):
+    headers = []
+    if content_length is not None:
+        headers.append((b'content-length', str(content_length).encode()))
+    return {
+        'type': 'http', 'method': method, 'path': path,
+        'headers': headers, 'client': ('10.0.0.1', 1234),
+    }
+
+
+def make_receive(chunks):
+    messages = [
+        {'type': 'http.request', 'body': chunk,
+         'more_body': number < len(chunks) - 1}
+        for number, chunk in enumerate(chunks)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+    return receive
+
+
+async def read_body_app(scope, receive, send):
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get('more_body', False)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def call(app, scope, chunks=(b'',)):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+    await AdmissionMiddleware(app)(scope, make_receive(list(chunks)), send)
+    return messages[0]
+
+
+def spent_bytes(backend):
+    tokens, _ = backend.buckets.get('ip:10.0.0.1:bytes')
+    return BURST - tokens
+
+
+@pytest.mark.asyncio
+async def test_bucket_refills_with_time(backend, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: now)
+    assert await backend.take('key', 1, 2, 1) == (True, 1)
+    assert await backend.take('key', 1, 2, 1) == (True, 0)
+    assert await backend.take('key', 1, 2, 1) == (False, 0)
+    now += 1.5
+    assert await backend.take('key', 1, 2, 1) == (True, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_large_cost_is_admitted_into_debt(backend):
+    assert await backend.take('key', 1, 10, 25) == (True, -15)
+    allowed, _ = await backend.take('key', 1, 10, 1)
+    assert not allowed
+
+
+@pytest.mark.asyncio
+async def test_upload_slots_are_counted(backend):
+    first = await backend.acquire('key', 2)
+    second = await backend.acquire('key', 2)
+    assert first is not None and second is not None
+    assert await backend.acquire('key', 2) is None
+    await backend.release('key', first)
+    third = await backend.acquire('key', 2)
+    assert third is not None
+    await backend.release('key', second)
+    await backend.release('key', third)
+    assert backend.slots == {}
+
+
+@pytest.mark.asyncio
+async def test_requests_over_limit_get_429(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'requests_per_second', 0.001)
+    monkeypatch.setattr(settings, 'requests_burst', 2)
+    scope = make_scope('/files/', 'GET')
+    statuses = [
+        (await call(read_body_app, scope))['status'] for _ in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+    outside = await call(read_body_app, make_scope('/ping', 'GET'))
+    assert outside['status'] == 200
+
+
+@pytest.mark.asyncio
+async def test_bytes_read_are_charged(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_bytes_per_second', 1)
+    chunks = [b'x' * (METER_BYTES // 2)] * 5
+    start = await call(read_body_app, make_scope(), chunks)
+    assert start['status'] == 200
+    assert spent_bytes(backend) == pytest.approx(
+        sum(map(len, chunks)), abs=10
+    )
+
+
+@pytest.mark.asyncio
+async def test_content_length_does_not_limit_charge(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_bytes_per_second', 1)
+    chunks = [b'x' * METER_BYTES] * 3
+    start = await call(
+        read_body_app, make_scope(content_length=10), chunks
+    )
+    assert start['status'] == 200
+    assert spent_bytes(backend) == pytest.approx(
+        sum(map(len, chunks)), abs=10
+    )
+
+
+@pytest.mark.asyncio
+async def test_small_upload_is_charged_once(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_bytes_per_second', 1)
+    start = await call(
+        read_body_app, make_scope(content_length=100), [b'x' * 100]
+    )
+    assert start['status'] == 200
+    assert spent_bytes(backend) == pytest.approx(100, abs=10)
+
+
+@pytest.mark.asyncio
+async def test_exhausted_byte_bucket_gets_429(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'upload_bytes_per_second', 1)
+    await backend.take('ip:10.0.0.1:bytes', 1, BURST, BURST)
+    start = await call(
+        read_body_app, make_scope(content_length=METER_BYTES),
+        [b'x' * METER_BYTES],
+    )
+    assert start['status'] == 429
+    headers = dict(start['headers'])
+    assert int(headers[b'retry-after']) > 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_uploads_are_limited(backend, monkeypatch):
+    monkeypatch.setattr(settings, 'max_concurrent_uploads', 1)
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        started.set()
+        await finish.wait()
+        await read_body_app(scope, receive, send)
+
+    first = asyncio.create_task(call(slow_app, make_scope()))
+    await started.wait()
+    assert (await call(read_body_app, make_scope()))['status'] == 429
+    assert (await call(read_body_app, make_scope('/files/', 'GET')))[
+        'status'
+    ] == 200
+    finish.set()
+    assert (await first)['status'] == 200
+    assert backend.slots == {}
+    assert (await call(read_body_app, make_scope()))['status'] == 200
@@ -0,0 +1,76 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+
+def archive_names(response):
+    assert response.status_code == 200, response.text
+    return sorted(zipfile.ZipFile(io.BytesIO(response.content)).namelist())
+
+
+def test_folder_archive_keeps_structure(
+        client, register, upload, folder, unique
+):
+    owner = register()
+    upload(owner, folder, unique('a.txt'), b'a')
+    upload(owner, f'{folder}nested/', unique('b.txt'), b'b')
+    response = client.get(
+        '/files/download', params={'path': folder}, headers=owner
+    )
+    assert response.headers['content-type'] == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == [
+        unique('a.txt'), f'nested/{unique("b.txt")}'
+    ]
+    assert archive.read(f'nested/{unique("b.txt")}') == b'b'
+
+
+@pytest.mark.parametrize('compression, mode', [
+    ('tar', 'r:'),
+    ('tar.gz', 'r:gz'),
+])
+def test_folder_tar_archive(
+        client, register, upload, folder, unique, compression, mode
+):
+    owner = register()
+    upload(owner, folder, unique('a.txt'), b'content')
+    response = client.get(
+        '/files/download', headers=owner,
+        params={'path': folder, 'compression': compression},
+    )
+    assert response.status_code == 200, response.text
+    archive = tarfile.open(fileobj=io.BytesIO(response.content), mode=mode)
+    assert archive.getnames() == [unique('a.txt')]
+    assert archive.extractfile(unique('a.txt')).read() == b'content'
+
+
+def test_folder_path_download_requires_auth(
+        client, register, upload, folder, unique
+):
+    upload(register(), folder, unique('private.txt'), b'private')
+    response = client.get('/files/download', params={'path': folder})
+    assert response.status_code == 401
+
+
+def test_folder_path_download_is_scoped_to_owner(
+        client, register, upload, folder, unique
+):
+    owner, stranger = register(), register()
+    upload(owner, folder, unique('owner.txt'), b'owner')
+    upload(stranger, folder, unique('stranger.txt'), b'stranger')
+    response = client.get(
+        '/files/download', params={'path': folder}, headers=owner
+    )
+    assert archive_names(response) == [unique('owner.txt')]
+
+
+def test_foreign_folder_path_is_not_found(
+        client, register, upload, folder, unique
+):
+    upload(register(), folder, unique('private.txt'), b'private')
+    response = client.get(
+        '/files/download', params={'path': folder}, headers=register()
+    )
+    assert response.status_code == 404
@@ -0,0 +1,74 @@
+import io
+import os
+import tarfile
+
+from app.core.storage import BLOBS_TMP_DIR
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def upload_tar(client, headers, folder, members):
+    return client.post(
+        '/files/upload/batch', params={'path': folder},
+        data=make_tar(members),
+        headers={**headers, 'content-type': 'application/x-tar'},
+    )
+
+
+def test_multipart_batch(client, register, folder, unique):
+    response = client.post(
+        '/files/upload/batch', params={'path': folder}, headers=register(),
+        files=[
+            ('files', (unique('a.txt'), b'a')),
+            ('files', (f'nested/{unique("b.txt")}', b'b')),
+        ],
+    )
+    assert response.status_code == 200, response.text
+    assert sorted(
+        db_file['path'][db_file['path'].index(folder):]
+        for db_file in response.json()['files']
+    ) == sorted([
+        f'{folder}{unique("a.txt")}', f'{folder}nested/{unique("b.txt")}'
+    ])
+
+
+def test_multipart_duplicates_are_rejected(client, register, folder, unique):
+    temp_files = set(os.listdir(BLOBS_TMP_DIR))
+    response = client.post(
+        '/files/upload/batch', params={'path': folder}, headers=register(),
+        files=[
+            ('files', (unique('a.txt'), b'a')),
+            ('files', (f'nested/{unique("a.txt")}', b'b')),
+        ],
+    )
+    assert response.status_code == 400
+    assert set(os.listdir(BLOBS_TMP_DIR)) == temp_files
+
+
+def test_tar_batch_keeps_folders(client, register, folder, unique):
+    response = upload_tar(client, register(), folder, [
+        (unique('a.txt'), b'a'), (f'nested/{unique("b.txt")}', b'b'),
+    ])
+    assert response.status_code == 200, response.text
+    assert len(response.json()['files']) == 2
+
+
+def test_tar_duplicates_are_discarded(
+        client, register, upload, folder, unique
+):
+    headers = register()
+    upload(headers, folder, unique('a.txt'), b'a')
+    temp_files = set(os.listdir(BLOBS_TMP_DIR))
+    response = upload_tar(client, headers, folder, [
+        (unique('a.txt'), b'a'), (unique('b.txt'), b'b'),
+    ])
+    assert response.status_code == 400
+    assert set(os.listdir(BLOBS_TMP_DIR)) == temp_files
@@ -0,0 +1,134 @@
+import hashlib
+import uuid
+
+import pytest
+
+from app.core.db import AsyncSessionLocal
+from app.core.storage import discard_temp, find_blob, write_blob
+from app.crud import downloaded_file
+from app.crud.blob import blob_crud
+from app.models import Blob
+
+
+def get_ref_count(client, blob_hash):
+    async def ref_count():
+        async with AsyncSessionLocal() as session:
+            blob = await session.get(Blob, blob_hash)
+            return None if blob is None else blob.ref_count
+    return client.portal.call(ref_count)
+
+
+def test_same_content_is_stored_once(client, register, upload, folder, unique):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    upload(register(), folder, unique('first.bin'), content)
+    upload(register(), folder, unique('second.bin'), content)
+    assert get_ref_count(client, blob_hash) == 2
+    assert find_blob(blob_hash).is_file()
+
+
+def test_blob_is_removed_with_last_reference(
+        client, register, upload, folder, unique
+):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    headers = register()
+    first = upload(headers, folder, unique('first.bin'), content)
+    second = upload(headers, folder, unique('second.bin'), content)
+    location = find_blob(blob_hash)
+
+    response = client.delete(f'/files/{first["id"]}', headers=headers)
+    assert response.status_code == 200, response.text
+    assert get_ref_count(client, blob_hash) == 1
+    assert location.is_file()
+    response = client.get(
+        '/files/download', params={'file_id': second['id']}
+    )
+    assert response.content == content
+
+    response = client.delete(f'/files/{second["id"]}', headers=headers)
+    assert response.status_code == 200, response.text
+    assert get_ref_count(client, blob_hash) is None
+    assert not location.exists()
+
+
+def test_copy_retains_blob(client, register, upload, folder, unique):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    headers = register()
+    db_file = upload(headers, folder, unique('original.bin'), content)
+    response = client.post(
+        '/files/copy', headers=headers,
+        json={'source': folder + unique('original.bin'),
+              'destination': f'{folder}copies/'},
+    )
+    assert response.status_code == 200, response.text
+    assert get_ref_count(client, blob_hash) == 2
+
+    response = client.delete(f'/files/{db_file["id"]}', headers=headers)
+    assert response.status_code == 200, response.text
+    assert get_ref_count(client, blob_hash) == 1
+    assert find_blob(blob_hash).is_file()
+
+
+def test_foreign_file_is_not_deleted(client, register, upload, folder, unique):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    db_file = upload(register(), folder, unique('kept.bin'), content)
+    response = client.delete(f'/files/{db_file["id"]}', headers=register())
+    assert response.status_code == 400
+    assert get_ref_count(client, blob_hash) == 1
+
+
+def test_failed_commit_leaves_no_blob(
+        client, register, folder, unique, monkeypatch
+):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError('commit failed')
+    monkeypatch.setattr(downloaded_file, 'publish_invalidation', fail)
+    with pytest.raises(RuntimeError):
+        client.post(
+            '/files/upload', headers=register(), data={'path': folder},
+            files={'file': (unique('failed.bin'), content)},
+        )
+    assert get_ref_count(client, blob_hash) is None
+    assert not find_blob(blob_hash).exists()
+
+
+def test_abandon_keeps_referenced_blob(
+        client, register, upload, folder, unique
+):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    upload(register(), folder, unique('kept.bin'), content)
+
+    async def abandon():
+        async def chunks():
+            yield content
+        stored_file = await write_blob(chunks())
+        await discard_temp(stored_file.location)
+        async with AsyncSessionLocal() as session:
+            return await blob_crud.abandon([stored_file], session)
+    assert client.portal.call(abandon) == []
+    assert get_ref_count(client, blob_hash) == 1
+    assert find_blob(blob_hash).is_file()
+
+
+def test_failed_delete_keeps_blob(
+        client, register, upload, folder, unique, monkeypatch
+):
+    content = uuid.uuid4().bytes * 64
+    blob_hash = hashlib.sha256(content).hexdigest()
+    headers = register()
+    db_file = upload(headers, folder, unique('survivor.bin'), content)
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError('commit failed')
+    monkeypatch.setattr(downloaded_file, 'publish_invalidation', fail)
+    with pytest.raises(RuntimeError):
+        client.delete(f'/files/{db_file["id"]}', headers=headers)
+    assert get_ref_count(client, blob_hash) == 1
+    assert find_blob(blob_hash).is_file()
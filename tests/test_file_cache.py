@@ -0,0 +1,64 @@
+import hashlib
+
+from app.core.db import AsyncSessionLocal
+from app.core.storage import find_blob
+from app.crud.downloaded_file import downloaded_file_crud
+
+cache = downloaded_file_crud.cache
+
+
+def get_location(client, file_id):
+    async def location():
+        async with AsyncSessionLocal() as session:
+            return await downloaded_file_crud.get_file_location_by_id(
+                file_id, session
+            )
+    return client.portal.call(location)
+
+
+def test_location_is_cached(client, register, upload, folder, unique):
+    content = unique('content').encode()
+    db_file = upload(register(), folder, unique('file.txt'), content)
+    location = get_location(client, db_file['id'])
+    assert location == find_blob(hashlib.sha256(content).hexdigest())
+    hits = cache.hits
+    assert get_location(client, db_file['id']) == location
+    assert cache.hits > hits
+
+
+def test_delete_invalidates_location(
+        client, register, upload, folder, unique
+):
+    headers = register()
+    db_file = upload(headers, folder, unique('file.txt'), b'content')
+    assert get_location(client, db_file['id']) is not None
+    response = client.delete(f'/files/{db_file["id"]}', headers=headers)
+    assert response.status_code == 200, response.text
+    assert get_location(client, db_file['id']) is None
+
+
+def test_file_download_by_path(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('file.txt'), b'content')
+    for _ in range(2):
+        response = client.get(
+            '/files/download', params={'path': db_file['path']}
+        )
+        assert response.status_code == 200
+        assert response.content == b'content'
+    response = client.get(
+        '/files/download', params={'path': f'{folder}missing.txt'}
+    )
+    assert response.status_code == 404
+
+
+def test_cache_stats_are_exported(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('file.txt'), b'content')
+    get_location(client, db_file['id'])
+    get_location(client, db_file['id'])
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert f'cache_hits_total{{cache="files"}} {cache.hits}' in (
+        response.text.splitlines()
+    )
+    assert 'cache_misses_total{cache="files"}' in response.text
+    assert 'cache_evictions_total{cache="files"}' in response.text
@@ -0,0 +1,91 @@
+import io
+import zipfile
+
+
+def get_folder(client, headers, path):
+    return client.get(
+        '/files/folders/', params={'path': path.rstrip('/')},
+        headers=headers,
+    )
+
+
+def get_folder_id(client, headers, path):
+    response = get_folder(client, headers, path)
+    assert response.status_code == 200, response.text
+    return response.json()['id']
+
+
+def test_folder_counts_nested_files(client, register, upload, folder, unique):
+    owner = register()
+    upload(owner, folder, unique('a.txt'), b'a' * 3)
+    upload(owner, f'{folder}nested/', unique('b.txt'), b'b' * 4)
+    folder_db = get_folder(client, owner, folder).json()
+    assert folder_db['used'] == 7
+    assert folder_db['files'] == 2
+    nested = get_folder(client, owner, f'{folder}nested/').json()
+    assert nested['parent_id'] == folder_db['id']
+
+
+def test_foreign_folder_is_not_found(client, register, upload, folder, unique):
+    owner = register()
+    upload(owner, folder, unique('a.txt'), b'a')
+    folder_id = get_folder_id(client, owner, folder)
+    response = client.get(f'/files/folders/{folder_id}', headers=register())
+    assert response.status_code == 404
+
+
+def test_move_keeps_files(client, register, upload, folder, unique):
+    owner = register()
+    db_file = upload(owner, f'{folder}old/', unique('a.txt'), b'content')
+    folder_id = get_folder_id(client, owner, f'{folder}old/')
+    response = client.patch(
+        f'/files/folders/{folder_id}', headers=owner,
+        json={'path': f'{folder}new'},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()['path'].rstrip('/') == f'{folder}new'
+    assert get_folder(client, owner, f'{folder}old/').status_code == 404
+    response = client.get(
+        '/files/download', params={'file_id': db_file['id']}
+    )
+    assert response.status_code == 200
+    assert response.content == b'content'
+
+
+def test_folder_id_download_requires_auth(
+        client, register, upload, folder, unique
+):
+    owner = register()
+    upload(owner, folder, unique('private.txt'), b'private')
+    folder_id = get_folder_id(client, owner, folder)
+    response = client.get('/files/download', params={'folder_id': folder_id})
+    assert response.status_code == 401
+
+
+def test_foreign_folder_id_download_is_not_found(
+        client, register, upload, folder, unique
+):
+    owner = register()
+    upload(owner, folder, unique('private.txt'), b'private')
+    folder_id = get_folder_id(client, owner, folder)
+    response = client.get(
+        '/files/download', params={'folder_id': folder_id},
+        headers=register(),
+    )
+    assert response.status_code == 404
+
+
+def test_owner_downloads_folder_by_id(
+        client, register, upload, folder, unique
+):
+    owner = register()
+    upload(owner, folder, unique('a.txt'), b'a')
+    upload(owner, f'{folder}nested/', unique('b.txt'), b'b')
+    folder_id = get_folder_id(client, owner, folder)
+    response = client.get(
+        '/files/download', params={'folder_id': folder_id}, headers=owner
+    )
+    assert response.status_code == 200, response.text
+    assert sorted(
+        zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    ) == [unique('a.txt'), f'nested/{unique("b.txt")}']
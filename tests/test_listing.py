@@ -0,0 +1,97 @@
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.core.utils import decode_cursor, encode_cursor
+
+
+def upload_files(register, upload, folder, unique, count):
+    headers = register()
+    ids = [
+        upload(headers, folder, unique(f'{number}.txt'), b'x')['id']
+        for number in range(count)
+    ]
+    return headers, ids
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 12, 30, 45, 123456)
+    file_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, file_id)) == (
+        created_at, file_id
+    )
+
+
+def test_pages_cover_all_files_once(
+        client, register, upload, folder, unique
+):
+    headers, ids = upload_files(register, upload, folder, unique, 5)
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/files/', params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page['files']) <= 2
+        seen.extend(db_file['id'] for db_file in page['files'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+
+
+def test_last_page_has_no_cursor(client, register, upload, folder, unique):
+    headers, _ = upload_files(register, upload, folder, unique, 2)
+    response = client.get('/files/', params={'limit': 2}, headers=headers)
+    assert response.json()['next_cursor'] is None
+
+
+def test_stream_lists_all_files(client, register, upload, folder, unique):
+    headers, ids = upload_files(register, upload, folder, unique, 3)
+    response = client.get(
+        '/files/', params={'stream': 'true'}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    streamed = [
+        json.loads(line)['id'] for line in response.text.splitlines() if line
+    ]
+    assert sorted(streamed) == sorted(ids)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'eyJhIjogMX0=', '_-_-'])
+def test_invalid_cursor_is_rejected(client, register, cursor):
+    response = client.get(
+        '/files/', params={'cursor': cursor}, headers=register()
+    )
+    assert response.status_code == 400
+
+
+def test_pages_break_ties_by_id(client, register, folder, unique):
+    headers = register()
+    response = client.post(
+        '/files/upload/batch', params={'path': folder}, headers=headers,
+        files=[
+            ('files', (unique(f'{number}.txt'), b'x')) for number in range(5)
+        ],
+    )
+    assert response.status_code == 200, response.text
+    ids = [db_file['id'] for db_file in response.json()['files']]
+    assert len({
+        db_file['created_at'] for db_file in response.json()['files']
+    }) == 1
+    seen = []
+    params = {'limit': 2}
+    while True:
+        page = client.get('/files/', params=params, headers=headers).json()
+        seen.extend(db_file['id'] for db_file in page['files'])
+        if page['next_cursor'] is None:
+            break
+        params['cursor'] = page['next_cursor']
+    assert sorted(seen) == sorted(ids)
@@ -0,0 +1,134 @@
+import pytest
+
+from app.core.responses import MAX_RANGES, parse_range_header
+
+SIZE = 100
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-9', [(0, 10)]),
+    ('bytes=90-', [(90, 100)]),
+    ('bytes=-10', [(90, 100)]),
+    ('bytes=-1000', [(0, 100)]),
+    ('bytes=95-1000', [(95, 100)]),
+    ('BYTES = 0-0', [(0, 1)]),
+    ('bytes=0-9, 20-29', [(0, 10), (20, 30)]),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range_header(header, SIZE) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=20-29,0-9', [(0, 10), (20, 30)]),
+    ('bytes=0-9,5-19', [(0, 20)]),
+    ('bytes=0-9,10-19', [(0, 20)]),
+    ('bytes=0-49,-60', [(0, 100)]),
+])
+def test_ranges_are_sorted_and_merged(header, expected):
+    assert parse_range_header(header, SIZE) == expected
+
+
+@pytest.mark.parametrize('header', [
+    'bytes=100-',
+    'bytes=100-200',
+    'bytes=-0',
+    'bytes=100-,200-',
+])
+def test_unsatisfiable_ranges(header):
+    assert parse_range_header(header, SIZE) == []
+
+
+def test_empty_file_has_no_satisfiable_ranges():
+    assert parse_range_header('bytes=0-', 0) == []
+    assert parse_range_header('bytes=-5', 0) == []
+
+
+@pytest.mark.parametrize('header', [
+    'items=0-9',
+    'bytes=',
+    'bytes=5',
+    'bytes=9-0',
+    'bytes=a-b',
+    'bytes=0-9,x',
+    '0-9',
+])
+def test_malformed_headers_are_ignored(header):
+    assert parse_range_header(header, SIZE) is None
+
+
+def test_too_many_ranges_are_ignored():
+    header = 'bytes=' + ','.join(
+        f'{start}-{start}' for start in range(0, 2 * (MAX_RANGES + 1), 2)
+    )
+    assert parse_range_header(header, SIZE) is None
+
+
+def test_max_ranges_are_accepted():
+    header = 'bytes=' + ','.join(
+        f'{start}-{start}' for start in range(0, 2 * MAX_RANGES, 2)
+    )
+    assert len(parse_range_header(header, SIZE)) == MAX_RANGES
+
+
+def test_range_request(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('range.txt'), b'0123456789')
+    params = {'file_id': db_file['id']}
+    response = client.get(
+        '/files/download', params=params, headers={'Range': 'bytes=2-4'}
+    )
+    assert response.status_code == 206
+    assert response.content == b'234'
+    assert response.headers['content-range'] == 'bytes 2-4/10'
+    response = client.get(
+        '/files/download', params=params, headers={'Range': 'bytes=20-'}
+    )
+    assert response.status_code == 416
+    assert response.headers['content-range'] == 'bytes */10'
+    response = client.get(
+        '/files/download', params=params, headers={'Range': 'bytes=9-0'}
+    )
+    assert response.status_code == 200
+    assert response.content == b'0123456789'
+
+
+def test_multiple_ranges(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('parts.txt'), b'0123456789')
+    response = client.get(
+        '/files/download', params={'file_id': db_file['id']},
+        headers={'Range': 'bytes=0-1,8-'},
+    )
+    assert response.status_code == 206
+    assert response.headers['content-type'].startswith(
+        'multipart/byteranges; boundary='
+    )
+    assert b'bytes 0-1/10' in response.content
+    assert b'bytes 8-9/10' in response.content
+
+
+def test_conditional_get(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('cached.txt'), b'cached')
+    params = {'file_id': db_file['id']}
+    response = client.get('/files/download', params=params)
+    etag = response.headers['etag']
+    last_modified = response.headers['last-modified']
+    response = client.get(
+        '/files/download', params=params, headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b''
+    response = client.get(
+        '/files/download', params=params,
+        headers={'If-Modified-Since': last_modified},
+    )
+    assert response.status_code == 304
+    response = client.get(
+        '/files/download', params=params,
+        headers={'Range': 'bytes=0-1', 'If-Range': '"stale"'},
+    )
+    assert response.status_code == 200
+    response = client.get(
+        '/files/download', params=params,
+        headers={'Range': 'bytes=0-1', 'If-Range': etag},
+    )
+    assert response.status_code == 206
+    assert response.content == b'ca'
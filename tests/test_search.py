@@ -0,0 +1,72 @@
+import pytest
+
+
+def search(client, headers, query=None, **options):
+    return client.post(
+        '/files/search', headers=headers,
+        json={'query': query, 'options': options},
+    )
+
+
+def matched_names(response):
+    assert response.status_code == 200, response.text
+    return [db_file['name'] for db_file in response.json()['matches']]
+
+
+@pytest.fixture
+def files(register, upload, folder, unique):
+    headers = register()
+    upload(headers, folder, unique('report.txt'), b'1')
+    upload(headers, f'{folder}sub/', unique('notes.md'), b'22')
+    upload(headers, '/elsewhere/', unique('report.md'), b'333')
+    return headers
+
+
+def test_substring_search(client, files, unique):
+    response = search(client, files, unique('report'), order_by='name')
+    assert matched_names(response) == [
+        unique('report.md'), unique('report.txt')
+    ]
+
+
+def test_extension_and_folder_filters(client, files, folder, unique):
+    response = search(client, files, extension='md', path=folder)
+    assert matched_names(response) == [unique('notes.md')]
+
+
+def test_ordering(client, files, unique):
+    response = search(client, files, unique(''), order_by='-size')
+    assert matched_names(response) == [
+        unique('report.md'), unique('notes.md'), unique('report.txt')
+    ]
+
+
+def test_regex_search(client, files, unique):
+    response = search(
+        client, files, f'^{unique("")}(notes|report)\\.md$', regex=True,
+        order_by='name',
+    )
+    assert matched_names(response) == [
+        unique('notes.md'), unique('report.md')
+    ]
+
+
+def test_search_is_scoped_to_owner(client, files, register, unique):
+    response = search(client, register(), unique('report'))
+    assert matched_names(response) == []
+
+
+@pytest.mark.parametrize('query', [
+    '(',
+    '[a-',
+    # Корректно для re, но отвергается регулярными выражениями Postgres.
+    '(?P<name>a)',
+])
+def test_invalid_regex_is_rejected(client, register, query):
+    response = search(client, register(), query, regex=True)
+    assert response.status_code == 422
+
+
+def test_unknown_order_is_rejected(client, register):
+    response = search(client, register(), order_by='owner')
+    assert response.status_code == 422
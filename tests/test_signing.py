@@ -0,0 +1,135 @@
+import base64
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.codecs import GZIP
+from app.core.config import settings
+from app.core.signing import _signature, sign_file, verify_file_token
+from app.core.storage import FILES_DIR, find_blob
+
+BLOB_HASH = 'a' * 64
+
+
+def make_file(blob_hash=BLOB_HASH, codec=None):
+    return SimpleNamespace(
+        name='отчёт.pdf',
+        size=1234,
+        created_at=datetime(2026, 1, 2, 3, 4, 5),
+        blob_hash=blob_hash,
+        codec=codec,
+    )
+
+
+def make_token(data):
+    payload = base64.urlsafe_b64encode(
+        json.dumps(data).encode()
+    ).decode().rstrip('=')
+    return f'{payload}.{_signature(payload.encode())}'
+
+
+def test_blob_token_round_trip():
+    expires = int(time.time()) + 60
+    db_file = make_file(codec=GZIP)
+    signed = verify_file_token(
+        sign_file(db_file, find_blob(BLOB_HASH), expires)
+    )
+    assert signed is not None
+    assert signed.name == db_file.name
+    assert signed.size == db_file.size
+    assert signed.created_at == db_file.created_at
+    assert signed.blob_hash == BLOB_HASH
+    assert signed.codec == GZIP
+    assert signed.location == find_blob(BLOB_HASH)
+    assert signed.expires == expires
+
+
+def test_legacy_file_token_points_into_storage():
+    location = FILES_DIR / 'docs' / 'отчёт.pdf'
+    signed = verify_file_token(sign_file(
+        make_file(blob_hash=None), location, int(time.time()) + 60
+    ))
+    assert signed is not None
+    assert signed.blob_hash is None
+    assert signed.location == location
+
+
+def test_expired_token_is_rejected():
+    token = sign_file(
+        make_file(), find_blob(BLOB_HASH), int(time.time()) - 1
+    )
+    assert verify_file_token(token) is None
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda payload, signature: f'{payload}x.{signature}',
+    lambda payload, signature: f'{payload}.{signature[:-1]}',
+    lambda payload, signature: payload,
+])
+def test_tampered_token_is_rejected(tamper):
+    token = sign_file(
+        make_file(), find_blob(BLOB_HASH), int(time.time()) + 60
+    )
+    payload, _, signature = token.partition('.')
+    assert verify_file_token(tamper(payload, signature)) is None
+
+
+def test_path_outside_storage_is_rejected():
+    token = make_token({
+        'n': 'passwd', 's': 1, 't': 0, 'e': int(time.time()) + 60,
+        'p': '../../etc/passwd',
+    })
+    assert verify_file_token(token) is None
+
+
+def test_incomplete_payload_is_rejected():
+    assert verify_file_token(make_token({'e': int(time.time()) + 60})) is None
+
+
+def test_signed_url_serves_file(client, register, upload, folder, unique):
+    headers = register()
+    db_file = upload(headers, folder, unique('signed.txt'), b'signed content')
+    response = client.post(
+        '/files/signed', headers=headers,
+        json={'file_ids': [db_file['id']], 'expires_in': 60},
+    )
+    assert response.status_code == 200, response.text
+    url = response.json()['urls'][0]['url']
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == b'signed content'
+    response = client.get(url + 'x')
+    assert response.status_code != 200
+
+
+def test_signed_urls_only_for_own_files(
+        client, register, upload, folder, unique
+):
+    db_file = upload(register(), folder, unique('own.txt'), b'own')
+    response = client.post(
+        '/files/signed', headers=register(),
+        json={'file_ids': [db_file['id']]},
+    )
+    assert response.status_code == 404
+
+
+def test_signed_url_decodes_compressed_blob(
+        client, register, upload, folder, unique, monkeypatch
+):
+    monkeypatch.setattr(settings, 'storage_compression', True)
+    content = unique('compressible line\n').encode() * 1000
+    headers = register()
+    db_file = upload(headers, folder, unique('text.txt'), content)
+    response = client.post(
+        '/files/signed', headers=headers,
+        json={'file_ids': [db_file['id']]},
+    )
+    url = response.json()['urls'][0]['url']
+    signed = verify_file_token(url.rsplit('/', 1)[1])
+    assert signed.codec == GZIP
+    response = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.content == content
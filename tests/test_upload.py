@@ -0,0 +1,45 @@
+import hashlib
+import os
+
+from app.core.config import settings
+
+
+def test_upload_streams_file_to_storage(
+        client, register, upload, folder, unique
+):
+    headers = register()
+    content = os.urandom(3 * settings.storage_chunk_size + 17)
+    db_file = upload(headers, folder, unique('large.bin'), content)
+    assert db_file['name'] == unique('large.bin')
+    assert db_file['size'] == len(content)
+    assert db_file['path'].endswith(f'{folder}{unique("large.bin")}')
+    response = client.get(
+        '/files/download', params={'file_id': db_file['id']}
+    )
+    assert response.status_code == 200
+    assert hashlib.sha256(response.content).digest() == (
+        hashlib.sha256(content).digest()
+    )
+
+
+def test_empty_file_is_uploaded(client, register, upload, folder, unique):
+    db_file = upload(register(), folder, unique('empty.txt'), b'')
+    assert db_file['size'] == 0
+
+
+def test_duplicate_name_is_rejected(client, register, upload, folder, unique):
+    headers = register()
+    upload(headers, folder, unique('same.txt'), b'first')
+    response = client.post(
+        '/files/upload', headers=headers, data={'path': folder},
+        files={'file': (unique('same.txt'), b'second')},
+    )
+    assert response.status_code == 400
+
+
+def test_upload_requires_auth(client, folder, unique):
+    response = client.post(
+        '/files/upload', data={'path': folder},
+        files={'file': (unique('anon.txt'), b'anon')},
+    )
+    assert response.status_code == 401
@@ -0,0 +1,125 @@
+import os
+
+from app.core.storage import BLOBS_TMP_DIR
+from app.core.upload_sessions import chunk_location, session_dir
+
+CONTENT = b'0123456789'
+CHUNK_SIZE = 4
+
+
+def create_session(client, headers, folder, filename, size=len(CONTENT)):
+    response = client.post('/files/uploads/', headers=headers, json={
+        'path': folder, 'filename': filename, 'size': size,
+        'chunk_size': CHUNK_SIZE,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def put_chunk(client, headers, session_id, index, body):
+    return client.put(
+        f'/files/uploads/{session_id}/chunks/{index}',
+        headers=headers, data=body,
+    )
+
+
+def received(client, headers, session_id):
+    response = client.get(f'/files/uploads/{session_id}', headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()['received']
+
+
+def test_chunks_are_assembled_in_order(client, register, folder, unique):
+    headers = register()
+    upload_session = create_session(
+        client, headers, folder, unique('chunked.txt')
+    )
+    assert upload_session['chunks_total'] == 3
+    for index in (2, 0, 1):
+        body = CONTENT[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+        response = put_chunk(
+            client, headers, upload_session['id'], index, body
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {'index': index, 'size': len(body)}
+    assert received(client, headers, upload_session['id']) == [0, 1, 2]
+    response = client.post(
+        f'/files/uploads/{upload_session["id"]}/complete', headers=headers
+    )
+    assert response.status_code == 200, response.text
+    db_file = response.json()
+    assert db_file['size'] == len(CONTENT)
+    response = client.get(
+        '/files/download', params={'file_id': db_file['id']}
+    )
+    assert response.content == CONTENT
+    assert not session_dir(upload_session['id']).exists()
+
+
+def test_short_chunk_is_not_received(client, register, folder, unique):
+    headers = register()
+    upload_session = create_session(
+        client, headers, folder, unique('short.txt')
+    )
+    session_id = upload_session['id']
+    response = put_chunk(client, headers, session_id, 0, b'01')
+    assert response.status_code == 400
+    assert received(client, headers, session_id) == []
+    assert os.listdir(session_dir(session_id)) == []
+    response = put_chunk(client, headers, session_id, 0, b'0123')
+    assert response.status_code == 200, response.text
+    assert received(client, headers, session_id) == [0]
+
+
+def test_long_chunk_is_not_received(client, register, folder, unique):
+    headers = register()
+    upload_session = create_session(
+        client, headers, folder, unique('long.txt')
+    )
+    response = put_chunk(
+        client, headers, upload_session['id'], 2, b'89abc'
+    )
+    assert response.status_code == 400
+    assert received(client, headers, upload_session['id']) == []
+
+
+def test_complete_requires_all_chunks(client, register, folder, unique):
+    headers = register()
+    upload_session = create_session(
+        client, headers, folder, unique('partial.txt')
+    )
+    put_chunk(client, headers, upload_session['id'], 0, b'0123')
+    response = client.post(
+        f'/files/uploads/{upload_session["id"]}/complete', headers=headers
+    )
+    assert response.status_code == 409
+
+
+def test_assembled_size_is_checked(client, register, folder, unique):
+    headers = register()
+    upload_session = create_session(
+        client, headers, folder, unique('corrupted.txt')
+    )
+    session_id = upload_session['id']
+    for index in range(3):
+        body = CONTENT[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+        put_chunk(client, headers, session_id, index, body)
+    chunk_location(session_id, 1).write_bytes(b'45')
+    temp_files = set(os.listdir(BLOBS_TMP_DIR))
+    response = client.post(
+        f'/files/uploads/{session_id}/complete', headers=headers
+    )
+    assert response.status_code == 409
+    assert set(os.listdir(BLOBS_TMP_DIR)) == temp_files
+    response = client.get(f'/files/uploads/{session_id}', headers=headers)
+    assert response.status_code == 200
+
+
+def test_foreign_session_is_not_found(client, register, folder, unique):
+    upload_session = create_session(
+        client, register(), folder, unique('foreign.txt')
+    )
+    response = put_chunk(
+        client, register(), upload_session['id'], 0, b'0123'
+    )
+    assert response.status_code == 404
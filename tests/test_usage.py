@@ -0,0 +1,92 @@
+import pytest
+
+from app.api.endpoints import downloaded_file
+from app.core.config import settings
+
+QUOTA = 1000
+
+
+@pytest.fixture
+def quota(monkeypatch):
+    monkeypatch.setattr(settings, 'user_quota', QUOTA)
+    return QUOTA
+
+
+def get_status(client, headers):
+    response = client.get('/user/status', headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_usage_is_counted_per_folder(
+        client, register, upload, folder, unique
+):
+    headers = register()
+    upload(headers, folder, unique('a.txt'), b'a' * 10)
+    upload(headers, f'{folder}sub/', unique('b.txt'), b'b' * 5)
+    status = get_status(client, headers)
+    assert status['info']['used'] == 15
+    assert status['info']['files'] == 2
+    top = folder.rstrip('/')
+    assert status['folders'][top]['used'] == 15
+    assert status['folders'][f'{top}/sub'] == {
+        'allocated': settings.user_quota - 10,
+        'used': 5,
+        'files': 1,
+    }
+
+
+def test_deleted_files_are_uncounted(
+        client, register, upload, folder, unique
+):
+    headers = register()
+    db_file = upload(headers, folder, unique('a.txt'), b'a' * 10)
+    upload(headers, folder, unique('b.txt'), b'b' * 5)
+    client.delete(f'/files/{db_file["id"]}', headers=headers)
+    status = get_status(client, headers)
+    assert status['info']['used'] == 5
+    assert status['info']['files'] == 1
+
+
+def test_upload_over_quota_is_rejected(
+        client, register, upload, folder, unique, quota
+):
+    headers = register()
+    upload(headers, folder, unique('a.txt'), b'a' * 600)
+    response = client.post(
+        '/files/upload', headers=headers, data={'path': folder},
+        files={'file': (unique('b.txt'), b'b' * 600)},
+    )
+    assert response.status_code == 413
+    assert get_status(client, headers)['info']['used'] == 600
+
+
+def test_quota_is_enforced_in_transaction(
+        client, register, upload, folder, unique, quota, monkeypatch
+):
+    async def skip_check(*args, **kwargs):
+        pass
+    monkeypatch.setattr(downloaded_file, 'check_quota', skip_check)
+    headers = register()
+    upload(headers, folder, unique('a.txt'), b'a' * 600)
+    response = client.post(
+        '/files/upload', headers=headers, data={'path': folder},
+        files={'file': (unique('b.txt'), b'b' * 600)},
+    )
+    assert response.status_code == 413
+    status = get_status(client, headers)
+    assert status['info'] == {'allocated': QUOTA, 'used': 600, 'files': 1}
+
+
+def test_upload_sessions_reserve_quota(
+        client, register, folder, unique, quota
+):
+    headers = register()
+    response = client.post('/files/uploads/', headers=headers, json={
+        'path': folder, 'filename': unique('big.bin'), 'size': 800,
+    })
+    assert response.status_code == 200, response.text
+    response = client.post('/files/uploads/', headers=headers, json={
+        'path': folder, 'filename': unique('more.bin'), 'size': 300,
+    })
+    assert response.status_code == 413
@@ -0,0 +1,67 @@
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.core.user import user_cache
+
+
+@pytest.fixture
+def superuser(client):
+    response = client.post('/auth/jwt/login', data={
+        'username': settings.first_superuser_email,
+        'password': settings.first_superuser_password,
+    })
+    assert response.status_code == 200, response.text
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+def get_me(client, headers):
+    return client.get('/users/me', headers=headers)
+
+
+def test_repeated_requests_hit_cache(client, register):
+    headers = register()
+    get_me(client, headers)
+    hits = user_cache.stats()['hits']
+    response = get_me(client, headers)
+    assert response.status_code == 200
+    assert user_cache.stats()['hits'] > hits
+
+
+def test_update_invalidates_cached_user(client, register):
+    headers = register()
+    get_me(client, headers)
+    email = f'renamed-{uuid.uuid4().hex[:12]}@example.com'
+    response = client.patch(
+        '/users/me', headers=headers, json={'email': email}
+    )
+    assert response.status_code == 200, response.text
+    assert get_me(client, headers).json()['email'] == email
+
+
+def test_deactivated_user_is_rejected(client, register, superuser):
+    headers = register()
+    user_id = get_me(client, headers).json()['id']
+    response = client.patch(
+        f'/users/{user_id}', headers=superuser, json={'is_active': False}
+    )
+    assert response.status_code == 200, response.text
+    assert get_me(client, headers).status_code == 401
+
+
+def test_deleted_user_is_rejected(client, register, superuser):
+    headers = register()
+    user_id = get_me(client, headers).json()['id']
+    response = client.delete(f'/user/{user_id}', headers=superuser)
+    assert response.status_code == 200, response.text
+    assert get_me(client, headers).status_code == 401
+
+
+def test_cache_stats_require_superuser(client, register, superuser):
+    assert client.get(
+        '/user/cache/stats', headers=register()
+    ).status_code == 403
+    response = client.get('/user/cache/stats', headers=superuser)
+    assert response.status_code == 200
+    assert 'users' in response.json()